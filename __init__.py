@@ -29,4 +29,11 @@ if HAS_LBW:
     NODE_CLASS_MAPPINGS["FilteredRandomLoRALoaderLBW"] = FilteredRandomLoRALoaderLBW
     NODE_DISPLAY_NAME_MAPPINGS["FilteredRandomLoRALoaderLBW"] = "Filtered Random LoRA Loader (LBW)"
 
+# 起動時のバックグラウンド準備（RANDOM_LORA_WARMUP=1 の場合のみ、起動は待たない）
+try:
+    from .lora_library import start_warmup
+    start_warmup(FilteredRandomLoRALoader()._get_metadata_keywords)
+except Exception as e:
+    print(f"[RandomLoRALoader] Failed to start warm-up: {e}")
+
 __all__ = ['NODE_CLASS_MAPPINGS', 'NODE_DISPLAY_NAME_MAPPINGS']
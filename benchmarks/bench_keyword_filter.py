@@ -0,0 +1,131 @@
+"""
+キーワードフィルタのベンチマーク
+
+従来の線形走査（ファイルごとに全キーワードを検索対象の文字列で部分一致）と、
+lora_library.keyword_index の転置インデックスを比較する。
+
+合成ライブラリの検索対象は「ファイル名 + メタデータのキーワード」を模した
+小文字の文字列で、タグの出現頻度に偏りがある（上位のタグほど多くのLoRAに付く）。
+転置インデックスは初回に索引を作り、2回目以降は内容が同じ文書をそのまま使う
+（ノードと同じく毎回全ファイルの検索対象を渡す）。
+
+計測項目:
+  - 索引の作成時間
+  - クエリごとの初回（キーワードに一致するトークンを語彙から探す）と
+    2回目以降（一致するトークンはキャッシュ済み）のフィルタ時間
+  - 結果が線形走査と一致するか（部分一致・フレーズ・AND / OR）
+
+使い方:
+  python benchmarks/bench_keyword_filter.py                 # 10万件
+  python benchmarks/bench_keyword_filter.py --files 20000 --repeat 5
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lora_library.keyword_index import KeywordIndex  # noqa: E402
+
+
+STYLES = ["anime", "realistic", "pixel", "watercolor", "sketch", "cyberpunk", "fantasy", "chibi"]
+
+QUERIES = [
+    ("ani", "OR"),
+    ("anime style", "OR"),
+    ("anime style", "AND"),
+    ('"anime style" red', "AND"),
+    ('"style tag00001"', "OR"),
+    ("tag00042 tag00007", "AND"),
+    ("tag0004 pixel", "OR"),
+    ("v2 realistic tag00003", "AND"),
+    ("キャラ", "OR"),
+    ("ャラ", "OR"),
+    ("_lora_0001", "OR"),
+    ("ag0000", "AND"),
+    ("nomatch_keyword", "OR"),
+]
+
+
+def build_library(num_files, vocabulary_size, seed=0):
+    """合成ライブラリ（パスと検索対象の文字列）を作成"""
+    rng = random.Random(seed)
+    vocabulary = [f"tag{i:05d}" for i in range(vocabulary_size)]
+    cum_weights = list(itertools.accumulate(1.0 / (i + 1) for i in range(vocabulary_size)))
+    paths = []
+    texts = []
+    for i in range(num_files):
+        style = rng.choice(STYLES)
+        name = f"{style}_lora_{i:06d}_v{rng.randint(1, 3)}"
+        if i % 50 == 0:
+            name = f"キャラ_{name}"
+        tags = rng.choices(vocabulary, cum_weights=cum_weights, k=12)
+        words = ["red", "blue", "style", "character", "1girl"]
+        keywords = " ".join(dict.fromkeys([f"{style} style", *rng.sample(words, 2), *tags]))
+        paths.append(f"/loras/folder_{i // 100:04d}/{name}.safetensors")
+        texts.append(f"{name.lower()} {keywords}")
+    return paths, texts
+
+
+def parse_keywords(keyword_filter):
+    """_parse_keywords と同じ分割"""
+    import re
+    matches = re.findall(r'"([^"]+)"|(\S+)', keyword_filter)
+    return [kw.lower() for kw in (m[0] if m[0] else m[1] for m in matches) if kw]
+
+
+def filter_linear(paths, texts, keywords, filter_mode):
+    """従来の線形走査"""
+    match = all if filter_mode == "AND" else any
+    return [path for path, text in zip(paths, texts) if match(kw in text for kw in keywords)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100000, help="number of LoRA files")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="number of distinct tags")
+    parser.add_argument("--repeat", type=int, default=3, help="filter runs per query")
+    args = parser.parse_args()
+
+    paths, texts = build_library(args.files, args.vocabulary)
+    print(f"{args.files} LoRAs, {args.vocabulary} distinct tags")
+
+    index = KeywordIndex()
+    start = time.perf_counter()
+    index.filter(paths, texts, ["nomatch_keyword"])
+    print(f"  initial index build: {time.perf_counter() - start:.2f}s")
+
+    mismatches = 0
+    for query, filter_mode in QUERIES:
+        keywords = parse_keywords(query)
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            expected = filter_linear(paths, texts, keywords, filter_mode)
+        linear_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        result = index.filter(paths, texts, keywords, filter_mode)
+        first_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = index.filter(paths, texts, keywords, filter_mode)
+        index_time = (time.perf_counter() - start) / args.repeat
+
+        status = "ok" if result == expected else "MISMATCH"
+        mismatches += result != expected
+        print(f"  {filter_mode:<3} {query:<26} linear {linear_time * 1000:7.1f} ms  "
+              f"index first {first_time * 1000:7.1f} ms / repeat {index_time * 1000:7.1f} ms  "
+              f"{len(result):6d} matches  {status}")
+
+    if not mismatches:
+        print("  results identical for all queries")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+メタデータキャッシュのメモリ使用量のベンチマーク
+
+従来のキャッシュ（LoRAごとに (署名, キーワード文字列) のタプルと、
+JSONから取り出した文字列の辞書）と、lora_library.compact の表現
+（トークンID列 + intern した文字列 + __slots__ のレコード）を比較する。
+
+合成ライブラリのメタデータは Civitai 形式を模し、タグ・トリガーワード・
+ネガティブプロンプトがLoRA間で繰り返し現れる（実際のライブラリと同様）。
+各ファイルのメタデータは JSON 文字列から解析し直すため、従来実装では
+実際と同じくファイルごとに別の文字列オブジェクトになる。
+
+計測項目:
+  - キャッシュ構築後のメモリ（tracemalloc、トークン表を含む）
+  - 構築時間と gc.collect() の時間
+  - 全件のキーワードを取り出して部分一致検索する時間（ID列からの復元を含む。
+    ノードではこれに加えてファイルごとに署名の stat が入る）
+
+使い方:
+  python benchmarks/bench_metadata_memory.py                  # 10万件
+  python benchmarks/bench_metadata_memory.py --files 20000 --vocabulary 5000
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lora_library.compact import KeywordEntry, get_token_table  # noqa: E402
+from lora_library.records import build_metadata_record  # noqa: E402
+
+
+NEGATIVE_PROMPTS = [
+    "lowres, bad anatomy, bad hands, text, error, missing fingers, worst quality, low quality",
+    "(worst quality:1.4), (low quality:1.4), monochrome, blurry, watermark",
+    "easynegative, badhandv4, nsfw",
+]
+
+
+def build_metadata_json(num_files, vocabulary_size, seed=0):
+    """合成メタデータ（JSON文字列のリスト）を作成"""
+    rng = random.Random(seed)
+    vocabulary = [f"tag{i:05d}" for i in range(vocabulary_size)]
+    # タグの出現頻度に偏りを持たせる（上位のタグほど多くのLoRAに付く）
+    weights = [1.0 / (i + 1) for i in range(vocabulary_size)]
+    documents = []
+    for i in range(num_files):
+        tags = list(dict.fromkeys(rng.choices(vocabulary, weights, k=8)))
+        trained = [", ".join(rng.choices(vocabulary, weights, k=5)) for _ in range(rng.randint(1, 3))]
+        images = [
+            {
+                "url": f"https://example.com/{i}/{j}.jpeg",
+                "meta": {
+                    "prompt": ", ".join(rng.choices(vocabulary, weights, k=20)),
+                    "negativePrompt": rng.choice(NEGATIVE_PROMPTS),
+                    "seed": rng.randint(0, 2 ** 31),
+                },
+            }
+            for j in range(rng.randint(0, 4))
+        ]
+        metadata = {
+            "model_name": f"Model {i:06d}",
+            "civitai": {
+                "name": f"v{rng.randint(1, 5)}.0",
+                "trainedWords": trained,
+                "model": {"name": f"Model {i:06d}", "tags": tags},
+                "images": images,
+            },
+            "tags": tags,
+        }
+        documents.append((f"/loras/folder_{i // 100:04d}/lora_{i:06d}.safetensors", json.dumps(metadata)))
+    return documents
+
+
+def extract_legacy(metadata):
+    """従来の抽出（ノードの _get_metadata_keywords と同じ手順、文字列はJSONのまま）"""
+    civitai = metadata.get("civitai", {})
+    model_info = civitai.get("model", {})
+    trained_words = civitai.get("trainedWords", [])
+    all_words = []
+    for pattern in trained_words:
+        all_words.extend(w.strip() for w in pattern.split(','))
+    trained_word_list = list(dict.fromkeys(all_words))
+
+    keywords_parts = [v for v in (metadata.get("model_name", ""), civitai.get("name", "")) if v]
+    keywords_parts.extend(trained_word_list)
+    if model_info.get("name", ""):
+        keywords_parts.append(model_info["name"])
+    keywords_parts.extend(model_info.get("tags", []))
+    keywords_parts.extend(metadata.get("tags", []))
+
+    return {
+        "keywords": " ".join(dict.fromkeys(keywords_parts)).lower(),
+        "trained_word_list": trained_word_list,
+        "trained_words": trained_words,
+        "sample_prompts": [
+            (image["meta"].get("prompt", ""), image["meta"].get("negativePrompt", ""))
+            for image in civitai.get("images", []) if image.get("meta")
+        ],
+    }
+
+
+def build_legacy(documents):
+    """従来のキャッシュ（文字列の辞書）"""
+    keyword_cache = {}
+    record_cache = {}
+    for path, document in documents:
+        record = extract_legacy(json.loads(document))
+        signature = f"{len(document)}:{hash(path) & 0xFFFFFFFF}/-/-"
+        keyword_cache[path] = (signature, record["keywords"])
+        record_cache[path] = (signature, record)
+    return keyword_cache, record_cache
+
+
+def build_compact(documents):
+    """lora_library.compact のキャッシュ"""
+    keyword_cache = {}
+    record_cache = {}
+    for path, document in documents:
+        record = build_metadata_record(json.loads(document))
+        signature = f"{len(document)}:{hash(path) & 0xFFFFFFFF}/-/-"
+        keyword_cache[path] = KeywordEntry(signature, record.keywords)
+        record_cache[path] = (signature, record)
+    return keyword_cache, record_cache
+
+
+def measure(label, build, documents, get_keywords, keyword):
+    """構築後のメモリ・時間を計測して表示（計測後にキャッシュは破棄）"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    caches = build(documents)
+    build_time = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    gc.collect()
+    gc_time = time.perf_counter() - start
+
+    keyword_cache = caches[0]
+    start = time.perf_counter()
+    matches = sum(1 for value in keyword_cache.values() if keyword in get_keywords(value))
+    filter_time = time.perf_counter() - start
+
+    print(f"  {label:<28} {current / 1048576:8.1f} MB  build {build_time:6.2f}s  "
+          f"gc {gc_time * 1000:7.1f} ms  filter {filter_time * 1000:7.1f} ms  ({matches} matches)")
+
+
+def verify(documents):
+    """復元した内容が従来と一致するか確認"""
+    legacy = build_legacy(documents)
+    compact = build_compact(documents)
+    for path, (signature, keywords) in legacy[0].items():
+        entry = compact[0][path]
+        record = compact[1][path][1]
+        legacy_record = legacy[1][path][1]
+        if (entry.signature != signature or entry.keywords != keywords
+                or record.keywords != keywords
+                or list(record.trained_word_list) != legacy_record["trained_word_list"]
+                or list(record.trained_words) != legacy_record["trained_words"]
+                or list(record.sample_prompts) != legacy_record["sample_prompts"]):
+            print(f"  !! result mismatch: {path}")
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100000, help="number of LoRA files")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="number of distinct tags")
+    parser.add_argument("--verify", type=int, default=5000, help="number of files to compare")
+    args = parser.parse_args()
+
+    documents = build_metadata_json(args.files, args.vocabulary)
+    keyword = "tag00042"
+    print(f"{args.files} LoRAs, {args.vocabulary} distinct tags")
+
+    measure("dict of strings (legacy)", build_legacy, documents, lambda v: v[1], keyword)
+    measure("token ids + slots", build_compact, documents, lambda v: v.keywords, keyword)
+    print(f"  token table: {len(get_token_table())} tokens")
+
+    if verify(documents[:args.verify]):
+        print(f"  results identical ({min(args.verify, len(documents))} files compared)")
+
+
+if __name__ == "__main__":
+    main()
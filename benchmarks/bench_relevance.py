@@ -0,0 +1,128 @@
+"""
+関連度ランキング（RELEVANCE モード）のベンチマーク
+
+lora_library.relevance の BM25 ランキングを合成ライブラリで計測する。
+ライブラリは bench_keyword_filter.py と同じ（タグの出現頻度に偏りがある
+「ファイル名 + メタデータのキーワード」の文字列）。ノードと同じく毎回
+全ファイルの検索対象を渡す。
+
+計測項目:
+  - 索引（語の分割）と疎行列の作成時間
+  - クエリごとのランキング時間（上位 --top-k 件 / 全件の並べ替え）
+  - 順位が純 Python の BM25（同じ式）と一致するか
+
+使い方:
+  python benchmarks/bench_relevance.py                 # 10万件
+  python benchmarks/bench_relevance.py --files 20000 --repeat 5
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_keyword_filter import build_library  # noqa: E402
+from lora_library.relevance import (  # noqa: E402
+    BM25_B, BM25_K1, RelevanceIndex, is_relevance_available, query_terms, tokenize,
+)
+
+
+QUERIES = [
+    "anime",
+    "anime style",
+    "realistic red character",
+    "tag00042 tag00007",
+    "pixel tag00003 1girl",
+    "キャラ anime",
+    "tag:watercolor NOT sketch",
+    "nomatch_keyword",
+]
+
+
+def rank_python(paths, texts, keyword_filter, top_k):
+    """純 Python の BM25（確認用）"""
+    docs = [Counter(tokenize(text)) for text in texts]
+    lengths = [sum(doc.values()) for doc in docs]
+    avg_length = max(sum(lengths) / max(len(docs), 1), 1.0)
+    df = Counter(term for doc in docs for term in doc)
+    scores = []
+    for doc, length in zip(docs, lengths):
+        score = 0.0
+        for term, count in query_terms(keyword_filter).items():
+            tf = doc.get(term)
+            if tf:
+                idf = math.log1p((len(docs) - df[term] + 0.5) / (df[term] + 0.5))
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * length / avg_length)
+                score += count * idf * tf * (BM25_K1 + 1.0) / (tf + norm)
+        scores.append(score)
+    order = sorted((i for i, score in enumerate(scores) if score > 0), key=lambda i: (-scores[i], i))
+    return [(paths[i], scores[i]) for i in order[:top_k]]
+
+
+def same_ranking(result, expected):
+    """順位が同じか（スコアは float32 の誤差を許す）"""
+    return len(result) == len(expected) and all(
+        a[0] == b[0] and math.isclose(a[1], b[1], rel_tol=1e-4) for a, b in zip(result, expected)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=100000, help="number of LoRA files")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="number of distinct tags")
+    parser.add_argument("--top-k", type=int, default=20, help="number of ranked LoRAs to keep")
+    parser.add_argument("--repeat", type=int, default=5, help="ranking runs per query")
+    parser.add_argument("--verify-files", type=int, default=20000,
+                        help="library size for the pure Python comparison (0 = skip)")
+    args = parser.parse_args()
+
+    if not is_relevance_available():
+        print("NumPy is not installed; RELEVANCE mode is unavailable")
+        return
+
+    paths, texts = build_library(args.files, args.vocabulary)
+    print(f"{args.files} LoRAs, {args.vocabulary} distinct tags")
+
+    index = RelevanceIndex()
+    start = time.perf_counter()
+    index.rank(paths, texts, "nomatch_keyword")
+    print(f"  initial index build: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    index.rank(paths, texts, "anime")
+    print(f"  sparse matrix build: {time.perf_counter() - start:.2f}s")
+
+    for query in QUERIES:
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            result = index.rank(paths, texts, query, args.top_k)
+        top_time = (time.perf_counter() - start) / args.repeat
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            ranked = index.rank(paths, texts, query)
+        full_time = (time.perf_counter() - start) / args.repeat
+
+        best = f"{os.path.basename(result[0][0])} ({result[0][1]:.2f})" if result else "-"
+        print(f"  {query:<28} top-{args.top_k} {top_time * 1000:6.1f} ms  "
+              f"all {full_time * 1000:6.1f} ms  {len(ranked):6d} matches  best {best}")
+
+    if args.verify_files:
+        paths, texts = build_library(min(args.verify_files, args.files), args.vocabulary)
+        index = RelevanceIndex()
+        mismatches = [
+            query for query in QUERIES
+            if not same_ranking(index.rank(paths, texts, query, args.top_k),
+                                rank_python(paths, texts, query, args.top_k))
+        ]
+        if mismatches:
+            print(f"  MISMATCH with pure Python BM25 ({len(paths)} LoRAs): {mismatches}")
+        else:
+            print(f"  rankings identical to pure Python BM25 ({len(paths)} LoRAs)")
+
+
+if __name__ == "__main__":
+    main()
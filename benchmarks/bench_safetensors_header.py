@@ -0,0 +1,245 @@
+"""
+埋め込みメタデータ読み込みのベンチマーク
+
+従来実装（safetensors.torch.safe_open + 毎回 ss_tag_frequency を json.loads）と、
+ヘッダーのみを読むリーダー（lora_library.safetensors_header）を比較する。
+両ノードの変換結果（RandomLoRALoader: 先頭タグ / Filtered: 頻度順上位タグ）が
+従来実装と一致することも確認する。
+
+使い方:
+  python benchmarks/bench_safetensors_header.py                       # 合成ライブラリで計測
+  python benchmarks/bench_safetensors_header.py --path /mnt/nas/loras # 既存フォルダで計測
+  python benchmarks/bench_safetensors_header.py --tags 5000           # タグの多いLoRAを模擬
+
+safetensors / torch がない環境では、従来実装の代わりに同じ変換処理を
+キャッシュなしのヘッダーリーダー上で実行する（変換の一致確認は行う）。
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import struct
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lora_library.safetensors_header import (  # noqa: E402
+    get_header_cache,
+    read_embedded_metadata,
+    read_safetensors_metadata,
+)
+from lora_library.scanner import walk_lora_files  # noqa: E402
+
+try:
+    from safetensors.torch import safe_open
+except ImportError:
+    safe_open = None
+
+
+def write_safetensors(path, metadata, tensor_bytes):
+    """最小限の safetensors ファイルを作成（F16 テンソル1つ）"""
+    elements = tensor_bytes // 2
+    header = {
+        "__metadata__": metadata,
+        "lora_up.weight": {"dtype": "F16", "shape": [elements], "data_offsets": [0, elements * 2]},
+    }
+    raw = json.dumps(header).encode("utf-8")
+    raw += b" " * (-len(raw) % 8)
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(raw)))
+        f.write(raw)
+        f.write(b"\0" * (elements * 2))
+
+
+def build_library(base_dir, num_files, num_tags, tensor_bytes, seed=0):
+    """合成ライブラリを作成（kohya_ss 形式のメタデータ付き）"""
+    rng = random.Random(seed)
+    vocabulary = [f"tag_{i:05d}" for i in range(max(num_tags * 4, 100))]
+    for i in range(num_files):
+        dir_path = os.path.join(base_dir, f"folder_{i // 50:03d}")
+        os.makedirs(dir_path, exist_ok=True)
+        metadata = {"ss_output_name": f"lora_{i:05d}", "ss_network_dim": "32"}
+        if i % 10 != 0:
+            datasets = {}
+            for d in range(rng.randint(1, 3)):
+                tags = rng.sample(vocabulary, num_tags)
+                datasets[f"{d + 1}_dataset"] = {tag: rng.randint(1, 50) for tag in tags}
+            metadata["ss_tag_frequency"] = json.dumps(datasets)
+        if i % 7 == 0:
+            metadata["modelspec.trigger_word"] = f"trigger_{i}"
+        write_safetensors(os.path.join(dir_path, f"lora_{i:05d}.safetensors"), metadata, tensor_bytes)
+
+
+def read_metadata_legacy(path):
+    """従来の読み込み（safe_open、ない場合はキャッシュなしのヘッダー読み込み）"""
+    if safe_open is not None:
+        with safe_open(path, framework="pt") as f:
+            return f.metadata()
+    return read_safetensors_metadata(path)
+
+
+def convert_random_legacy(metadata):
+    """RandomLoRALoader の従来の変換"""
+    if not metadata:
+        return None
+    if "ss_tag_frequency" in metadata:
+        try:
+            tag_freq = json.loads(metadata.get("ss_tag_frequency", "{}"))
+            if tag_freq:
+                all_tags = []
+                for dataset_tags in tag_freq.values():
+                    all_tags.extend(dataset_tags.keys())
+                unique_tags = list(dict.fromkeys(all_tags))
+                return {"civitai": {"trainedWords": [", ".join(unique_tags[:20])]}}
+        except json.JSONDecodeError:
+            pass
+    for key in ("modelspec.trigger_word", "ss_output_name"):
+        if key in metadata:
+            return {"civitai": {"trainedWords": [metadata[key]]}}
+    return None
+
+
+def convert_random(metadata):
+    """RandomLoRALoader の変換（ヘッダーリーダー版）"""
+    if not metadata:
+        return None
+    if "ss_tag_frequency" in metadata:
+        tag_summary = metadata["ss_tag_frequency"]
+        try:
+            if tag_summary.truthy:
+                all_tags = []
+                for dataset_tags in tag_summary.dataset_first_tags():
+                    all_tags.extend(dataset_tags)
+                unique_tags = list(dict.fromkeys(all_tags))
+                return {"civitai": {"trainedWords": [", ".join(unique_tags[:20])]}}
+        except json.JSONDecodeError:
+            pass
+    for key in ("modelspec.trigger_word", "ss_output_name"):
+        if key in metadata:
+            return {"civitai": {"trainedWords": [metadata[key]]}}
+    return None
+
+
+def convert_filtered_legacy(metadata):
+    """FilteredRandomLoRALoader の従来の変換"""
+    if not metadata:
+        return None
+    civitai_format = {"civitai": {}}
+    if "ss_tag_frequency" in metadata:
+        try:
+            tag_freq = json.loads(metadata.get("ss_tag_frequency", "{}"))
+            all_tags = []
+            for dataset_name, tags_dict in tag_freq.items():
+                sorted_tags = sorted(tags_dict.items(), key=lambda x: x[1], reverse=True)
+                all_tags.extend(tag for tag, freq in sorted_tags[:20])
+            if all_tags:
+                civitai_format["civitai"]["trainedWords"] = [", ".join(dict.fromkeys(all_tags))]
+        except Exception:
+            pass
+    return _convert_filtered_rest(metadata, civitai_format)
+
+
+def convert_filtered(metadata):
+    """FilteredRandomLoRALoader の変換（ヘッダーリーダー版）"""
+    if not metadata:
+        return None
+    civitai_format = {"civitai": {}}
+    if "ss_tag_frequency" in metadata:
+        try:
+            all_tags = []
+            for top_tags in metadata["ss_tag_frequency"].dataset_top_tags():
+                all_tags.extend(top_tags)
+            if all_tags:
+                civitai_format["civitai"]["trainedWords"] = [", ".join(dict.fromkeys(all_tags))]
+        except Exception:
+            pass
+    return _convert_filtered_rest(metadata, civitai_format)
+
+
+def _convert_filtered_rest(metadata, civitai_format):
+    trigger_word = metadata.get("modelspec.trigger_word", "")
+    if trigger_word and "trainedWords" not in civitai_format["civitai"]:
+        civitai_format["civitai"]["trainedWords"] = [trigger_word]
+    model_name = metadata.get("ss_output_name", "")
+    if model_name:
+        civitai_format["model_name"] = model_name
+    return civitai_format if civitai_format["civitai"] else None
+
+
+def run_legacy(paths):
+    results = []
+    for path in paths:
+        try:
+            metadata = read_metadata_legacy(path)
+            results.append((convert_random_legacy(metadata), convert_filtered_legacy(metadata)))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def run_header(paths):
+    results = []
+    for path in paths:
+        try:
+            metadata = read_embedded_metadata(path)
+            results.append((convert_random(metadata), convert_filtered(metadata)))
+        except Exception:
+            results.append(None)
+    return results
+
+
+def measure(label, func, repeat, before=None):
+    best = None
+    result = None
+    for _ in range(repeat):
+        if before:
+            before()
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<36} {best * 1000:9.1f} ms  ({len(result)} files)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", help="existing LoRA folder (default: synthetic library)")
+    parser.add_argument("--files", type=int, default=2000, help="synthetic: number of LoRA files")
+    parser.add_argument("--tags", type=int, default=500, help="synthetic: tags per dataset")
+    parser.add_argument("--tensor-kb", type=int, default=64, help="synthetic: tensor data size per file")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    temp_dir = None
+    folder_path = args.path
+    if not folder_path:
+        temp_dir = tempfile.mkdtemp(prefix="lora_header_bench_")
+        build_library(temp_dir, args.files, args.tags, args.tensor_kb * 1024)
+        folder_path = temp_dir
+
+    try:
+        paths = [p for p in walk_lora_files(folder_path, True) if p.lower().endswith(".safetensors")]
+        legacy_label = "safe_open + json.loads" if safe_open else "header (no cache) + json.loads"
+        print(f"Reading metadata of {len(paths)} files in {folder_path} (best of {args.repeat})")
+
+        legacy = measure(legacy_label, lambda: run_legacy(paths), args.repeat)
+        header = measure("header reader (cold cache)", lambda: run_header(paths), args.repeat,
+                         before=get_header_cache().clear)
+        cached = measure("header reader (warm cache)", lambda: run_header(paths), args.repeat)
+
+        if legacy != header or legacy != cached:
+            mismatches = sum(1 for a, b in zip(legacy, header) if a != b)
+            print(f"  !! result mismatch with legacy conversion ({mismatches} files)")
+        print(f"  {get_header_cache().format_stats()}")
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
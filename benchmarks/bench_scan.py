@@ -0,0 +1,118 @@
+"""
+フォルダ走査のベンチマーク
+
+従来の2実装（os.walk / glob.glob）と、os.scandir ベースの並列走査
+（lora_library.scanner.walk_lora_files）を比較する。
+
+使い方:
+  python benchmarks/bench_scan.py                       # 合成ライブラリで計測
+  python benchmarks/bench_scan.py --path /mnt/nas/loras # 既存フォルダで計測
+  python benchmarks/bench_scan.py --latency-ms 2        # ネットワークマウントを模擬
+
+--latency-ms は os.scandir 呼び出しごとに遅延を入れる（os.walk / glob も
+内部で os.scandir を使うため、3実装に同じ条件で効く）。
+"""
+
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lora_library.scanner import walk_lora_files  # noqa: E402
+
+
+def find_with_os_walk(folder_path):
+    """従来実装（FilteredRandomLoRALoader）"""
+    lora_files = []
+    extensions = ['.safetensors', '.pt', '.ckpt']
+    for root, dirs, files in os.walk(folder_path):
+        for file in files:
+            if any(file.lower().endswith(ext) for ext in extensions):
+                lora_files.append(os.path.join(root, file))
+    return lora_files
+
+
+def find_with_glob(folder_path):
+    """従来実装（RandomLoRALoader）"""
+    return glob.glob(os.path.join(folder_path, "**/*.safetensors"), recursive=True)
+
+
+def build_library(base_dir, num_dirs, files_per_dir):
+    """合成ライブラリを作成（2階層、サイドカー・プレビュー付き）"""
+    for d in range(num_dirs):
+        dir_path = os.path.join(base_dir, f"group_{d // 10:03d}", f"folder_{d:04d}")
+        os.makedirs(dir_path, exist_ok=True)
+        for f in range(files_per_dir):
+            name = f"lora_{d:04d}_{f:03d}"
+            for suffix in (".safetensors", ".metadata.json", ".png"):
+                with open(os.path.join(dir_path, name + suffix), "wb") as fp:
+                    fp.write(b"x")
+
+
+def install_latency(latency_ms):
+    """os.scandir に遅延を入れる"""
+    original_scandir = os.scandir
+
+    def slow_scandir(*args, **kwargs):
+        time.sleep(latency_ms / 1000.0)
+        return original_scandir(*args, **kwargs)
+
+    os.scandir = slow_scandir
+
+
+def measure(label, func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f"  {label:<32} {best * 1000:9.1f} ms  ({len(result)} files)")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--path", help="existing LoRA folder (default: synthetic library)")
+    parser.add_argument("--dirs", type=int, default=400, help="synthetic: number of folders")
+    parser.add_argument("--files", type=int, default=25, help="synthetic: LoRA files per folder")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="simulated latency per directory listing")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    temp_dir = None
+    folder_path = args.path
+    if not folder_path:
+        temp_dir = tempfile.mkdtemp(prefix="lora_bench_")
+        build_library(temp_dir, args.dirs, args.files)
+        folder_path = temp_dir
+
+    if args.latency_ms > 0:
+        install_latency(args.latency_ms)
+
+    try:
+        print(f"Scanning {folder_path} (latency {args.latency_ms} ms/dir, best of {args.repeat})")
+        walk_result = measure("os.walk (current filtered)", lambda: find_with_os_walk(folder_path), args.repeat)
+        measure("glob ** (current random)", lambda: find_with_glob(folder_path), args.repeat)
+        for workers in args.workers:
+            result = measure(
+                f"scandir walker, {workers} worker(s)",
+                lambda: walk_lora_files(folder_path, True, max_workers=workers),
+                args.repeat
+            )
+            if sorted(walk_result) != result:
+                print("  !! result mismatch with os.walk")
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
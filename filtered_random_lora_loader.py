@@ -8,25 +8,67 @@ License: MIT
 
 機能:
 - 1つのフォルダから複数のLoRAをランダム選択
-- キーワードフィルタで絞り込み（AND/OR）
+- キーワードフィルタで絞り込み（AND/OR）、関連度順の選択（RELEVANCE）
 - メタデータ検索（ファイル名 or メタデータ内）
 - キャッシュ機能で高速化
+- .loraignore / exclude_patterns で不要なフォルダを走査対象から除外
 - 直列接続推奨
 """
 
 import os
 import random
 import re
-import json
 import folder_paths
 import comfy.sd
 
+from .lora_library import (
+    get_library_index,
+    get_metadata_cache,
+    DEDUPE_MODES,
+    reservoir_sample,
+    weighted_sample,
+    PREVIEW_STATIC_EXTENSIONS,
+    PREVIEW_ANIMATED_EXTENSIONS,
+    PREVIEW_VIDEO_EXTENSIONS,
+    read_embedded_metadata,
+    map_ordered,
+    get_metadata_timeout,
+    TIMED_OUT,
+    get_metadata_record,
+    load_json_sidecar,
+    get_quarantine,
+    QuarantinedFileError,
+    filename_search_text,
+    get_keyword_index,
+    ANY_FIELD,
+    QuerySyntaxError,
+    compile_query,
+    field_sources,
+    query_uses_metadata,
+    get_filter_cache,
+    normalize_folder_path,
+    get_manifest_embedded,
+    get_manifest_metadata,
+    get_preview_candidates,
+    FILENAME_NAMESPACE,
+    KeywordEntry,
+    RELEVANCE_MODE,
+    get_relevance_index,
+    is_relevance_available,
+    query_terms,
+)
+
+
+# ディスク上のキーワードキャッシュの種類（両フィルタノードで抽出方法が同じため共有）
+METADATA_CACHE_NAMESPACE = "filtered_keywords"
+
 
 class FilteredRandomLoRALoader:
     """キーワードフィルタ付きランダムLoRA選択・適用ノード（1グループ）"""
     
-    # クラス変数（全インスタンスで共有するメタデータキャッシュ）
-    _metadata_cache = {}
+    # クラス変数（全ノード共通のメタデータキャッシュ、上限付きLRU）
+    # {LoRAパス: KeywordEntry(署名, キーワードのトークンID列)}、ディスク上のキャッシュはライブラリインデックスに保存
+    _metadata_cache = get_metadata_cache()
     _opencv_warning_shown = False  # opencv警告表示フラグ
     
     @classmethod
@@ -77,9 +119,9 @@ class FilteredRandomLoRALoader:
                 "keyword_filter": ("STRING", {
                     "default": "",
                     "multiline": False,
-                    "placeholder": "Keywords (space-separated, e.g., 'style anime' or \"anime style\" red)"
+                    "placeholder": "Keywords (e.g., 'style anime', \"anime style\" red, tag:anime NOT (realistic OR folder:old))"
                 }),
-                "filter_mode": (["AND", "OR"], {
+                "filter_mode": (["AND", "OR", RELEVANCE_MODE], {
                     "default": "AND"
                 }),
                 "search_in_metadata": ("BOOLEAN", {
@@ -117,6 +159,29 @@ class FilteredRandomLoRALoader:
                     "min": 0,
                     "max": 0xffffffffffffffff
                 }),
+            },
+            "optional": {
+                # 除外設定
+                "exclude_patterns": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "Exclude folders/files (comma-separated globs, e.g., _archive, backup, *_old)"
+                }),
+                "dedupe_mode": (list(DEDUPE_MODES), {
+                    "default": "filename"
+                }),
+                
+                # RELEVANCE モード設定
+                "relevance_top_k": ("INT", {
+                    "default": 20,
+                    "min": 1,
+                    "max": 10000,
+                    "step": 1
+                }),
+                "relevance_weighting": ("BOOLEAN", {
+                    "default": False,
+                    "label": "Weight selection by relevance score"
+                }),
             }
         }
     
@@ -130,12 +195,18 @@ class FilteredRandomLoRALoader:
                    lora_folder_path, include_subfolders, unique_by_filename,
                    keyword_filter, filter_mode, search_in_metadata,
                    model_strength, clip_strength, num_loras,
-                   trigger_word_source, seed):
+                   trigger_word_source, seed, exclude_patterns="", dedupe_mode="filename",
+                   relevance_top_k=20, relevance_weighting=False):
         """メイン処理"""
         
         # seedの設定
         random.seed(seed)
         
+        # RELEVANCE モードは NumPy が必要（ない場合は OR で絞り込む）
+        if filter_mode == RELEVANCE_MODE and not is_relevance_available():
+            print("[FilteredRandomLoRALoader] Warning: NumPy is not installed, using OR instead of RELEVANCE")
+            filter_mode = "OR"
+        
         # 初期値
         final_positive = additional_prompt_positive.strip()
         final_negative = additional_prompt_negative.strip()
@@ -154,54 +225,88 @@ class FilteredRandomLoRALoader:
             return self._generate_outputs(model, clip, final_positive, final_negative,
                                          token_normalization, weight_interpretation, empty_preview)
         
-        # LoRAファイル一覧を取得
-        lora_files = self._find_lora_files(lora_folder_path, include_subfolders)
-        
-        if not lora_files:
-            print(f"[FilteredRandomLoRALoader] Warning: No LoRA files found in {lora_folder_path}")
-            empty_preview = self._generate_preview_batch([])
-            return self._generate_outputs(model, clip, final_positive, final_negative,
-                                         token_normalization, weight_interpretation, empty_preview)
-        
-        # キーワードフィルタリング
-        filtered_files = self._filter_lora_files(
-            lora_files, keyword_filter, filter_mode, search_in_metadata
-        )
-        
-        if not filtered_files:
-            print(f"[FilteredRandomLoRALoader] Warning: No LoRAs found matching filter '{keyword_filter}'")
-            empty_preview = self._generate_preview_batch([])
-            return self._generate_outputs(model, clip, final_positive, final_negative,
-                                         token_normalization, weight_interpretation, empty_preview)
-        
-        # ファイル名でユニーク化（重複ファイル名を除外）
-        if unique_by_filename:
-            filtered_files = self._unique_by_filename(filtered_files)
-            if not filtered_files:
-                print(f"[FilteredRandomLoRALoader] Warning: No LoRAs after deduplication")
+        if not keyword_filter.strip() and not unique_by_filename:
+            # フィルタ・ユニーク化なし: 一覧を作らずにストリーミングで選択
+            selected_loras = self._select_lora_files_streaming(
+                lora_folder_path, include_subfolders, exclude_patterns, num_loras
+            )
+            
+            if not selected_loras:
+                print(f"[FilteredRandomLoRALoader] Warning: No LoRA files found in {lora_folder_path}")
                 empty_preview = self._generate_preview_batch([])
                 return self._generate_outputs(model, clip, final_positive, final_negative,
                                              token_normalization, weight_interpretation, empty_preview)
-        
-        # ランダム選択（重複なし、不足時は重複で埋める）
-        available_count = len(filtered_files)
-        
-        if num_loras <= available_count:
-            # 十分な数がある場合は重複なしで選択
-            selected_loras = random.sample(filtered_files, num_loras)
         else:
-            # 不足する場合は全て選択後、再選択で埋める
-            selected_loras = filtered_files.copy()
-            remaining = num_loras - available_count
+            relevance_scores = None
+            if filter_mode == RELEVANCE_MODE and keyword_filter.strip():
+                # LoRAファイル一覧の取得と関連度による順位付け（重複除外で減る分があるため全件を並べる）
+                lora_files, filtered_files, relevance_scores = self._rank_lora_files(
+                    lora_folder_path, include_subfolders, exclude_patterns,
+                    keyword_filter, search_in_metadata,
+                    None if unique_by_filename else relevance_top_k
+                )
+            else:
+                # LoRAファイル一覧の取得とキーワードフィルタリング（一覧が変わっていなければ前回の結果）
+                lora_files, filtered_files = self._find_filtered_lora_files(
+                    lora_folder_path, include_subfolders, exclude_patterns,
+                    keyword_filter, filter_mode, search_in_metadata
+                )
             
-            print(f"[FilteredRandomLoRALoader] Warning: Requested {num_loras} LoRAs but only {available_count} available. Adding {remaining} duplicates.")
+            if not lora_files:
+                print(f"[FilteredRandomLoRALoader] Warning: No LoRA files found in {lora_folder_path}")
+                empty_preview = self._generate_preview_batch([])
+                return self._generate_outputs(model, clip, final_positive, final_negative,
+                                             token_normalization, weight_interpretation, empty_preview)
             
-            # 不足分をランダムに追加（重複あり）
-            for _ in range(remaining):
-                selected_loras.append(random.choice(filtered_files))
+            if not filtered_files:
+                print(f"[FilteredRandomLoRALoader] Warning: No LoRAs found matching filter '{keyword_filter}'")
+                empty_preview = self._generate_preview_batch([])
+                return self._generate_outputs(model, clip, final_positive, final_negative,
+                                             token_normalization, weight_interpretation, empty_preview)
             
-            # 最終的にシャッフル
-            random.shuffle(selected_loras)
+            # ファイル名でユニーク化（重複ファイル名を除外）
+            if unique_by_filename:
+                filtered_files = self._unique_by_filename(filtered_files, dedupe_mode)
+                if not filtered_files:
+                    print(f"[FilteredRandomLoRALoader] Warning: No LoRAs after deduplication")
+                    empty_preview = self._generate_preview_batch([])
+                    return self._generate_outputs(model, clip, final_positive, final_negative,
+                                                 token_normalization, weight_interpretation, empty_preview)
+            
+            # RELEVANCE: 関連度の上位 relevance_top_k 件から選択
+            weights = None
+            if relevance_scores is not None:
+                filtered_files = filtered_files[:relevance_top_k]
+                best = filtered_files[0]
+                print(f"[FilteredRandomLoRALoader] Relevance: top {len(filtered_files)} LoRAs, best {os.path.basename(best)} (score {relevance_scores[best]:.2f})")
+                if relevance_weighting:
+                    weights = [relevance_scores[p] for p in filtered_files]
+            
+            # ランダム選択（重複なし、不足時は重複で埋める）
+            available_count = len(filtered_files)
+            
+            if num_loras <= available_count:
+                # 十分な数がある場合は重複なしで選択（relevance_weighting ならスコアに比例した確率）
+                if weights is not None:
+                    selected_loras = weighted_sample(filtered_files, weights, num_loras)
+                else:
+                    selected_loras = random.sample(filtered_files, num_loras)
+            else:
+                # 不足する場合は全て選択後、再選択で埋める
+                selected_loras = filtered_files.copy()
+                remaining = num_loras - available_count
+                
+                print(f"[FilteredRandomLoRALoader] Warning: Requested {num_loras} LoRAs but only {available_count} available. Adding {remaining} duplicates.")
+                
+                # 不足分をランダムに追加（重複あり）
+                if weights is not None:
+                    selected_loras.extend(random.choices(filtered_files, weights=weights, k=remaining))
+                else:
+                    for _ in range(remaining):
+                        selected_loras.append(random.choice(filtered_files))
+                
+                # 最終的にシャッフル
+                random.shuffle(selected_loras)
         
         # LoRA適用
         lora_info_parts = []
@@ -267,27 +372,64 @@ class FilteredRandomLoRALoader:
         return self._generate_outputs(model, clip, final_positive, final_negative,
                                      token_normalization, weight_interpretation, preview_batch)
     
-    def _find_lora_files(self, folder_path, include_subfolders):
-        """フォルダ内のLoRAファイルを検索"""
+    def _find_lora_files(self, folder_path, include_subfolders, exclude_patterns="", refresh=True):
+        """
+        フォルダ内のLoRAファイルを検索
+        
+        ライブラリインデックス（全ノード共通）から取得し、
+        フォルダに変更があった場合のみ再走査する（refresh=False は ensure_fresh 済みの場合）。
+        .loraignore と exclude_patterns に一致するフォルダには降りない
+        """
         if not os.path.exists(folder_path):
             print(f"[FilteredRandomLoRALoader] Error: Folder not found: {folder_path}")
             return []
         
-        lora_files = []
-        extensions = ['.safetensors', '.pt', '.ckpt']
+        return get_library_index().list_lora_files(
+            folder_path, include_subfolders, exclude_patterns=exclude_patterns, refresh=refresh
+        )
+    
+    def _iter_lora_files(self, folder_path, include_subfolders, exclude_patterns=""):
+        """
+        フォルダ内のLoRAファイルを順に返す（_find_lora_files のジェネレータ版）
         
-        if include_subfolders:
-            for root, dirs, files in os.walk(folder_path):
-                for file in files:
-                    if any(file.lower().endswith(ext) for ext in extensions):
-                        lora_files.append(os.path.join(root, file))
-        else:
-            for file in os.listdir(folder_path):
-                file_path = os.path.join(folder_path, file)
-                if os.path.isfile(file_path) and any(file.lower().endswith(ext) for ext in extensions):
-                    lora_files.append(file_path)
+        一覧のリストを作らないため、大きなライブラリでもメモリを使わない
+        """
+        if not os.path.exists(folder_path):
+            print(f"[FilteredRandomLoRALoader] Error: Folder not found: {folder_path}")
+            return
         
-        return lora_files
+        yield from get_library_index().iter_lora_files(
+            folder_path, include_subfolders, exclude_patterns=exclude_patterns
+        )
+    
+    def _select_lora_files_streaming(self, folder_path, include_subfolders, exclude_patterns, num_loras):
+        """
+        一覧を作らずにLoRAをランダム選択（キーワードフィルタ・ユニーク化なしの場合）
+        
+        リザーバサンプリングでメモリは num_loras に比例する。
+        インデックスはパス順で返すため、同じseed・同じライブラリなら同じ選択になる。
+        不足時は重複で埋める（通常の選択と同じ）
+        """
+        selected_loras, available_count = reservoir_sample(
+            self._iter_lora_files(folder_path, include_subfolders, exclude_patterns), num_loras
+        )
+        
+        if not selected_loras:
+            return []
+        
+        if available_count < num_loras:
+            remaining = num_loras - available_count
+            print(f"[FilteredRandomLoRALoader] Warning: Requested {num_loras} LoRAs but only {available_count} available. Adding {remaining} duplicates.")
+            
+            # 不足分をランダムに追加（重複あり）
+            available = list(selected_loras)
+            for _ in range(remaining):
+                selected_loras.append(random.choice(available))
+            
+            # 最終的にシャッフル
+            random.shuffle(selected_loras)
+        
+        return selected_loras
     
     def _parse_keywords(self, keyword_filter):
         """
@@ -315,12 +457,16 @@ class FilteredRandomLoRALoader:
         
         return keywords
     
-    def _unique_by_filename(self, lora_files):
+    def _unique_by_filename(self, lora_files, dedupe_mode="filename"):
         """
         ファイル名でユニーク化（重複ファイル名を除外）
         
         Args:
             lora_files: LoRAファイルパスのリスト
+            dedupe_mode: 重複の判定方法
+                - filename: ファイル名
+                - inode: 同じ実体（シンボリックリンク・ハードリンク）
+                - content: 同じ実体または同じ内容（ヘッダー + 抜き出しデータの指紋）
         
         Returns:
             list: ファイル名がユニークなファイルパスのリスト
@@ -329,6 +475,19 @@ class FilteredRandomLoRALoader:
             ["/path/style/anime.safetensors", "/path/backup/anime.safetensors"]
             → ["/path/style/anime.safetensors"]  # 最初に見つかったものを保持
         """
+        if dedupe_mode in ("inode", "content"):
+            # テンソルを読み込む前にインデックスの情報で判定
+            duplicates = get_library_index().find_duplicates(lora_files, dedupe_mode)
+            unique_files = []
+            for file_path in lora_files:
+                if file_path in duplicates:
+                    print(f"[FilteredRandomLoRALoader] Duplicate file detected ({dedupe_mode}): {os.path.basename(file_path)}")
+                    print(f"  Keeping: {duplicates[file_path]}")
+                    print(f"  Skipping: {file_path}")
+                else:
+                    unique_files.append(file_path)
+            return unique_files
+        
         seen_names = {}
         unique_files = []
         
@@ -346,11 +505,106 @@ class FilteredRandomLoRALoader:
         
         return unique_files
     
-    def _filter_lora_files(self, lora_files, keyword_filter, filter_mode="OR", search_in_metadata=False):
-        """キーワードでLoRAファイルをフィルタリング"""
+    def _find_filtered_lora_files(self, folder_path, include_subfolders, exclude_patterns,
+                                  keyword_filter, filter_mode, search_in_metadata):
+        """
+        LoRAファイル一覧を取得してキーワードでフィルタリング
+        
+        同じ条件で、フォルダの一覧が変わっていなければ（インデックスの generation が
+        同じなら）前回の結果を使う（lora_library.filter_cache 参照）
+        
+        Returns:
+            tuple: (フォルダ内の全LoRAファイル, フィルタ後のファイル)
+        """
+        cache = get_filter_cache() if keyword_filter.strip() else None
+        if cache is None:
+            lora_files = self._find_lora_files(folder_path, include_subfolders, exclude_patterns)
+            return lora_files, self._filter_lora_files(
+                lora_files, keyword_filter, filter_mode, search_in_metadata, folder_path
+            )
+        
+        listing_key = (normalize_folder_path(folder_path), bool(include_subfolders), exclude_patterns)
+        filter_key = (keyword_filter, filter_mode, bool(search_in_metadata))
+        generation = get_library_index().ensure_fresh(folder_path, include_subfolders, exclude_patterns)
+        cached = cache.get(listing_key, filter_key, generation)
+        if cached is not None:
+            print(f"[FilteredRandomLoRALoader] Reusing filter result: {len(cached[1])}/{len(cached[0])} files")
+            return cached
+        
+        # ensure_fresh で更新済みなので、もう一度ディレクトリを stat しない
+        lora_files = self._find_lora_files(folder_path, include_subfolders, exclude_patterns, refresh=False)
+        filtered_files = self._filter_lora_files(
+            lora_files, keyword_filter, filter_mode, search_in_metadata, folder_path
+        ) if lora_files else []
+        uses_metadata = search_in_metadata or query_uses_metadata(keyword_filter, filter_mode)
+        cache.put(listing_key, filter_key, generation, uses_metadata, lora_files, filtered_files)
+        return lora_files, filtered_files
+    
+    def _rank_lora_files(self, folder_path, include_subfolders, exclude_patterns,
+                         keyword_filter, search_in_metadata, top_k=None):
+        """
+        LoRAファイル一覧を取得してキーワードとの関連度（BM25）で並べる（RELEVANCE モード）
+        
+        検索対象は AND / OR と同じ（ファイル名、search_in_metadata ならメタデータのキーワードも）。
+        NOT・フィールド指定を含むクエリは先に絞り込み、残ったLoRAだけを並べる
+        （演算子なしの並びは AND で結合するので "anime NOT realistic" は realistic を除く。
+        スコアには NOT の下にないキーワードだけを使う）。
+        ファイル一覧は毎回インデックスから取得する（フィルタ結果のキャッシュは使わない）
+        
+        Returns:
+            tuple: (フォルダ内の全LoRAファイル, 関連度の高い順のファイル（上位 top_k 件）,
+                    {ファイル: スコア})
+        """
+        lora_files = self._find_lora_files(folder_path, include_subfolders, exclude_patterns)
+        if not lora_files:
+            return lora_files, [], {}
+        
+        try:
+            query = compile_query(keyword_filter, "AND")
+        except QuerySyntaxError as e:
+            print(f"[FilteredRandomLoRALoader] Warning: Invalid query ({e}), ranking plain keywords")
+            query = None
+        candidates = lora_files
+        if query is not None:
+            candidates = self._filter_by_query(lora_files, query, search_in_metadata, folder_path)
+            if not candidates:
+                return lora_files, [], {}
+        
+        # スコアに使う語がない（NOT・folder: だけ）: 絞り込んだLoRAを同じ重みで返す
+        if not query_terms(keyword_filter):
+            ranked = [(path, 1.0) for path in candidates[:top_k]]
+            return lora_files, [path for path, _ in ranked], dict(ranked)
+        
+        if search_in_metadata:
+            namespace, texts = METADATA_CACHE_NAMESPACE, self._build_search_targets(candidates)
+        else:
+            namespace, texts = FILENAME_NAMESPACE, filename_search_text
+        ranked = get_relevance_index(namespace).rank(candidates, texts, keyword_filter, top_k)
+        if search_in_metadata:
+            self._report_metadata_cache(len(ranked), len(candidates))
+        
+        return lora_files, [path for path, _ in ranked], dict(ranked)
+    
+    def _filter_lora_files(self, lora_files, keyword_filter, filter_mode="OR", search_in_metadata=False,
+                           folder_path=None):
+        """
+        キーワードでLoRAファイルをフィルタリング
+        
+        NOT・括弧・フィールド指定（name: / tag: / trigger: / folder:）を含む場合は
+        クエリとして評価する（lora_library.query 参照、folder: は folder_path 基準）
+        """
         if not keyword_filter.strip():
             return lora_files  # フィルタなし = 全ファイル
         
+        # クエリの解析（クエリ文字列ごとにキャッシュ、構文エラーは従来のキーワードとして扱う）
+        try:
+            query = compile_query(keyword_filter, filter_mode)
+        except QuerySyntaxError as e:
+            print(f"[FilteredRandomLoRALoader] Warning: Invalid query ({e}), using plain keywords")
+            query = None
+        if query is not None:
+            return self._filter_by_query(lora_files, query, search_in_metadata, folder_path)
+        
         # キーワードをパース（スペース区切り、"..."でフレーズ対応）
         keywords = self._parse_keywords(keyword_filter)
         if not keywords:
@@ -358,50 +612,131 @@ class FilteredRandomLoRALoader:
         
         # メタデータ検索が無効な場合（デフォルト）
         if not search_in_metadata:
-            # ファイル名のみ検索（超高速）
-            filtered = []
-            for lora_path in lora_files:
-                filename = os.path.splitext(os.path.basename(lora_path))[0].lower()
-                if filter_mode == "AND":
-                    if all(kw in filename for kw in keywords):
-                        filtered.append(lora_path)
-                else:
-                    if any(kw in filename for kw in keywords):
-                        filtered.append(lora_path)
-            return filtered
+            # ファイル名のみ検索（転置インデックス、新しいファイルだけ索引）
+            return get_keyword_index(FILENAME_NAMESPACE).filter(
+                lora_files, filename_search_text, keywords, filter_mode
+            )
         
         # メタデータ検索が有効な場合（初回は遅い）
+        search_targets = self._build_search_targets(lora_files)
+        
+        # フィルタリング（内容が変わったファイルだけ索引し直す）
+        filtered = get_keyword_index(METADATA_CACHE_NAMESPACE).filter(
+            lora_files, search_targets, keywords, filter_mode
+        )
+        self._report_metadata_cache(len(filtered), len(lora_files))
+        
+        return filtered
+    
+    def _filter_by_query(self, lora_files, query, search_in_metadata, folder_path):
+        """コンパイル済みのクエリでフィルタリング"""
+        search_source = None
+        if search_in_metadata and ANY_FIELD in query.fields:
+            search_source = (METADATA_CACHE_NAMESPACE, self._build_search_targets(lora_files))
+        
+        # tag: / trigger:（メタデータ検索時は name: も）はメタデータのレコードから
+        records = None
+        if query.uses_metadata_fields or (search_in_metadata and "name" in query.fields):
+            records = self._get_metadata_records(lora_files)
+        
+        sources = field_sources(query.fields, lora_files, folder_path, search_source, records)
+        filtered = query.evaluate(lora_files, sources)
+        
+        if search_source is not None or records is not None:
+            self._report_metadata_cache(len(filtered), len(lora_files))
+        return filtered
+    
+    def _build_search_targets(self, lora_files):
+        """
+        メタデータ検索の検索対象（ファイル名 + メタデータのキーワード）をファイルごとに作成
+        
+        Returns:
+            list: lora_files と同じ順序の検索対象文字列（小文字）
+        """
         total = len(lora_files)
-        filtered = []
+        search_targets = []
         
         print(f"[FilteredRandomLoRALoader] Building metadata cache for {total} files...")
         
+        # ディスクのキャッシュをまとめて読み込み（再起動後も再構築しない）
+        index = get_library_index()
+        stored = index.load_cached_keywords(
+            [p for p in lora_files if p not in self._metadata_cache], METADATA_CACHE_NAMESPACE
+        )
+        self._metadata_cache.update(
+            (path, KeywordEntry(signature, keywords)) for path, (signature, keywords) in stored.items()
+        )
+        
+        # 署名が一致するキャッシュはその場で使い、読み込みが必要なファイルだけをスレッドプールに渡す
+        keywords_list = [""] * total
+        misses = []
         for i, lora_path in enumerate(lora_files):
-            # 進捗表示（100個ごと）
-            if i > 0 and i % 100 == 0:
-                print(f"[FilteredRandomLoRALoader] Progress: {i}/{total} ({int(i/total*100)}%)")
-            
-            filename = os.path.splitext(os.path.basename(lora_path))[0].lower()
-            search_target = filename
-            
-            # メタデータからキーワード取得（キャッシュ利用）
-            metadata_keywords = self._get_metadata_keywords(lora_path)
-            if metadata_keywords:
-                search_target = f"{filename} {metadata_keywords}"
-            
-            # フィルタリング
-            if filter_mode == "AND":
-                if all(kw in search_target for kw in keywords):
-                    filtered.append(lora_path)
+            signature = index.get_file_signature(lora_path)
+            cached = self._metadata_cache.get(lora_path)
+            if cached is not None and cached.signature == signature:
+                keywords_list[i] = cached.keywords
             else:
-                if any(kw in search_target for kw in keywords):
-                    filtered.append(lora_path)
+                misses.append((i, lora_path, signature))
         
-        print(f"[FilteredRandomLoRALoader] Cache built. Filtered {len(filtered)}/{total} files.")
+        # メタデータからキーワード取得（スレッドプールで並列・結果は入力順）
+        results = map_ordered(
+            lambda miss: self._get_metadata_keywords(miss[1], miss[2]), misses,
+            timeout=get_metadata_timeout(), thread_name_prefix="RandomLoRAMetadata",
+        )
+        timed_out = 0
         
-        return filtered
+        for done, ((i, lora_path, _), metadata_keywords) in enumerate(zip(misses, results)):
+            # 進捗表示（読み込んだファイル100個ごと）
+            if done > 0 and done % 100 == 0:
+                print(f"[FilteredRandomLoRALoader] Progress: {done}/{len(misses)} ({int(done/len(misses)*100)}%)")
+            
+            # 時間切れはファイル名のみで判定（キャッシュされないので次回再試行）
+            if metadata_keywords is TIMED_OUT:
+                timed_out += 1
+                print(f"[FilteredRandomLoRALoader] Metadata read timed out: {os.path.basename(lora_path)}")
+                metadata_keywords = ""
+            keywords_list[i] = metadata_keywords
+        
+        for lora_path, metadata_keywords in zip(lora_files, keywords_list):
+            filename = filename_search_text(lora_path)
+            search_targets.append(f"{filename} {metadata_keywords}" if metadata_keywords else filename)
+        
+        index.flush()
+        if timed_out:
+            print(f"[FilteredRandomLoRALoader] {timed_out} file(s) timed out and were matched by filename only")
+        return search_targets
     
-    def _get_metadata_keywords(self, lora_path):
+    def _get_metadata_records(self, lora_files):
+        """
+        メタデータのレコードをファイルごとに取得（クエリのフィールド指定用）
+        
+        Returns:
+            list: lora_files と同じ順序の MetadataRecord（ない・時間切れはNone）
+        """
+        results = map_ordered(
+            self._get_metadata_record, lora_files,
+            timeout=get_metadata_timeout(), thread_name_prefix="RandomLoRAMetadata",
+        )
+        records = []
+        timed_out = 0
+        for record in results:
+            if record is TIMED_OUT:
+                timed_out += 1
+                record = None
+            records.append(record)
+        if timed_out:
+            print(f"[FilteredRandomLoRALoader] {timed_out} file(s) timed out and were matched without metadata")
+        return records
+    
+    def _report_metadata_cache(self, matched, total):
+        """メタデータ検索後のログ（件数・キャッシュの状態・隔離したファイル）"""
+        print(f"[FilteredRandomLoRALoader] Cache built. Filtered {matched}/{total} files.")
+        print(f"[FilteredRandomLoRALoader] {self._metadata_cache.format_stats()}")
+        quarantine_report = get_quarantine().format_report()
+        if quarantine_report:
+            print(f"[FilteredRandomLoRALoader] {quarantine_report}")
+    
+    def _get_metadata_keywords(self, lora_path, signature=None):
         """
         メタデータからキーワードを取得（キャッシュ付き）
         
@@ -414,72 +749,48 @@ class FilteredRandomLoRALoader:
           6. tags（トップレベル）
           7. 埋め込みメタデータ（ss_tag_frequency等）
         
+        キャッシュはLoRA本体と .metadata.json / .info のmtimeが変わると作り直す
+        
+        Args:
+            lora_path: LoRAファイルパス
+            signature: 取得済みのファイル署名（メモリのキャッシュは呼び出し側で確認済み）
+        
         Returns:
             str: 検索用キーワード文字列（小文字、スペース区切り）
         """
-        # キャッシュ確認
-        if lora_path in self._metadata_cache:
-            return self._metadata_cache[lora_path]
-        
-        # メタデータ読み込み
-        metadata = self._load_json_metadata(lora_path)
-        keywords_parts = []
-        
-        if metadata:
-            # 1. トップレベルのmodel_name
-            model_name = metadata.get("model_name", "")
-            if model_name:
-                keywords_parts.append(model_name)
-            
-            # civitaiセクション
-            civitai = metadata.get("civitai", {})
-            
-            # 2. civitai.name
-            civitai_name = civitai.get("name", "")
-            if civitai_name:
-                keywords_parts.append(civitai_name)
-            
-            # 3. civitai.trainedWords
-            trained_words = civitai.get("trainedWords", [])
-            if trained_words:
-                all_words = []
-                for pattern in trained_words:
-                    # カンマ区切りで分割
-                    words = [w.strip() for w in pattern.split(',')]
-                    all_words.extend(words)
-                # 重複除去（順序維持）
-                unique_words = list(dict.fromkeys(all_words))
-                keywords_parts.extend(unique_words)
-            
-            # civitai.modelセクション
-            model_info = civitai.get("model", {})
-            
-            # 4. civitai.model.name
-            model_info_name = model_info.get("name", "")
-            if model_info_name:
-                keywords_parts.append(model_info_name)
-            
-            # 5. civitai.model.tags
-            model_tags = model_info.get("tags", [])
-            if model_tags:
-                keywords_parts.extend(model_tags)
-            
-            # 6. トップレベルのtags（通常は5と同じ内容だが念のため）
-            top_tags = metadata.get("tags", [])
-            if top_tags:
-                keywords_parts.extend(top_tags)
-        
-        # 重複除去（順序維持）
-        unique_keywords = list(dict.fromkeys(keywords_parts))
-        
-        # 小文字化してスペース区切りで結合
-        keywords = " ".join(unique_keywords).lower()
+        # キャッシュ確認（メモリ → ディスク）
+        index = get_library_index()
+        cached = None
+        if signature is None:
+            signature = index.get_file_signature(lora_path)
+            cached = self._metadata_cache.get(lora_path)
+        if cached is None:
+            stored = index.load_cached_keywords([lora_path], METADATA_CACHE_NAMESPACE).get(lora_path)
+            cached = KeywordEntry(*stored) if stored else None
+        if cached is not None and cached.signature == signature:
+            self._metadata_cache[lora_path] = cached
+            return cached.keywords
+        
+        # メタデータのレコードから取得（トリガーワード・作例プロンプトと共通）
+        record = self._get_metadata_record(lora_path, signature)
+        keywords = record.keywords if record else ""
         
         # キャッシュに保存
-        self._metadata_cache[lora_path] = keywords
+        self._metadata_cache[lora_path] = KeywordEntry(signature, keywords)
+        index.store_cached_keywords(lora_path, METADATA_CACHE_NAMESPACE, signature, keywords)
         
         return keywords
     
+    def _get_metadata_record(self, lora_path, signature=None):
+        """
+        LoRAのメタデータレコードを取得（検索キーワード・トリガーワード・作例プロンプト）
+        
+        .metadata.json / .info の読み込みは1回だけ。署名が変わるまでキャッシュ
+        """
+        return get_metadata_record(
+            lora_path, self._load_json_metadata, METADATA_CACHE_NAMESPACE, signature
+        )
+    
     def _load_json_metadata(self, lora_path):
         """
         メタデータファイルまたは埋め込みメタデータを読み込み
@@ -488,24 +799,35 @@ class FilteredRandomLoRALoader:
           1. .metadata.json（ComfyUI Lora Manager）
           2. .info（Civitai Helper）
           3. 埋め込みメタデータ
+        
+        サイドカーの有無はスキャン時にインデックスへ記録済み（存在確認のI/Oなし）
         """
-        base_path = os.path.splitext(lora_path)[0]
+        sidecars = get_library_index().get_sidecars(lora_path)
+        
+        # フォルダのマニフェストに最新の記録があればサイドカーを開かない
+        found, manifest_metadata = get_manifest_metadata(lora_path)
+        if found:
+            if manifest_metadata is not None:
+                return manifest_metadata
+            sidecars = {}  # サイドカーなし・読み込み失敗（埋め込みメタデータへ）
         
         # 1. .metadata.json
-        metadata_json_path = f"{base_path}.metadata.json"
-        if os.path.exists(metadata_json_path):
+        metadata_json_path = sidecars.get("metadata_json")
+        if metadata_json_path:
             try:
-                with open(metadata_json_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json_sidecar(metadata_json_path, "metadata_json")
+            except QuarantinedFileError:
+                pass  # 前回警告済み（変更されるまで読まない）
             except Exception as e:
                 print(f"[FilteredRandomLoRALoader] Warning: Failed to load {metadata_json_path}: {e}")
         
         # 2. .info
-        info_path = f"{base_path}.info"
-        if os.path.exists(info_path):
+        info_path = sidecars.get("info")
+        if info_path:
             try:
-                with open(info_path, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json_sidecar(info_path, "info")
+            except QuarantinedFileError:
+                pass  # 前回警告済み（変更されるまで読まない）
             except Exception as e:
                 print(f"[FilteredRandomLoRALoader] Warning: Failed to load {info_path}: {e}")
         
@@ -518,49 +840,50 @@ class FilteredRandomLoRALoader:
     
     def _load_embedded_metadata(self, lora_path):
         """LoRAファイルから埋め込みメタデータを読み込み（Civitai形式に変換）"""
+        # 埋め込みメタデータがあるのは safetensors だけ（.pt / .ckpt は読まない）
+        if not lora_path.lower().endswith(".safetensors"):
+            return None
+        
         try:
-            from safetensors.torch import safe_open
+            # フォルダのマニフェストに同じサイズ・mtimeの記録があればファイルを開かない
+            found, metadata = get_manifest_embedded(lora_path)
+            if not found:
+                # ヘッダーのみ読み込み（torch 不要、サイズ・mtimeが同じ間はキャッシュ）
+                metadata = read_embedded_metadata(lora_path)
             
-            with safe_open(lora_path, framework="pt") as f:
-                metadata = f.metadata()
-                
-                if not metadata:
-                    return None
-                
-                # Civitai形式に変換
-                civitai_format = {"civitai": {}}
-                
-                # ss_tag_frequency からトリガーワード抽出
-                if "ss_tag_frequency" in metadata:
-                    try:
-                        tag_freq_str = metadata.get("ss_tag_frequency", "{}")
-                        tag_freq = json.loads(tag_freq_str)
-                        
-                        all_tags = []
-                        for dataset_name, tags_dict in tag_freq.items():
-                            sorted_tags = sorted(tags_dict.items(), key=lambda x: x[1], reverse=True)
-                            top_tags = [tag for tag, freq in sorted_tags[:20]]
-                            all_tags.extend(top_tags)
-                        
-                        if all_tags:
-                            unique_tags = list(dict.fromkeys(all_tags))
-                            civitai_format["civitai"]["trainedWords"] = [", ".join(unique_tags)]
-                    except:
-                        pass
-                
-                # modelspec.trigger_word
-                if "modelspec.trigger_word" in metadata:
-                    trigger_word = metadata.get("modelspec.trigger_word", "")
-                    if trigger_word and "trainedWords" not in civitai_format["civitai"]:
-                        civitai_format["civitai"]["trainedWords"] = [trigger_word]
-                
-                # ss_output_name
-                if "ss_output_name" in metadata:
-                    model_name = metadata.get("ss_output_name", "")
-                    if model_name:
-                        civitai_format["model_name"] = model_name
-                
-                return civitai_format if civitai_format["civitai"] else None
+            if not metadata:
+                return None
+            
+            # Civitai形式に変換
+            civitai_format = {"civitai": {}}
+            
+            # ss_tag_frequency からトリガーワード抽出
+            if "ss_tag_frequency" in metadata:
+                try:
+                    # データセットごとの頻度順上位20個（解析済み）
+                    all_tags = []
+                    for top_tags in metadata["ss_tag_frequency"].dataset_top_tags():
+                        all_tags.extend(top_tags)
+                    
+                    if all_tags:
+                        unique_tags = list(dict.fromkeys(all_tags))
+                        civitai_format["civitai"]["trainedWords"] = [", ".join(unique_tags)]
+                except:
+                    pass
+            
+            # modelspec.trigger_word
+            if "modelspec.trigger_word" in metadata:
+                trigger_word = metadata.get("modelspec.trigger_word", "")
+                if trigger_word and "trainedWords" not in civitai_format["civitai"]:
+                    civitai_format["civitai"]["trainedWords"] = [trigger_word]
+            
+            # ss_output_name
+            if "ss_output_name" in metadata:
+                model_name = metadata.get("ss_output_name", "")
+                if model_name:
+                    civitai_format["model_name"] = model_name
+            
+            return civitai_format if civitai_format["civitai"] else None
                 
         except Exception as e:
             return None
@@ -583,16 +906,12 @@ class FilteredRandomLoRALoader:
     
     def _get_trigger_words_combined(self, lora_path):
         """全トリガーワードを結合"""
-        metadata = self._load_json_metadata(lora_path)
-        if not metadata:
-            return ""
-        
-        trained_words = metadata.get("civitai", {}).get("trainedWords", [])
-        if not trained_words:
+        record = self._get_metadata_record(lora_path)
+        if not record or not record.trained_words:
             return ""
         
         all_words = []
-        for pattern in trained_words:
+        for pattern in record.trained_words:
             # LoRA構文を削除してから分割
             pattern = self._remove_lora_syntax(pattern)
             words = [w.strip() for w in pattern.split(',')]
@@ -603,37 +922,22 @@ class FilteredRandomLoRALoader:
     
     def _get_trigger_words_random(self, lora_path):
         """トリガーワードからランダムに1つ選択"""
-        metadata = self._load_json_metadata(lora_path)
-        if not metadata:
-            return ""
-        
-        trained_words = metadata.get("civitai", {}).get("trainedWords", [])
-        if not trained_words:
+        record = self._get_metadata_record(lora_path)
+        if not record or not record.trained_words:
             return ""
         
         # LoRA構文を削除
-        selected = random.choice(trained_words)
+        selected = random.choice(record.trained_words)
         return self._remove_lora_syntax(selected)
     
     def _get_sample_prompt_from_json(self, lora_path):
         """作例プロンプトをランダムに取得"""
-        metadata = self._load_json_metadata(lora_path)
-        if not metadata:
-            return "", ""
-        
-        images = metadata.get("civitai", {}).get("images", [])
-        if not images:
+        record = self._get_metadata_record(lora_path)
+        if not record or not record.sample_prompts:
             return "", ""
         
-        valid_images = [img for img in images if "meta" in img and img["meta"]]
-        if not valid_images:
-            return "", ""
-        
-        selected_image = random.choice(valid_images)
-        meta = selected_image["meta"]
-        
-        positive = meta.get("prompt", "")
-        negative = meta.get("negativePrompt", "")
+        # meta を持つ画像の (prompt, negativePrompt)
+        positive, negative = random.choice(record.sample_prompts)
         
         # LoRA構文削除（両方）
         positive = self._remove_lora_syntax(positive)
@@ -689,67 +993,34 @@ class FilteredRandomLoRALoader:
             print("[FilteredRandomLoRALoader] PIL/torch not available for preview")
             return None
         
-        # LoRAファイル名（拡張子なし）
-        base_name = os.path.splitext(os.path.basename(lora_path))[0]
-        folder = os.path.dirname(lora_path)
-        
-        # ファイル拡張子（優先順位順）
-        static_image_exts = ('.png', '.jpg', '.jpeg')
-        animated_image_exts = ('.gif', '.webp')  # Pillowで対応可能
-        video_exts = ('.mp4', '.webm', '.avi', '.mov')  # opencv-python必要
+        # プレビュー候補（スキャン時に優先順位順で振り分け済み、フォルダ列挙なし）
+        preview_paths = get_preview_candidates(lora_path)
         
         try:
-            # 同じフォルダ内のファイルを検索
-            files = os.listdir(folder)
-            
-            # 部分一致するファイルを収集
-            matched_files = []
-            for file in files:
-                if file.lower().startswith(base_name.lower()):
-                    matched_files.append(file)
-            
-            if not matched_files:
-                return None
-            
-            # 優先順位でソート
-            def get_priority(filename):
-                lower = filename.lower()
-                if any(lower.endswith(ext) for ext in static_image_exts):
-                    return 0  # 最優先
-                elif any(lower.endswith(ext) for ext in animated_image_exts):
-                    return 1  # 次優先
-                elif any(lower.endswith(ext) for ext in video_exts):
-                    return 2  # 最後
-                else:
-                    return 999  # その他
-            
-            matched_files.sort(key=get_priority)
-            
             # 各ファイルを試す
-            for file in matched_files:
-                preview_path = os.path.join(folder, file)
-                lower_file = file.lower()
+            for preview_path in preview_paths:
+                lower_file = preview_path.lower()
                 
                 # 静止画像
-                if any(lower_file.endswith(ext) for ext in static_image_exts):
+                if lower_file.endswith(PREVIEW_STATIC_EXTENSIONS):
                     img = self._load_static_image(preview_path)
                     if img is not None:
                         return img
                 
                 # アニメーション画像（GIF/WebP）
-                elif any(lower_file.endswith(ext) for ext in animated_image_exts):
+                elif lower_file.endswith(PREVIEW_ANIMATED_EXTENSIONS):
                     img = self._load_animated_image_first_frame(preview_path)
                     if img is not None:
                         return img
                 
                 # 動画ファイル（opencv-python必要）
-                elif any(lower_file.endswith(ext) for ext in video_exts):
+                elif lower_file.endswith(PREVIEW_VIDEO_EXTENSIONS):
                     img = self._load_video_first_frame(preview_path)
                     if img is not None:
                         return img
         
         except Exception as e:
-            print(f"[FilteredRandomLoRALoader] Folder read error: {e}")
+            print(f"[FilteredRandomLoRALoader] Preview load error: {e}")
         
         return None
     
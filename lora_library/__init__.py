@@ -0,0 +1,111 @@
+"""
+RandomLoRALoader 共通ライブラリ
+全ノードで共有するLoRAライブラリのインデックス・スキャン処理
+"""
+
+from .scanner import (
+    LORA_EXTENSIONS,
+    PREVIEW_STATIC_EXTENSIONS,
+    PREVIEW_ANIMATED_EXTENSIONS,
+    PREVIEW_VIDEO_EXTENSIONS,
+    normalize_folder_path,
+)
+from .index import LibraryIndex, get_library_index
+from .watcher import FolderWatcher
+from .sampling import reservoir_sample, weighted_sample
+from .fingerprint import DEDUPE_MODES, compute_fingerprint
+from .cache import BoundedCache, get_metadata_cache
+from .safetensors_header import (
+    SafetensorsHeaderError,
+    TagFrequencySummary,
+    read_safetensors_metadata,
+    read_embedded_metadata,
+)
+from .parallel import TIMED_OUT, get_metadata_timeout, map_ordered
+from .warmup import start_warmup
+from .quarantine import Quarantine, QuarantinedFileError, get_quarantine, load_json_sidecar
+from .compact import KeywordEntry, TokenTable, get_token_table
+from .sidecar_json import extract_fields, load_metadata_json
+from .manifest import (
+    MANIFEST_NAME,
+    build_manifest,
+    get_manifest_embedded,
+    get_manifest_metadata,
+    get_preview_candidates,
+)
+from .keyword_index import (
+    FILENAME_NAMESPACE,
+    KeywordIndex,
+    filename_search_text,
+    get_keyword_index,
+)
+from .query import (
+    ANY_FIELD,
+    CompiledQuery,
+    QuerySyntaxError,
+    compile_query,
+    field_sources,
+    query_uses_metadata,
+)
+from .filter_cache import FilterResultCache, get_filter_cache
+from .relevance import RELEVANCE_MODE, RelevanceIndex, get_relevance_index, is_relevance_available, query_terms
+from .records import MetadataRecord, build_metadata_record, get_metadata_record
+
+__all__ = [
+    'LORA_EXTENSIONS',
+    'PREVIEW_STATIC_EXTENSIONS',
+    'PREVIEW_ANIMATED_EXTENSIONS',
+    'PREVIEW_VIDEO_EXTENSIONS',
+    'normalize_folder_path',
+    'LibraryIndex',
+    'get_library_index',
+    'FolderWatcher',
+    'reservoir_sample',
+    'weighted_sample',
+    'DEDUPE_MODES',
+    'compute_fingerprint',
+    'BoundedCache',
+    'get_metadata_cache',
+    'SafetensorsHeaderError',
+    'TagFrequencySummary',
+    'read_safetensors_metadata',
+    'read_embedded_metadata',
+    'TIMED_OUT',
+    'get_metadata_timeout',
+    'map_ordered',
+    'start_warmup',
+    'MetadataRecord',
+    'build_metadata_record',
+    'get_metadata_record',
+    'Quarantine',
+    'QuarantinedFileError',
+    'get_quarantine',
+    'load_json_sidecar',
+    'KeywordEntry',
+    'TokenTable',
+    'get_token_table',
+    'extract_fields',
+    'load_metadata_json',
+    'MANIFEST_NAME',
+    'build_manifest',
+    'get_manifest_embedded',
+    'get_manifest_metadata',
+    'get_preview_candidates',
+    'FILENAME_NAMESPACE',
+    'KeywordIndex',
+    'filename_search_text',
+    'get_keyword_index',
+    'ANY_FIELD',
+    'CompiledQuery',
+    'QuerySyntaxError',
+    'compile_query',
+    'field_sources',
+    'query_uses_metadata',
+    'FilterResultCache',
+    'get_filter_cache',
+    'RELEVANCE_MODE',
+    'RelevanceIndex',
+    'get_relevance_index',
+    'is_relevance_available',
+    'query_terms',
+]
@@ -0,0 +1,163 @@
+"""
+メモリ使用量に上限のあるキャッシュ（LRU）
+
+長時間稼働するサーバーで、検索したことのある全LoRAのメタデータが
+メモリに溜まり続けないようにする。上限を超えると最後に使われたのが
+最も古いものから捨てる（ディスク上のキャッシュは残るため、次に必要に
+なったときはインデックスから読み直す）。
+
+上限は全キャッシュの合計で、CACHE_SHARES の割合で各キャッシュに分ける
+（デフォルトの 64 MB なら キーワード 19.2 / レコード 19.2 / safetensors ヘッダー 9.6 /
+マニフェスト 9.6 / フィルタ結果 6.4 MB）。
+
+設定（環境変数）:
+  RANDOM_LORA_CACHE_MB  全キャッシュの合計の上限（MB、デフォルト: 64）
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+
+DEFAULT_CACHE_MB = 64.0
+
+# RANDOM_LORA_CACHE_MB を各キャッシュに分ける割合（合計 1.0）
+CACHE_SHARES = {
+    "metadata": 0.30,   # キーワードキャッシュ（フィルタノード）
+    "records": 0.30,    # メタデータレコード（lora_library.records）
+    "headers": 0.15,    # safetensors の埋め込みメタデータ
+    "manifests": 0.15,  # フォルダのマニフェスト
+    "filter": 0.10,     # フィルタ結果
+}
+
+
+def estimate_size(value):
+    """値のおおよそのメモリ使用量（バイト、タプル・リスト・辞書は中身も数える）"""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(estimate_size(item) for item in value)
+    elif isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif hasattr(value, "__slots__"):
+        size += sum(estimate_size(getattr(value, slot, None)) for slot in value.__slots__)
+    return size
+
+
+class BoundedCache:
+    """
+    バイト数上限付きのLRUキャッシュ（スレッドセーフ）
+
+    dict と同じ感覚で使える（get / [] / in / update）。
+    in は使用順を更新せず、ヒット・ミスにも数えない。
+    """
+
+    def __init__(self, max_bytes, name="cache"):
+        self.max_bytes = max_bytes
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._bytes = 0
+        self._items = OrderedDict()  # {key: (value, size)}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        size = estimate_size(key) + estimate_size(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                # 1件で上限を超えるものは保持しない
+                return
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def update(self, items):
+        for key, value in dict(items).items():
+            self[key] = value
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """{"entries", "bytes", "max_bytes", "hits", "misses", "evictions"}"""
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def format_stats(self):
+        """ログ用の1行表示"""
+        stats = self.stats()
+        return (f"{self.name}: {stats['entries']} entries, "
+                f"{stats['bytes'] / 1048576:.1f}/{stats['max_bytes'] / 1048576:.1f} MB, "
+                f"hits {stats['hits']}, misses {stats['misses']}, evictions {stats['evictions']}")
+
+
+_MISSING = object()
+
+
+def get_cache_budget(name=None):
+    """
+    キャッシュの上限（バイト）
+
+    Args:
+        name: CACHE_SHARES のキー（その割合の上限を返す）。Noneは全キャッシュの合計
+    """
+    try:
+        megabytes = float(os.environ.get("RANDOM_LORA_CACHE_MB", DEFAULT_CACHE_MB))
+    except ValueError:
+        megabytes = DEFAULT_CACHE_MB
+    if name is not None:
+        megabytes *= CACHE_SHARES[name]
+    return max(0, int(megabytes * 1048576))
+
+
+_metadata_cache = None
+_metadata_cache_lock = threading.Lock()
+
+
+def get_metadata_cache():
+    """全ノード共通のメタデータキャッシュを取得（初回のみ作成）"""
+    global _metadata_cache
+    with _metadata_cache_lock:
+        if _metadata_cache is None:
+            _metadata_cache = BoundedCache(get_cache_budget("metadata"), name="Metadata cache")
+        return _metadata_cache
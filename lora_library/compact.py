@@ -0,0 +1,111 @@
+"""
+大きなライブラリ向けのメタデータのコンパクトな表現
+
+10万件規模のライブラリでは、LoRAごとのキーワード文字列やトリガーワードの
+リストがメモリとGC時間の大半を占める。キーワードの多くはタグ名など
+ライブラリ全体で繰り返し現れるため、
+
+  - トークン（スペース区切りの語）は共通の TokenTable でIDに変換し、
+    LoRAごとには array('I') のID列だけを持つ
+  - 繰り返し現れる文字列（トリガーワードのパターン、作例プロンプト、タグ）は
+    sys.intern で1つのオブジェクトを共有する（参照がなくなれば解放される）
+  - レコードは __slots__ のクラス（インスタンスごとの __dict__ なし）
+
+ID列は元の文字列に完全に戻せる（" " で分割・結合するため空のトークンも保持）。
+トークン表は増える一方なので、語彙が限られるもの（検索キーワード・トリガーワード）
+だけを入れる。作例プロンプトのように語彙が広く、LoRAの数に比例して増えるものは入れない
+（キャッシュから捨てられたときに解放されるよう文字列のまま持つ）。
+"""
+
+import sys
+import threading
+from array import array
+
+
+# トークンIDの型（符号なし32ビット）
+TOKEN_TYPECODE = "I"
+
+
+class TokenTable:
+    """トークン ⇔ ID の対応表（スレッドセーフ、全キャッシュ共通）"""
+
+    def __init__(self):
+        self._ids = {}
+        self._tokens = []
+        self._lock = threading.Lock()
+
+    def encode(self, tokens):
+        """トークンのリストをID列に変換（未登録のトークンは追加）"""
+        tokens = list(tokens)
+        known = self._ids
+        try:
+            # 既知のトークンのみなら辞書参照だけで済む（2回目以降のほとんど）
+            return array(TOKEN_TYPECODE, [known[token] for token in tokens])
+        except KeyError:
+            pass
+
+        ids = array(TOKEN_TYPECODE)
+        with self._lock:
+            for token in tokens:
+                token_id = self._ids.get(token)
+                if token_id is None:
+                    token_id = len(self._tokens)
+                    token = sys.intern(token)
+                    self._ids[token] = token_id
+                    self._tokens.append(token)
+                ids.append(token_id)
+        return ids
+
+    def decode(self, ids):
+        """ID列をトークンのリストに戻す"""
+        tokens = self._tokens
+        return [tokens[i] for i in ids]
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+_token_table = TokenTable()
+
+
+def get_token_table():
+    """全キャッシュ共通のトークン表"""
+    return _token_table
+
+
+def encode_text(text):
+    """スペース区切りの文字列をID列に変換"""
+    return _token_table.encode(text.split(" "))
+
+
+def decode_text(ids):
+    """encode_text の逆変換"""
+    return " ".join(_token_table.decode(ids))
+
+
+def intern_strings(values):
+    """文字列のシーケンスを intern したタプルに変換（文字列以外はそのまま）"""
+    return tuple(sys.intern(v) if type(v) is str else v for v in values)
+
+
+class KeywordEntry:
+    """
+    メモリ上のキーワードキャッシュの1件
+
+    Attributes:
+        signature: ファイル署名（LoRA本体とサイドカーのサイズ・mtime）
+        keywords: 検索用キーワード文字列（参照時にID列から復元）
+    """
+
+    __slots__ = ("signature", "_keyword_ids")
+
+    def __init__(self, signature, keywords):
+        self.signature = signature
+        self._keyword_ids = encode_text(keywords)
+
+    @property
+    def keywords(self):
+        return decode_text(self._keyword_ids)
+
+    def __repr__(self):
+        return f"KeywordEntry(signature={self.signature!r}, keywords={self.keywords!r})"
@@ -0,0 +1,126 @@
+"""
+フィルタ結果のキャッシュ
+
+キューの各実行で同じ keyword_filter を使うことが多い。フォルダの一覧が
+変わっていなければ（ライブラリインデックスの generation が同じなら）結果も
+同じなので、同じ条件の2回目以降は一覧の作成・キーワードの照合をせずに
+前回の結果を返す。
+
+  - キー: (フォルダ, include_subfolders, exclude_patterns) と
+          (keyword_filter, filter_mode, search_in_metadata)
+  - フォルダの一覧（パスのリスト）は条件ごとに1つだけ持ち、フィルタ結果は
+    一覧の位置の array('I') で持つ
+  - 差分更新・フォルダ監視で一覧が変わると generation が変わり、古い結果は使われない
+  - メタデータを使った結果（search_in_metadata、tag: / trigger:）は
+    サイドカーの上書き保存が一覧の変化に出ないため、RANDOM_LORA_FILTER_RECHECK 秒
+    経ったら作り直す（作り直しでもキーワードはキャッシュ済みなので読み直しは変わったファイルのみ）
+
+設定（環境変数）:
+  RANDOM_LORA_FILTER_CACHE    1: 使う（デフォルト） / 0: 使わない
+  RANDOM_LORA_FILTER_RECHECK  メタデータを使った結果を使い続ける秒数（デフォルト: 30、0: 使い回さない）
+"""
+
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from itertools import compress
+
+from .cache import BoundedCache, get_cache_budget
+
+
+DEFAULT_RECHECK_SECONDS = 30.0
+
+# 保持するフォルダの一覧の数
+MAX_LISTINGS = 16
+
+
+def is_filter_cache_enabled():
+    """フィルタ結果のキャッシュを使うか"""
+    value = os.environ.get("RANDOM_LORA_FILTER_CACHE", "1").strip().lower()
+    return value not in ("0", "off", "false", "no")
+
+
+def get_recheck_seconds():
+    """メタデータを使った結果を使い続ける秒数"""
+    try:
+        return max(0.0, float(os.environ.get("RANDOM_LORA_FILTER_RECHECK", DEFAULT_RECHECK_SECONDS)))
+    except ValueError:
+        return DEFAULT_RECHECK_SECONDS
+
+
+class FilterResultCache:
+    """フィルタ結果のキャッシュ（スレッドセーフ）"""
+
+    def __init__(self, max_bytes):
+        # {一覧のキー: (generation, パスのリスト)}
+        self._listings = OrderedDict()
+        self._lock = threading.Lock()
+        # {(一覧のキー, フィルタのキー): (generation, 作成時刻, メタデータを使ったか, 位置の配列)}
+        self._results = BoundedCache(max_bytes, name="Filter result cache")
+
+    def get(self, listing_key, filter_key, generation):
+        """
+        前回の結果を取得
+
+        Returns:
+            tuple: (フォルダ内の全LoRAファイル, フィルタ後のファイル)（ない・古い場合はNone）
+        """
+        if generation is None:
+            return None
+        with self._lock:
+            listing = self._listings.get(listing_key)
+            if listing is None or listing[0] != generation:
+                return None
+            self._listings.move_to_end(listing_key)
+        files = listing[1]
+
+        cached = self._results.get((listing_key, filter_key))
+        if cached is None or cached[0] != generation:
+            return None
+        if cached[2] and time.monotonic() - cached[1] >= get_recheck_seconds():
+            return None
+        return files, [files[i] for i in cached[3]]
+
+    def put(self, listing_key, filter_key, generation, uses_metadata, files, filtered):
+        """結果を保存（filtered は files の部分列）"""
+        if generation is None or (uses_metadata and get_recheck_seconds() <= 0):
+            return
+        with self._lock:
+            listing = self._listings.get(listing_key)
+            if listing is not None and listing[0] == generation and len(listing[1]) == len(files):
+                # 同じ一覧を共有（結果の位置は同じ一覧に対するもの）
+                files = listing[1]
+            else:
+                self._listings[listing_key] = (generation, files)
+            self._listings.move_to_end(listing_key)
+            while len(self._listings) > MAX_LISTINGS:
+                self._listings.popitem(last=False)
+
+        matched = set(filtered)
+        positions = array("I", compress(range(len(files)), map(matched.__contains__, files)))
+        self._results[(listing_key, filter_key)] = (generation, time.monotonic(), bool(uses_metadata), positions)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+        self._results.clear()
+
+    def format_stats(self):
+        return self._results.format_stats()
+
+
+_filter_cache = None
+_filter_cache_lock = threading.Lock()
+
+
+def get_filter_cache():
+    """フィルタ結果のキャッシュ（全ノード共通、無効な場合はNone）"""
+    global _filter_cache
+    if not is_filter_cache_enabled():
+        return None
+    with _filter_cache_lock:
+        if _filter_cache is None:
+            _filter_cache = FilterResultCache(get_cache_budget("filter"))
+        return _filter_cache
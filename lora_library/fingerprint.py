@@ -0,0 +1,67 @@
+"""
+LoRAファイルの同一性判定
+
+  - inode: (st_dev, st_ino)。シンボリックリンク・ハードリンクで同じ実体を指すファイル
+  - content: 内容の指紋。別ファイルとしてコピーされた同じLoRA
+
+内容の指紋は全体を読まずに求める（数百MBのファイルでも数百KBの読み込み）:
+  - safetensors はヘッダー（テンソル名・形状・オフセット・__metadata__）全体
+  - データ部分から等間隔に数か所を抜き出したもの
+  - ファイルサイズ
+"""
+
+import hashlib
+import os
+import struct
+
+
+# 抜き出すデータの大きさと箇所数
+SAMPLE_SIZE = 64 * 1024
+SAMPLE_COUNT = 4
+
+# safetensors のヘッダーの上限（これより大きいヘッダーは不正、safetensors と同じ値）
+# safetensors_header もこの値を使う（このモジュールはパッケージ内の他のモジュールに依存しない）
+MAX_HEADER_SIZE = 100_000_000
+
+DEDUPE_MODES = ("filename", "inode", "content")
+
+
+def file_identity(st):
+    """stat結果から実体の識別子を作成（"dev:ino"）"""
+    return f"{st.st_dev}:{st.st_ino}"
+
+
+def compute_fingerprint(path):
+    """
+    ファイル内容の指紋を計算
+
+    Returns:
+        str: 指紋（16進、読めない場合はNone）
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    try:
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            digest.update(struct.pack("<Q", size))
+
+            data_start = 0
+            if path.lower().endswith(".safetensors") and size >= 8:
+                header_size = struct.unpack("<Q", f.read(8))[0]
+                if header_size <= min(MAX_HEADER_SIZE, size - 8):
+                    digest.update(f.read(header_size))
+                    data_start = 8 + header_size
+
+            data_size = size - data_start
+            if data_size <= SAMPLE_SIZE * SAMPLE_COUNT:
+                f.seek(data_start)
+                digest.update(f.read())
+            else:
+                # 先頭から末尾まで等間隔（最後の箇所はファイル末尾に揃える）
+                for i in range(SAMPLE_COUNT):
+                    f.seek(data_start + i * (data_size - SAMPLE_SIZE) // (SAMPLE_COUNT - 1))
+                    digest.update(f.read(SAMPLE_SIZE))
+    except OSError as e:
+        print(f"[RandomLoRALoader] Fingerprint error: {path}: {e}")
+        return None
+
+    return digest.hexdigest()
@@ -0,0 +1,1142 @@
+"""
+LoRAライブラリの永続インデックス（SQLite）
+
+全ノード共通のファイル一覧キャッシュ。フォルダごとの走査結果を
+ユーザーディレクトリのSQLiteに保存し、_find_lora_files をツリー走査
+ではなくクエリで返せるようにする。
+
+保存内容:
+  - dirs:  走査済みディレクトリとそのmtime（変更検出用）
+  - files: LoRAファイルのパス・サイズ・mtime・サイドカー（メタデータ・プレビュー候補）・実体の識別子
+          （dev:ino）
+  - fingerprints: 内容の指紋（サイズ・mtimeが一致する間は再計算しない）
+  - keyword_cache: ノードが作った検索用キーワード（LoRA本体・サイドカーのmtimeが変わるまで有効）
+  - roots: 走査済みのルートフォルダ
+
+更新検出:
+  記録済みディレクトリのmtimeだけを stat で比較し、変化したディレクトリ
+  のみ再列挙する（ファイル数ではなくディレクトリ数に比例するコスト）。
+  メモリ上のファイル一覧（ビュー）は変化した部分だけ差し替える。
+  .loraignore は内容が変わると配下を走査し直すため、ファイル自体のmtimeも記録する。
+
+除外ルール:
+  .loraignore は走査時に適用（一致したフォルダ・ファイルは記録しない）。
+  exclude_patterns はノードごとに異なるため、一致したフォルダは降りずに
+  未走査（mtime_ns = -1）として記録し、除外しない要求が来たときに走査する。
+  ファイル名の除外は一覧の取得時に適用する。
+
+時間制限（RANDOM_LORA_SCAN_BUDGET）:
+  更新はバックグラウンドのスレッドで行い、制限時間内に終わらなければ
+  前回の一覧（初回は途中までの一覧）を返す。走査はそのまま続け、
+  完了した時点でインデックスに反映する。
+"""
+
+import atexit
+import bisect
+import os
+import json
+import sqlite3
+import threading
+import time
+
+from .scanner import (
+    LORA_EXTENSIONS,
+    GLOB_MATCH_CASE,
+    normalize_folder_path,
+    is_lora_filename,
+    list_directory,
+    scan_tree,
+    find_sidecars,
+    resolve_sidecars,
+    IGNORE_FILENAME,
+    load_inherited_rules,
+    parse_exclude_patterns,
+    get_scan_budget,
+    ScanProgress,
+    is_within,
+    covers,
+    plan_scans,
+)
+from .fingerprint import compute_fingerprint, file_identity
+from .watcher import FolderWatcher, get_watch_mode
+
+
+# スキーマを変更したら上げる（不一致時はキャッシュとして作り直す）
+SCHEMA_VERSION = 7
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS roots (
+    path TEXT PRIMARY KEY,
+    recursive INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    ignore_mtime_ns INTEGER,
+    pruned INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sidecars TEXT,
+    identity TEXT
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE TABLE IF NOT EXISTS keyword_cache (
+    path TEXT NOT NULL,
+    namespace TEXT NOT NULL,
+    signature TEXT NOT NULL,
+    keywords TEXT NOT NULL,
+    PRIMARY KEY (path, namespace)
+);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quarantine (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    error TEXT NOT NULL
+);
+"""
+
+
+# キーワードキャッシュの書き込みをまとめる件数
+KEYWORD_FLUSH_SIZE = 256
+
+# exclude_patterns で降りなかったディレクトリ（未走査）
+UNSCANNED_MTIME = -1
+
+
+def default_index_path():
+    """
+    インデックスファイルの保存先
+
+    優先順位:
+      1. 環境変数 RANDOM_LORA_INDEX_PATH
+      2. ComfyUIのユーザーディレクトリ
+      3. ~/.cache
+    """
+    env_path = os.environ.get("RANDOM_LORA_INDEX_PATH", "").strip()
+    if env_path:
+        return env_path
+
+    try:
+        import folder_paths
+        base_dir = folder_paths.get_user_directory()
+    except Exception:
+        base_dir = os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(base_dir, "randomloraloader", "library_index.sqlite3")
+
+
+def subtree_bounds(root):
+    """
+    root配下のパスを範囲検索するための下限・上限を返す
+
+    "root/" <= path < "root0"（os.sep の次の文字）で配下を判定できる
+    """
+    prefix = root.rstrip(os.sep) + os.sep
+    return prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+
+def file_signature(lora_path, sidecars):
+    """
+    LoRA本体とサイドカーのサイズ・mtimeから署名を作成（LibraryIndex.get_file_signature を参照）
+
+    Args:
+        lora_path: LoRAファイルパス
+        sidecars: {"metadata_json": パス, "info": パス}（フルパス）
+    """
+    parts = []
+    for path in (lora_path, sidecars.get("metadata_json"), sidecars.get("info")):
+        try:
+            st = os.stat(path) if path else None
+        except OSError:
+            st = None
+        parts.append(f"{st.st_size}:{st.st_mtime_ns}" if st else "-")
+    return "/".join(parts)
+
+
+class _ScanJob:
+    """時間制限付きの更新（バックグラウンドスレッドで実行）"""
+
+    def __init__(self, index, root, include_subfolders, exclude):
+        self.index = index
+        self.root = root
+        self.include_subfolders = include_subfolders
+        self.exclude = exclude
+        self.progress = ScanProgress()
+        self.started = time.time()
+        self.done = threading.Event()
+        self.timed_out = False
+        self._thread = threading.Thread(
+            target=self._run, name=f"RandomLoRAScan:{os.path.basename(root)}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.index.refresh(self.root, self.include_subfolders, self.exclude, progress=self.progress)
+        except Exception as e:
+            print(f"[RandomLoRALoader] Background scan error ({self.root}): {e}")
+        finally:
+            self.index._finish_job(self)
+            self.done.set()
+            if self.timed_out:
+                elapsed = time.time() - self.started
+                print(f"[RandomLoRALoader] Background scan finished ({elapsed:.1f}s, "
+                      f"{self.progress.entries} entries): {self.root}")
+
+
+def _in_view(dir_path, view_root, view_recursive):
+    """ディレクトリがビューの対象範囲に含まれるか"""
+    if view_recursive:
+        return is_within(dir_path, view_root)
+    return dir_path == view_root
+
+
+class LibraryIndex:
+    """LoRAファイル一覧の永続インデックス"""
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or default_index_path()
+        self._lock = threading.RLock()
+        self._conn = self._connect(self.db_path)
+        # メモリ上のファイル一覧 {(root, include_subfolders): ソート済みパスのリスト}
+        self._views = {}
+        # 一覧が変わるたびに増える番号（フィルタ結果などのキャッシュの有効性判定用）
+        self.generation = 0
+        # フォルダ監視（任意、get_library_index で設定）
+        self.watcher = None
+        # 時間制限を超えて実行中の更新 {(root, include_subfolders): _ScanJob}
+        self._jobs = {}
+        # 未書き込みのキーワードキャッシュ [(path, namespace, signature, keywords), ...]
+        self._pending_keywords = []
+
+    def _connect(self, db_path):
+        """SQLiteを開く（失敗時はメモリ上のDBで続行）"""
+        conn = None
+        if db_path != ":memory:":
+            try:
+                os.makedirs(os.path.dirname(db_path), exist_ok=True)
+                conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+                self._init_schema(conn)
+            except (OSError, sqlite3.Error) as e:
+                print(f"[RandomLoRALoader] Warning: Failed to open library index {db_path}: {e}")
+                print("[RandomLoRALoader] Using in-memory index (not persisted)")
+                conn = None
+
+        if conn is None:
+            self.db_path = ":memory:"
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            self._init_schema(conn)
+
+        return conn
+
+    def _init_schema(self, conn):
+        """スキーマ作成（バージョン不一致時は作り直し）"""
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None or row[0] != str(SCHEMA_VERSION):
+            if row is not None:
+                print("[RandomLoRALoader] Library index schema changed, rebuilding")
+            for table in ("roots", "dirs", "files", "fingerprints", "keyword_cache", "quarantine"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.executescript(_SCHEMA)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+                (str(SCHEMA_VERSION),)
+            )
+        conn.commit()
+
+    # ------------------------------------------------------------------
+    # 公開API
+    # ------------------------------------------------------------------
+
+    def list_lora_files(self, folder_path, include_subfolders, extensions=LORA_EXTENSIONS,
+                        exclude_patterns="", glob_compatible=False, refresh=True):
+        """
+        フォルダ内のLoRAファイル一覧を取得（変化したディレクトリのみ再列挙）
+
+        Args:
+            folder_path: 検索対象フォルダ
+            include_subfolders: サブフォルダを含めるか
+            extensions: 対象拡張子（小文字のタプル）
+            exclude_patterns: 除外パターン（カンマ区切りのglob、folder_path基準）
+            glob_compatible: glob.glob と同じ一致にする（隠しファイル・隠しフォルダの配下を除き、
+                             Windows 以外は拡張子の大文字小文字を区別）
+            refresh: 差分更新するか（False は直前に ensure_fresh した場合に使い、
+                     ディレクトリの stat を繰り返さない）
+
+        Returns:
+            list: LoRAファイルパスのリスト（パス順でソート済み）
+        """
+        return self.list_lora_files_for_groups(
+            [(folder_path, include_subfolders)], extensions, exclude_patterns, glob_compatible, refresh
+        )[0]
+
+    def list_lora_files_for_groups(self, requests, extensions=LORA_EXTENSIONS, exclude_patterns="",
+                                   glob_compatible=False, refresh=True):
+        """
+        複数フォルダのLoRAファイル一覧をまとめて取得
+
+        同じフォルダ・入れ子のフォルダは1回だけ差分更新し、
+        各要求の一覧はその結果から導出する。
+
+        Args:
+            requests: (フォルダ, include_subfolders) のリスト
+            extensions: 対象拡張子（小文字のタプル）
+            exclude_patterns: 除外パターン（各要求のフォルダ基準で適用）
+            glob_compatible, refresh: list_lora_files と同じ
+
+        Returns:
+            list: 要求ごとのLoRAファイルパスのリスト（requests と同じ順序）
+        """
+        normalized = [
+            (normalize_folder_path(folder_path), bool(include_subfolders))
+            for folder_path, include_subfolders in requests
+        ]
+        if refresh:
+            existing = [request for request in normalized if os.path.isdir(request[0])]
+            for root, recursive in plan_scans(existing):
+                self._ensure_fresh(root, recursive, parse_exclude_patterns(root, exclude_patterns))
+
+        results = []
+        for root, recursive in normalized:
+            if not os.path.isdir(root):
+                results.append([])
+                continue
+
+            exclude = parse_exclude_patterns(root, exclude_patterns)
+            results.append(list(self._iter_view(root, recursive, extensions, exclude, glob_compatible)))
+        return results
+
+    def iter_lora_files(self, folder_path, include_subfolders, extensions=LORA_EXTENSIONS,
+                        exclude_patterns=""):
+        """
+        フォルダ内のLoRAファイルを順に返す（一覧のコピーを作らない）
+
+        引数は list_lora_files と同じ。差分更新は最初の要素を取り出す時点で行う。
+
+        Yields:
+            str: LoRAファイルパス（パス順）
+        """
+        root = normalize_folder_path(folder_path)
+        recursive = bool(include_subfolders)
+        if not os.path.isdir(root):
+            return
+
+        exclude = parse_exclude_patterns(root, exclude_patterns)
+        self._ensure_fresh(root, recursive, exclude)
+        yield from self._iter_view(root, recursive, extensions, exclude)
+
+    def ensure_fresh(self, folder_path, include_subfolders, exclude_patterns=""):
+        """
+        フォルダの一覧を最新にする（一覧は作らない）
+
+        Returns:
+            int: 更新後の generation（同じ値の間は一覧が変わっていない）
+                 フォルダがない場合と、時間制限を超えた走査がバックグラウンドで
+                 続いている場合はNone（途中までの一覧は generation を変えずに増える）
+        """
+        root = normalize_folder_path(folder_path)
+        if not os.path.isdir(root):
+            return None
+        self._ensure_fresh(root, bool(include_subfolders), parse_exclude_patterns(root, exclude_patterns))
+        if self._find_job(root, include_subfolders) is not None:
+            return None
+        return self.generation
+
+    def _ensure_fresh(self, root, include_subfolders, exclude=None):
+        """一覧を最新にする（監視中のフォルダはバックグラウンド更新に任せる）"""
+        watcher = self.watcher
+        if watcher is not None and watcher.is_watching(root, include_subfolders, exclude):
+            if not (exclude and self._has_unscanned(root, include_subfolders, exclude)):
+                return
+        self._refresh_within_budget(root, include_subfolders, exclude)
+        if watcher is not None:
+            watcher.watch(root, include_subfolders, exclude)
+
+    def _refresh_within_budget(self, root, include_subfolders, exclude=None):
+        """
+        時間制限内で差分更新（RANDOM_LORA_SCAN_BUDGET が0以下なら制限なし）
+
+        Returns:
+            bool: 制限時間内に更新が終わった場合True
+                  （Falseの場合、更新はバックグラウンドで継続中）
+        """
+        budget = get_scan_budget()
+        if budget <= 0:
+            self.refresh(root, include_subfolders, exclude)
+            return True
+
+        job = self._find_job(root, include_subfolders)
+        if job is None:
+            key = (root, bool(include_subfolders))
+            with self._lock:
+                job = self._jobs.get(key)
+                if job is None:
+                    job = _ScanJob(self, root, bool(include_subfolders), exclude)
+                    self._jobs[key] = job
+
+        if job.done.wait(budget):
+            return True
+
+        job.timed_out = True
+        with self._lock:
+            has_listing = self._is_covered(root, include_subfolders)
+        elapsed = time.time() - job.started
+        fallback = "last complete listing" if has_listing else "partial listing"
+        print(f"[RandomLoRALoader] Warning: Scan exceeded time budget ({budget:g}s): "
+              f"{elapsed:.1f}s elapsed, {job.progress.entries} entries seen. "
+              f"Using {fallback}, scan continues in background: {root}")
+        return False
+
+    def _find_job(self, root, include_subfolders):
+        """要求を含む実行中の更新を取得"""
+        with self._lock:
+            for key, job in self._jobs.items():
+                if covers(key, (root, bool(include_subfolders))):
+                    return job
+        return None
+
+    def _finish_job(self, job):
+        with self._lock:
+            key = (job.root, job.include_subfolders)
+            if self._jobs.get(key) is job:
+                del self._jobs[key]
+
+    def list_dirs(self, folder_path, include_subfolders):
+        """インデックス済みのディレクトリ一覧を取得（未走査のディレクトリは除く）"""
+        root = normalize_folder_path(folder_path)
+        with self._lock:
+            return [
+                row[0] for row in self._query_dirs(root, include_subfolders)
+                if row[1] != UNSCANNED_MTIME
+            ]
+
+    def get_file_record(self, lora_path):
+        """
+        LoRAファイルのインデックス情報を取得
+
+        Returns:
+            dict: {"path", "size", "mtime_ns", "sidecars", "identity"}（未登録ならNone）
+                  sidecars はフルパス（get_sidecars を参照）
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT path, dir, size, mtime_ns, sidecars, identity FROM files WHERE path = ?",
+                (os.path.normpath(lora_path),)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            "path": row[0],
+            "size": row[2],
+            "mtime_ns": row[3],
+            "sidecars": resolve_sidecars(row[1], json.loads(row[4])) if row[4] else {},
+            "identity": row[5],
+        }
+
+    def get_sidecars(self, lora_path):
+        """
+        LoRAのサイドカーを取得（スキャン時に振り分け済み、ディレクトリI/Oなし）
+
+        Returns:
+            dict: {"metadata_json": パス, "info": パス, "previews": [パス, ...]}
+                  previews は優先順位順（静止画像 → アニメーション画像 → 動画）
+        """
+        record = self.get_file_record(lora_path)
+        if record is None:
+            # インデックス外のファイル（フォルダを直接列挙）
+            return find_sidecars(lora_path)
+        return record["sidecars"]
+
+    def get_file_signature(self, lora_path):
+        """
+        LoRA本体とサイドカー（.metadata.json / .info）のサイズ・mtimeから署名を作成
+
+        キャッシュの有効性判定用。どれかが変更・追加・削除されると変わる
+        （上書き保存はディレクトリのmtimeに出ないため、毎回 stat する）
+        """
+        return file_signature(lora_path, self.get_sidecars(lora_path))
+
+    def load_cached_keywords(self, lora_paths, namespace):
+        """
+        保存済みのキーワードをまとめて取得
+
+        Args:
+            lora_paths: LoRAファイルパスのリスト
+            namespace: キャッシュの種類（ノードごとの抽出方法を区別する）
+
+        Returns:
+            dict: {パス: (署名, キーワード)}（有効性は呼び出し側で署名を比較する）
+        """
+        cached = {}
+        paths = list(lora_paths)
+        with self._lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT path, signature, keywords FROM keyword_cache "
+                    f"WHERE namespace = ? AND path IN ({','.join('?' * len(chunk))})",
+                    [namespace] + chunk
+                ).fetchall()
+                for path, signature, keywords in rows:
+                    cached[path] = (signature, keywords)
+            # 未書き込みの分（後から追加したものを優先）
+            requested = set(paths)
+            for path, pending_namespace, signature, keywords in self._pending_keywords:
+                if pending_namespace == namespace and path in requested:
+                    cached[path] = (signature, keywords)
+        return cached
+
+    def store_cached_keywords(self, lora_path, namespace, signature, keywords):
+        """キーワードを保存（KEYWORD_FLUSH_SIZE 件ごとにまとめて書き込む）"""
+        with self._lock:
+            self._pending_keywords.append((lora_path, namespace, signature, keywords))
+            if len(self._pending_keywords) >= KEYWORD_FLUSH_SIZE:
+                self.flush()
+
+    def flush(self):
+        """未書き込みのキャッシュをディスクに書き込む"""
+        with self._lock:
+            if not self._pending_keywords:
+                return
+            pending, self._pending_keywords = self._pending_keywords, []
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO keyword_cache (path, namespace, signature, keywords) "
+                        "VALUES (?, ?, ?, ?)",
+                        pending
+                    )
+            except sqlite3.Error as e:
+                print(f"[RandomLoRALoader] Warning: Failed to write keyword cache: {e}")
+
+    def load_quarantine(self):
+        """
+        読み込みに失敗したファイルの記録を全件取得
+
+        Returns:
+            dict: {パス: (種類, size, mtime_ns, エラー)}
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, kind, size, mtime_ns, error FROM quarantine"
+            ).fetchall()
+        return {path: (kind, size, mtime_ns, error) for path, kind, size, mtime_ns, error in rows}
+
+    def store_quarantine(self, path, kind, size, mtime_ns, error):
+        """読み込みに失敗したファイルを記録（同じパスは上書き）"""
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO quarantine (path, kind, size, mtime_ns, error) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (path, kind, size, mtime_ns, error)
+                    )
+            except sqlite3.Error as e:
+                print(f"[RandomLoRALoader] Warning: Failed to write quarantine: {e}")
+
+    def delete_quarantine(self, path):
+        """ファイルの失敗記録を削除（更新されて読めるようになった場合）"""
+        with self._lock:
+            try:
+                with self._conn:
+                    self._conn.execute("DELETE FROM quarantine WHERE path = ?", (path,))
+            except sqlite3.Error as e:
+                print(f"[RandomLoRALoader] Warning: Failed to write quarantine: {e}")
+
+    def find_duplicates(self, lora_paths, mode="inode"):
+        """
+        同じ実体・同じ内容のLoRAを検出（テンソルは読み込まない）
+
+        Args:
+            lora_paths: LoRAファイルパスのリスト（先に出てきたものを残す）
+            mode: "inode"   - 同じ (st_dev, st_ino)（シンボリックリンク・ハードリンク）
+                  "content" - inode に加えて、内容の指紋が同じもの（コピー）
+                              サイズが他と一致するファイルのみ指紋を計算する
+
+        Returns:
+            dict: {除外するパス: 残すパス}
+        """
+        records = self._get_identity_records(lora_paths)
+
+        duplicates = {}
+        kept_by_key = {}
+        survivors = []
+        for path in lora_paths:
+            record = records.get(path)
+            if record is None:
+                continue
+            kept = kept_by_key.setdefault(record[2], path)
+            if kept != path:
+                duplicates[path] = kept
+            else:
+                survivors.append(path)
+
+        if mode != "content":
+            return duplicates
+
+        # 上書き保存はディレクトリのmtimeに出ない（インデックスのサイズ・mtimeは古い
+        # 場合がある）ため、内容の比較には現在の stat を使う
+        stats = {}
+        for path in survivors:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            stats[path] = (st.st_size, st.st_mtime_ns)
+
+        # サイズが異なれば内容も異なる（同じサイズのファイルだけ指紋を比較）
+        size_counts = {}
+        for size, _ in stats.values():
+            size_counts[size] = size_counts.get(size, 0) + 1
+        candidates = [path for path in survivors if path in stats and size_counts[stats[path][0]] > 1]
+
+        fingerprints = self._get_fingerprints(candidates, stats)
+        kept_by_key = {}
+        for path in candidates:
+            fingerprint = fingerprints.get(path)
+            if fingerprint is None:
+                continue
+            kept = kept_by_key.setdefault((stats[path][0], fingerprint), path)
+            if kept != path:
+                duplicates[path] = kept
+        return duplicates
+
+    def refresh(self, folder_path, include_subfolders, exclude=None, progress=None):
+        """
+        インデックスを差分更新
+
+        記録済みディレクトリのmtimeを比較し、変化したディレクトリだけを
+        再列挙してインデックスとメモリ上の一覧を差し替える。
+        未走査のフォルダは全走査する。.loraignore が変わったフォルダは
+        配下ごと走査し直す。
+        ファイルシステムへのアクセスはロック外で行う（バックグラウンド更新中も
+        一覧の取得をブロックしない）。
+
+        Args:
+            exclude: exclude_patterns のルール（一致したフォルダは確認しない）
+            progress: ScanProgress（時間制限の判定・途中結果の参照用）
+
+        Returns:
+            bool: 変更があった場合True
+        """
+        root = normalize_folder_path(folder_path)
+
+        with self._lock:
+            covered = self._is_covered(root, include_subfolders)
+            stored_dirs = {
+                path: (mtime_ns, ignore_mtime_ns)
+                for path, mtime_ns, ignore_mtime_ns, _ in self._query_dirs(root, include_subfolders)
+            }
+
+        if not covered or stored_dirs.get(root, (UNSCANNED_MTIME,))[0] == UNSCANNED_MTIME:
+            # 未走査のフォルダは親の再帰走査の一部なので配下も走査する
+            self.rescan(root, include_subfolders or root in stored_dirs, exclude, progress)
+            return True
+
+        # ディレクトリのmtimeのみ比較（ファイルは列挙しない）
+        changed_dirs = []
+        missing_dirs = []
+        rescan_trees = []
+        for dir_path, (mtime_ns, ignore_mtime_ns) in stored_dirs.items():
+            if exclude and exclude.match_tree(dir_path, root):
+                continue
+            if mtime_ns == UNSCANNED_MTIME:
+                rescan_trees.append(dir_path)
+                continue
+            if progress is not None:
+                progress.count()
+            try:
+                if os.stat(dir_path).st_mtime_ns != mtime_ns:
+                    changed_dirs.append(dir_path)
+            except OSError:
+                missing_dirs.append(dir_path)
+                continue
+            # .loraignore の書き換えはディレクトリのmtimeに出ない
+            if ignore_mtime_ns is not None:
+                try:
+                    current = os.stat(os.path.join(dir_path, IGNORE_FILENAME)).st_mtime_ns
+                except OSError:
+                    current = None
+                if current != ignore_mtime_ns:
+                    rescan_trees.append(dir_path)
+
+        if not changed_dirs and not missing_dirs and not rescan_trees:
+            return False
+
+        # 変化したディレクトリを再列挙
+        removed_trees = list(missing_dirs)
+        listings = []
+        for dir_path in changed_dirs:
+            listing = list_directory(
+                dir_path, rules=load_inherited_rules(dir_path),
+                exclude=exclude if include_subfolders else None
+            )
+            if listing is None:
+                removed_trees.append(dir_path)
+                continue
+            if listing.ignore_mtime_ns != stored_dirs[dir_path][1]:
+                # .loraignore が追加・削除された（配下のルールも変わる）
+                rescan_trees.append(dir_path)
+                continue
+            listings.append(listing)
+
+            if not include_subfolders:
+                continue
+
+            # 削除されたサブフォルダ（除外中のフォルダは残す）
+            current_subdirs = set(listing.subdirs) | set(listing.excluded_subdirs)
+            for stored_path in stored_dirs:
+                if os.path.dirname(stored_path) == dir_path and stored_path not in current_subdirs:
+                    removed_trees.append(stored_path)
+
+            # 新しく追加されたサブフォルダ（配下を全走査）
+            for subdir in listing.subdirs:
+                if subdir not in stored_dirs:
+                    listings.extend(scan_tree(subdir, True, rules=listing.rules, exclude=exclude,
+                                              progress=progress))
+
+        # 配下ごと走査し直すフォルダ（入れ子は外側にまとめる）
+        rescan_trees.sort()
+        tree_roots = []
+        for dir_path in rescan_trees:
+            if tree_roots and is_within(dir_path, tree_roots[-1]):
+                continue
+            tree_roots.append(dir_path)
+
+        trees = []
+        for dir_path in tree_roots:
+            recursive = bool(include_subfolders)
+            if not recursive:
+                with self._lock:
+                    recursive = self._is_covered(dir_path, True)
+            if not os.path.isdir(dir_path):
+                removed_trees.append(dir_path)
+                continue
+            tree = scan_tree(dir_path, recursive, exclude=exclude, progress=progress)
+            trees.append((dir_path, recursive))
+            listings = [listing for listing in listings if not is_within(listing.path, dir_path)]
+            listings.extend(tree)
+            if recursive:
+                removed_trees.append(dir_path)
+
+        relisted = {
+            listing.path: [os.path.join(listing.path, lora[0]) for lora in listing.loras]
+            for listing in listings
+        }
+
+        with self._lock:
+            with self._conn:
+                for dir_path, recursive in trees:
+                    self._delete_tree(dir_path, recursive)
+                for listing in listings:
+                    self._conn.execute("DELETE FROM files WHERE dir = ?", (listing.path,))
+                self._insert_listings(listings, include_subfolders)
+
+                for dir_path in removed_trees:
+                    if (dir_path, True) not in trees:
+                        self._delete_tree(dir_path, True)
+                        low, high = subtree_bounds(dir_path)
+                        for table in ("fingerprints", "keyword_cache"):
+                            self._conn.execute(
+                                f"DELETE FROM {table} WHERE path >= ? AND path < ?", (low, high)
+                            )
+
+                self._conn.execute(
+                    "UPDATE roots SET scanned_at = ? WHERE path = ?", (time.time(), root)
+                )
+
+            self._patch_views(removed_trees, relisted)
+            self.generation += 1
+
+        print(f"[RandomLoRALoader] Index updated: {len(changed_dirs)} changed, "
+              f"{len(missing_dirs)} removed, {len(tree_roots)} rescanned of "
+              f"{len(stored_dirs)} folders: {root}")
+        return True
+
+    def rescan(self, folder_path, include_subfolders, exclude=None, progress=None):
+        """フォルダを全走査してインデックスを置き換え"""
+        root = normalize_folder_path(folder_path)
+        start = time.time()
+
+        listings = scan_tree(root, include_subfolders, exclude=exclude, progress=progress)
+        file_count = sum(len(listing.loras) for listing in listings)
+
+        with self._lock:
+            with self._conn:
+                self._delete_tree(root, include_subfolders)
+                self._insert_listings(listings, include_subfolders)
+
+                row = self._conn.execute(
+                    "SELECT recursive FROM roots WHERE path = ?", (root,)
+                ).fetchone()
+                recursive = bool(include_subfolders) or bool(row and row[0])
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO roots (path, recursive, scanned_at) VALUES (?, ?, ?)",
+                    (root, int(recursive), time.time())
+                )
+
+            # 重なるビューは次回クエリで作り直す
+            for view_root, view_recursive in list(self._views):
+                if is_within(view_root, root) or is_within(root, view_root):
+                    del self._views[(view_root, view_recursive)]
+            self.generation += 1
+
+        elapsed = time.time() - start
+        print(f"[RandomLoRALoader] Indexed {file_count} LoRA files in {len(listings)} folders ({elapsed:.2f}s): {root}")
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+    # 内部処理
+    # ------------------------------------------------------------------
+
+    def _is_covered(self, root, include_subfolders):
+        """rootが必要な深さで走査済みか（親フォルダの再帰走査も含む）"""
+        candidates = [root]
+        parent = os.path.dirname(root)
+        while parent and parent != candidates[-1]:
+            candidates.append(parent)
+            parent = os.path.dirname(parent)
+
+        rows = self._conn.execute(
+            f"SELECT path, recursive FROM roots WHERE path IN ({','.join('?' * len(candidates))})",
+            candidates
+        ).fetchall()
+        return any(covers((path, recursive), (root, include_subfolders)) for path, recursive in rows)
+
+    def _partial_paths(self, root, include_subfolders):
+        """実行中の走査でこれまでに列挙したファイル（パス順）"""
+        job = self._find_job(root, include_subfolders)
+        if job is None:
+            return []
+        listings, _ = job.progress.snapshot()
+        return sorted(
+            os.path.join(listing.path, lora[0])
+            for listing in listings
+            if _in_view(listing.path, root, include_subfolders)
+            for lora in listing.loras
+        )
+
+    def _has_unscanned(self, root, include_subfolders, exclude):
+        """除外ルールに一致しない未走査のディレクトリがあるか"""
+        if not include_subfolders:
+            return False
+        low, high = subtree_bounds(root)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM dirs WHERE mtime_ns = ? AND path >= ? AND path < ?",
+                (UNSCANNED_MTIME, low, high)
+            ).fetchall()
+        return any(not exclude.match_tree(row[0], root) for row in rows)
+
+    def _count_pruned(self, root, include_subfolders):
+        """.loraignore で除外されたエントリ数"""
+        if include_subfolders:
+            low, high = subtree_bounds(root)
+            row = self._conn.execute(
+                "SELECT SUM(pruned) FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                (root, low, high)
+            ).fetchone()
+        else:
+            row = self._conn.execute("SELECT pruned FROM dirs WHERE path = ?", (root,)).fetchone()
+        return (row and row[0]) or 0
+
+    def _iter_view(self, root, include_subfolders, extensions, exclude, glob_compatible=False):
+        """
+        メモリ上の一覧から拡張子・exclude_patterns に一致するファイルを順に返す
+
+        glob_compatible の場合は glob.glob と同じく、root からの相対パスに
+        "." で始まる要素を含むファイルを除き、拡張子は GLOB_MATCH_CASE に従って比較する
+
+        除外数（一致したフォルダ（配下は数えない）とファイルの合計）は
+        最後まで取り出したときにログ出力する
+        """
+        if exclude and self._has_unscanned(root, include_subfolders, exclude):
+            # まとめた走査では別のフォルダ基準で除外された部分を走査
+            self._refresh_within_budget(root, include_subfolders, exclude)
+
+        with self._lock:
+            if self._is_covered(root, include_subfolders):
+                # ビューは差し替え式で更新されるため、ロック外で走査してよい
+                paths = self._get_view(root, include_subfolders)
+                ignored = self._count_pruned(root, include_subfolders)
+            else:
+                # 初回の走査が時間制限を超えた（途中までの結果）
+                paths = self._partial_paths(root, include_subfolders)
+                ignored = 0
+
+        excluded_prefixes = []
+        if exclude and include_subfolders:
+            excluded_prefixes = [
+                dir_path.rstrip(os.sep) + os.sep
+                for dir_path in self._list_excluded_dirs(root, exclude)
+            ]
+
+        match_case = glob_compatible and GLOB_MATCH_CASE
+        hidden_marker = os.sep + "."
+        root_length = len(root.rstrip(os.sep))
+
+        excluded_files = 0
+        for path in paths:
+            if match_case:
+                if not path.endswith(extensions):
+                    continue
+            elif not is_lora_filename(path, extensions):
+                continue
+            if glob_compatible and hidden_marker in path[root_length:]:
+                continue
+            if excluded_prefixes:
+                # 一致したフォルダの配下か（プレフィックスはソート済み・入れ子なし）
+                i = bisect.bisect_right(excluded_prefixes, path) - 1
+                if i >= 0 and path.startswith(excluded_prefixes[i]):
+                    continue
+            if exclude and exclude.match(path, False):
+                excluded_files += 1
+                continue
+            yield path
+
+        excluded = len(excluded_prefixes) + excluded_files
+        if ignored or excluded:
+            print(f"[RandomLoRALoader] Pruned {ignored + excluded} entries "
+                  f"(.loraignore: {ignored}, exclude: {excluded}): {root}")
+
+    def _list_excluded_dirs(self, root, exclude):
+        """root配下で exclude に一致するディレクトリ（一致したフォルダの配下は含めない）"""
+        low, high = subtree_bounds(root)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM dirs WHERE path >= ? AND path < ? ORDER BY path", (low, high)
+            ).fetchall()
+
+        excluded = []
+        for (dir_path,) in rows:
+            if excluded and is_within(dir_path, excluded[-1]):
+                continue
+            if exclude.match(dir_path, True):
+                excluded.append(dir_path)
+        return excluded
+
+    def _get_identity_records(self, lora_paths):
+        """
+        {パス: (size, mtime_ns, identity)} を取得
+
+        インデックスにないファイル（時間制限中の途中結果など）は stat する
+        """
+        records = {}
+        paths = list(lora_paths)
+        with self._lock:
+            for i in range(0, len(paths), 500):
+                chunk = paths[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT path, size, mtime_ns, identity FROM files "
+                    f"WHERE path IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for path, size, mtime_ns, identity in rows:
+                    if identity:
+                        records[path] = (size, mtime_ns, identity)
+
+        for path in paths:
+            if path in records:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            records[path] = (st.st_size, st.st_mtime_ns, file_identity(st))
+        return records
+
+    def _get_fingerprints(self, lora_paths, stats):
+        """
+        内容の指紋を取得（キャッシュ済みでサイズ・mtimeが一致するものは再計算しない）
+
+        Args:
+            lora_paths: LoRAファイルパスのリスト
+            stats: {パス: (size, mtime_ns)}（現在の stat、インデックスの値ではない）
+
+        Returns:
+            dict: {パス: 指紋}（読めないファイルは含まない）
+        """
+        fingerprints = {}
+        with self._lock:
+            for i in range(0, len(lora_paths), 500):
+                chunk = lora_paths[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT path, size, mtime_ns, fingerprint FROM fingerprints "
+                    f"WHERE path IN ({','.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for path, size, mtime_ns, fingerprint in rows:
+                    if stats[path] == (size, mtime_ns):
+                        fingerprints[path] = fingerprint
+
+        # 未計算・変更されたファイルのみ読み込む（ロック外）
+        computed = []
+        for path in lora_paths:
+            if path in fingerprints:
+                continue
+            fingerprint = compute_fingerprint(path)
+            if fingerprint is None:
+                continue
+            fingerprints[path] = fingerprint
+            computed.append((path, stats[path][0], stats[path][1], fingerprint))
+
+        if computed:
+            with self._lock:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT OR REPLACE INTO fingerprints (path, size, mtime_ns, fingerprint) "
+                        "VALUES (?, ?, ?, ?)",
+                        computed
+                    )
+        return fingerprints
+
+    def _get_view(self, root, include_subfolders):
+        """メモリ上のファイル一覧を取得（なければDBから作成）"""
+        key = (root, bool(include_subfolders))
+        paths = self._views.get(key)
+        if paths is None:
+            paths = self._query_paths(root, include_subfolders)
+            self._views[key] = paths
+        return paths
+
+    def _patch_views(self, removed_trees, relisted):
+        """
+        メモリ上のファイル一覧を差分更新
+
+        既存のリストは変更せず差し替える（iter_lora_files で走査中の一覧を壊さない）
+
+        Args:
+            removed_trees: 配下ごと削除されたディレクトリのリスト
+            relisted: {ディレクトリ: 直下のファイルパスのリスト}
+        """
+        for key, paths in list(self._views.items()):
+            view_root, view_recursive = key
+            patched = paths
+            for dir_path in removed_trees:
+                if not _in_view(dir_path, view_root, view_recursive):
+                    continue
+                low, high = subtree_bounds(dir_path)
+                start = bisect.bisect_left(patched, low)
+                end = bisect.bisect_left(patched, high)
+                if start < end:
+                    patched = patched[:start] + patched[end:]
+
+            for dir_path, new_paths in relisted.items():
+                if not _in_view(dir_path, view_root, view_recursive):
+                    continue
+                # 直下のファイルのみ差し替え（サブフォルダ配下はそのまま）
+                low, high = subtree_bounds(dir_path)
+                start = bisect.bisect_left(patched, low)
+                end = bisect.bisect_left(patched, high)
+                kept = [p for p in patched[start:end] if os.path.dirname(p) != dir_path]
+                patched = patched[:start] + sorted(kept + new_paths) + patched[end:]
+
+            if patched is not paths:
+                self._views[key] = patched
+
+    def _query_dirs(self, root, include_subfolders):
+        columns = "path, mtime_ns, ignore_mtime_ns, pruned"
+        if include_subfolders:
+            low, high = subtree_bounds(root)
+            return self._conn.execute(
+                f"SELECT {columns} FROM dirs WHERE path = ? OR (path >= ? AND path < ?)",
+                (root, low, high)
+            ).fetchall()
+        return self._conn.execute(
+            f"SELECT {columns} FROM dirs WHERE path = ?", (root,)
+        ).fetchall()
+
+    def _query_paths(self, root, include_subfolders):
+        if include_subfolders:
+            low, high = subtree_bounds(root)
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE dir = ? OR (dir >= ? AND dir < ?) ORDER BY path",
+                (root, low, high)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE dir = ? ORDER BY path", (root,)
+            ).fetchall()
+        return [r[0] for r in rows]
+
+    def _delete_tree(self, root, include_subfolders):
+        if include_subfolders:
+            low, high = subtree_bounds(root)
+            self._conn.execute(
+                "DELETE FROM files WHERE dir = ? OR (dir >= ? AND dir < ?)", (root, low, high)
+            )
+            self._conn.execute(
+                "DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)", (root, low, high)
+            )
+        else:
+            self._conn.execute("DELETE FROM files WHERE dir = ?", (root,))
+            self._conn.execute("DELETE FROM dirs WHERE path = ?", (root,))
+
+    def _insert_listings(self, listings, include_subfolders=True):
+        for listing in listings:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO dirs (path, mtime_ns, ignore_mtime_ns, pruned) "
+                "VALUES (?, ?, ?, ?)",
+                (listing.path, listing.mtime_ns, listing.ignore_mtime_ns, listing.pruned)
+            )
+            if include_subfolders:
+                # 除外で降りなかったフォルダは未走査として記録（走査済みなら残す）
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO dirs (path, mtime_ns) VALUES (?, ?)",
+                    [(subdir, UNSCANNED_MTIME) for subdir in listing.excluded_subdirs]
+                )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, dir, name, size, mtime_ns, sidecars, identity) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (os.path.join(listing.path, name), listing.path, name, size, mtime_ns,
+                     json.dumps(sidecars) if sidecars else None, identity)
+                    for name, size, mtime_ns, sidecars, identity in listing.loras
+                ]
+            )
+
+
+_library_index = None
+_library_index_lock = threading.Lock()
+
+
+def get_library_index():
+    """全ノード共通のインデックスを取得（初回のみ作成）"""
+    global _library_index
+    with _library_index_lock:
+        if _library_index is None:
+            _library_index = LibraryIndex()
+            atexit.register(_library_index.flush)
+
+            # フォルダ監視（RANDOM_LORA_WATCH で有効化）
+            watch_mode = get_watch_mode()
+            if watch_mode != "off":
+                _library_index.watcher = FolderWatcher(_library_index, mode=watch_mode)
+        return _library_index
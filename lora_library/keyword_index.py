@@ -0,0 +1,373 @@
+"""
+キーワードフィルタ用の転置インデックス
+
+_filter_lora_files はファイルごとに「ファイル名 + メタデータのキーワード」の
+文字列を作り、全キーワードとの部分一致を毎回線形に調べていた。ここでは
+検索対象の文字列をトークン（スペース区切りの語）に分け、トークン → 文書ID
+の転置リストを持つ。
+
+  - 文書はLoRAのパスごとに1つ（内容が変わった場合だけ索引し直す）
+  - キーワードはスペースで区切った断片ごとに「断片を含むトークン」を語彙から探し、
+    その転置リストの和集合を候補にする（部分一致のまま: "ani" は anime_style に一致）
+  - 語彙はトークンの3文字組（trigram）でも索引する。3文字以上の断片は断片の
+    3文字組をすべて含むトークンだけを候補にし、部分一致を確認する
+    （語彙全体を走査しない）。2文字以下の断片は語彙を走査する
+  - 文字単位（コードポイント）で扱うので日本語などのCJKも同じように一致する。
+    検索対象とキーワードは NFC に正規化する（macOS の濁点分解などの違いをなくす）
+  - AND は候補の積集合、OR は和集合
+  - スペースを含むキーワード（"anime style" のようなフレーズ）は候補の文字列で
+    部分一致を確認する（断片ごとの一致だけでは並び順を保証できないため）
+
+文書はトークンID列（compact モジュール）、転置リストは array('I') で持つ。
+索引し直した文書・削除されたファイルの文書の古いIDは転置リストに残し、
+無効な文書が有効な文書より多くなったら作り直す。2回目以降の呼び出しで内容が
+変わっていなければ、ファイルごとの処理は文書IDの参照とハッシュの比較（いずれも一括）だけになる。
+"""
+
+import os
+import threading
+import unicodedata
+from array import array
+from itertools import compress
+
+from .compact import TOKEN_TYPECODE, decode_text, encode_text, get_token_table
+
+
+# 無効な文書がこの数と有効な文書数を超えたら転置リストを作り直す
+COMPACT_MIN_DEAD = 1024
+
+# 登録済みの文書数がこの数と前回の確認時の2倍を超えたら、削除されたファイルの文書を探す
+PRUNE_MIN_DOCS = 4096
+
+# 断片 → トークンの対応を覚えておく数（超えたら破棄）
+MATCH_CACHE_SIZE = 4096
+
+# ファイル名のみの検索に使うインデックス
+FILENAME_NAMESPACE = "filename"
+
+
+def filename_search_text(lora_path):
+    """ファイル名検索の対象（拡張子なしのファイル名、小文字）"""
+    return os.path.splitext(os.path.basename(lora_path))[0].lower()
+
+
+# 語彙の索引に使う文字組の長さ
+NGRAM = 3
+
+
+def normalize_search_text(text):
+    """検索用の正規化（NFC）"""
+    return unicodedata.normalize("NFC", text)
+
+
+def _ngrams(text):
+    """文字列に含まれる NGRAM 文字組（重複なし）"""
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def _phrase_pieces(keyword):
+    """キーワードをスペースで区切った断片（空の断片は除く）"""
+    return [piece for piece in keyword.split(" ") if piece]
+
+
+class KeywordIndex:
+    """検索対象の文字列（小文字）からLoRAを引く転置インデックス（スレッドセーフ）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # パス → 文書ID
+        self._ids = {}
+        # 文書ID → (パス, トークンID列)（無効な文書はNone）
+        self._docs = []
+        # 文書ID → 内容のハッシュ（変更の判定用）
+        self._hashes = []
+        self._dead = 0
+        self._prune_at = PRUNE_MIN_DOCS
+        # トークン → 文書IDの配列
+        self._postings = {}
+        # 3文字組 → 3文字組を含むトークンのリスト
+        self._ngram_tokens = {}
+        # キーワードの断片 → 断片を含むトークンのリスト（語彙が増えたら破棄）
+        self._match_cache = {}
+        # キーワードの断片 → 候補の文書ID（文書が増えたら破棄）
+        self._candidate_cache = {}
+
+    def __len__(self):
+        return len(self._ids)
+
+    def filter(self, lora_paths, texts, keywords, filter_mode="OR"):
+        """
+        キーワードに一致するLoRAを絞り込む
+
+        Args:
+            lora_paths: LoRAファイルパスのリスト
+            texts: パスごとの検索対象文字列（小文字）のリスト、または
+                   パスから検索対象文字列を作る関数（登録済みのパスは呼ばない）
+            keywords: _parse_keywords の結果（小文字）
+            filter_mode: "AND"（全キーワードに一致）/ "OR"（いずれかに一致）
+
+        Returns:
+            list: 一致したパス（lora_paths の順序）
+        """
+        with self._lock:
+            doc_ids, get_text = self._sync_documents(lora_paths, texts)
+            matched = self._search(keywords, filter_mode, get_text)
+            self._prune_missing(lora_paths)
+            self._maybe_compact()
+        return list(compress(lora_paths, map(matched.__contains__, doc_ids)))
+
+    def match(self, lora_paths, texts, keywords):
+        """
+        キーワードごとに一致するLoRAを調べる（クエリの評価用）
+
+        Args:
+            lora_paths, texts: filter と同じ
+            keywords: キーワード（小文字）のリスト
+
+        Returns:
+            list: キーワードごとの一致マスク（lora_paths の各要素に 1 / 0 の bytes）
+        """
+        with self._lock:
+            doc_ids, get_text = self._sync_documents(lora_paths, texts)
+            masks = []
+            for keyword in keywords:
+                matched = self._match_keyword(normalize_search_text(keyword), get_text)
+                masks.append(bytes(map(matched.__contains__, doc_ids)))
+            self._prune_missing(lora_paths)
+            self._maybe_compact()
+        return masks
+
+    def _sync_documents(self, lora_paths, texts):
+        """文書を最新にして (文書IDのリスト, 文書ID → 検索対象文字列の関数) を返す"""
+        if callable(texts):
+            return self._ensure_documents(lora_paths, texts), self._decode_document
+        doc_ids = self._update_documents(lora_paths, texts)
+        return doc_ids, _LazyTexts(doc_ids, texts).get
+
+    # ------------------------------------------------------------------
+    # 文書の登録
+    # ------------------------------------------------------------------
+
+    def _ensure_documents(self, paths, text_func):
+        """登録済みならそのID、未登録なら text_func(path) を索引して新しいID"""
+        doc_ids = list(map(self._ids.get, paths))
+        if None in doc_ids:
+            for i, (path, doc_id) in enumerate(zip(paths, doc_ids)):
+                if doc_id is None:
+                    doc_ids[i] = self._add_document(path, text_func(path))
+        return doc_ids
+
+    def _update_documents(self, paths, texts):
+        """内容が変わった文書だけ索引し直し、文書IDのリストを返す"""
+        doc_ids = list(map(self._ids.get, paths))
+        text_hashes = list(map(hash, texts))
+        # 登録済みで内容が同じ（2回目以降のほとんど）なら1件ずつの処理をしない
+        if None not in doc_ids and list(map(self._hashes.__getitem__, doc_ids)) == text_hashes:
+            return doc_ids
+
+        hashes = self._hashes
+        for i, (path, doc_id, text, text_hash) in enumerate(zip(paths, doc_ids, texts, text_hashes)):
+            if doc_id is not None:
+                if hashes[doc_id] == text_hash:
+                    continue
+                self._docs[doc_id] = None
+                self._dead += 1
+            doc_ids[i] = self._add_document(path, text, text_hash)
+        return doc_ids
+
+    def _add_document(self, path, text, text_hash=None):
+        doc_id = len(self._docs)
+        token_ids = encode_text(normalize_search_text(text))
+        self._docs.append((path, token_ids))
+        self._hashes.append(hash(text) if text_hash is None else text_hash)
+        self._ids[path] = doc_id
+        self._index_tokens(doc_id, token_ids)
+        self._candidate_cache.clear()
+        return doc_id
+
+    def _index_tokens(self, doc_id, token_ids):
+        postings = self._postings
+        for token in dict.fromkeys(get_token_table().decode(token_ids)):
+            if not token:
+                continue
+            posting = postings.get(token)
+            if posting is None:
+                posting = postings[token] = array(TOKEN_TYPECODE)
+                self._index_ngrams(token)
+                self._match_cache.clear()
+            posting.append(doc_id)
+
+    def _index_ngrams(self, token):
+        ngram_tokens = self._ngram_tokens
+        for ngram in _ngrams(token):
+            tokens = ngram_tokens.get(ngram)
+            if tokens is None:
+                ngram_tokens[ngram] = [token]
+            else:
+                tokens.append(token)
+
+    def _decode_document(self, doc_id):
+        """文書の検索対象文字列（無効な文書はNone）"""
+        doc = self._docs[doc_id]
+        return None if doc is None else decode_text(doc[1])
+
+    def _prune_missing(self, lora_paths):
+        """
+        文書が増えたら、今回の対象以外で存在しなくなったパスの文書を無効にする
+
+        別のフォルダで呼ばれた文書は残す。確認は文書数が倍になるごとなので
+        stat の回数は追加した文書数に比例する
+        """
+        if len(self._ids) < self._prune_at:
+            return
+        current = set(lora_paths)
+        for path in [path for path in self._ids if path not in current and not os.path.exists(path)]:
+            self._docs[self._ids.pop(path)] = None
+            self._dead += 1
+        self._prune_at = max(PRUNE_MIN_DOCS, len(self._ids) * 2)
+
+    def _maybe_compact(self):
+        """無効な文書が多くなったら文書IDを振り直して転置リストを作り直す"""
+        if self._dead < COMPACT_MIN_DEAD or self._dead <= len(self._ids):
+            return
+        live = [doc_id for doc_id, doc in enumerate(self._docs) if doc is not None]
+        self._docs = [self._docs[doc_id] for doc_id in live]
+        self._hashes = [self._hashes[doc_id] for doc_id in live]
+        self._ids = {doc[0]: doc_id for doc_id, doc in enumerate(self._docs)}
+        self._dead = 0
+        self._postings = {}
+        self._ngram_tokens = {}
+        self._match_cache = {}
+        self._candidate_cache = {}
+        for doc_id, doc in enumerate(self._docs):
+            self._index_tokens(doc_id, doc[1])
+
+    # ------------------------------------------------------------------
+    # 検索
+    # ------------------------------------------------------------------
+
+    def _matching_tokens(self, piece):
+        """断片を部分文字列として含むトークン"""
+        tokens = self._match_cache.get(piece)
+        if tokens is None:
+            if len(piece) < NGRAM:
+                tokens = [token for token in self._postings if piece in token]
+            else:
+                tokens = self._ngram_candidates(piece)
+                if len(piece) > NGRAM:
+                    # 3文字組がすべて含まれていても並びが違う場合がある
+                    tokens = [token for token in tokens if piece in token]
+            if len(self._match_cache) >= MATCH_CACHE_SIZE:
+                self._match_cache.clear()
+            self._match_cache[piece] = tokens
+        return tokens
+
+    def _ngram_candidates(self, piece):
+        """断片の3文字組をすべて含むトークン"""
+        lists = []
+        for ngram in _ngrams(piece):
+            tokens = self._ngram_tokens.get(ngram)
+            if not tokens:
+                return []
+            lists.append(tokens)
+        lists.sort(key=len)
+        if len(lists) == 1:
+            return list(lists[0])
+        candidates = set(lists[0])
+        for tokens in lists[1:]:
+            candidates.intersection_update(tokens)
+            if not candidates:
+                return []
+        return list(candidates)
+
+    def _piece_candidates(self, piece):
+        """断片を含むトークンを持つ文書ID（無効な文書を含む）"""
+        doc_ids = self._candidate_cache.get(piece)
+        if doc_ids is None:
+            doc_ids = set()
+            for token in self._matching_tokens(piece):
+                doc_ids.update(self._postings[token])
+            doc_ids = frozenset(doc_ids)
+            if len(self._candidate_cache) >= MATCH_CACHE_SIZE:
+                self._candidate_cache.clear()
+            self._candidate_cache[piece] = doc_ids
+        return doc_ids
+
+    def _match_keyword(self, keyword, get_text):
+        """
+        キーワードに一致する文書ID
+
+        無効な文書や今回の対象外の文書を含むことがある（呼び出し側で対象の文書IDと照合する）
+        """
+        pieces = _phrase_pieces(keyword)
+        if " " not in keyword:
+            # 断片が1つ: トークンに含まれていれば文字列にも含まれる
+            return self._piece_candidates(keyword)
+
+        if pieces:
+            candidates = None
+            for piece in sorted(set(pieces), key=len, reverse=True):
+                doc_ids = self._piece_candidates(piece)
+                candidates = doc_ids if candidates is None else candidates & doc_ids
+                if not candidates:
+                    return frozenset()
+        else:
+            # スペースだけのキーワード: 全文書を確認
+            candidates = range(len(self._docs))
+
+        # フレーズ: 候補の文字列で並び順を含めて確認
+        matched = set()
+        for doc_id in candidates:
+            text = get_text(doc_id)
+            if text is not None and keyword in normalize_search_text(text):
+                matched.add(doc_id)
+        return matched
+
+    def _search(self, keywords, filter_mode, get_text):
+        keywords = [normalize_search_text(keyword) for keyword in keywords]
+        if filter_mode == "AND":
+            result = None
+            # 一致の少ないキーワード（長いもの）から絞り込む
+            for keyword in sorted(set(keywords), key=len, reverse=True):
+                matched = self._match_keyword(keyword, get_text)
+                result = matched if result is None else result & matched
+                if not result:
+                    return frozenset()
+            return result or frozenset()
+
+        result = set()
+        for keyword in set(keywords):
+            result |= self._match_keyword(keyword, get_text)
+        return result
+
+
+class _LazyTexts:
+    """文書ID → 今回渡された検索対象文字列（フレーズの確認時に初めて対応表を作る）"""
+
+    def __init__(self, doc_ids, texts):
+        self._doc_ids = doc_ids
+        self._texts = texts
+        self._by_id = None
+
+    def get(self, doc_id):
+        if self._by_id is None:
+            self._by_id = dict(zip(self._doc_ids, self._texts))
+        return self._by_id.get(doc_id)
+
+
+_keyword_indexes = {}
+_keyword_indexes_lock = threading.Lock()
+
+
+def get_keyword_index(namespace):
+    """
+    キーワードインデックスを取得（全ノード共通）
+
+    Args:
+        namespace: 検索対象の種類（ファイル名のみ / ファイル名 + メタデータ）
+    """
+    with _keyword_indexes_lock:
+        index = _keyword_indexes.get(namespace)
+        if index is None:
+            index = _keyword_indexes[namespace] = KeywordIndex()
+        return index
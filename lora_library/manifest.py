@@ -0,0 +1,401 @@
+"""
+フォルダごとのマニフェスト（任意機能）
+
+読み取り専用の共有ライブラリ向け。フォルダ内の全LoRAについて、サイドカーから
+取り出したメタデータ・埋め込みメタデータ・使うプレビュー画像をまとめた
+.randomlora_manifest.json をツールで作っておくと、ノードはサイドカーや
+LoRA本体を開かずにマニフェスト1回の読み込みで済む。
+
+  - マニフェストの中のパスはフォルダからの相対パス（ライブラリごと各ワーカーに配布できる）
+  - 記録はLoRA本体・サイドカーのサイズ・mtimeと一致する場合のみ使う
+    （コピー時にmtimeを保持しない場合は使われず、従来どおり各ファイルを読む）
+  - 作成・更新: python -m lora_library.manifest_cli build <フォルダ> [--recursive]
+    既存のマニフェストのうち最新の記録は再利用し、変わったLoRAだけ読み直す
+  - 確認:       python -m lora_library.manifest_cli check <フォルダ> [--recursive]
+
+設定（環境変数）:
+  RANDOM_LORA_MANIFEST  1: マニフェストを使う（デフォルト） / 0: 使わない
+"""
+
+import json
+import os
+import threading
+import time
+
+from .cache import BoundedCache, estimate_size, get_cache_budget
+from .index import file_signature, get_library_index
+from .scanner import (
+    LORA_EXTENSIONS,
+    PREVIEW_ANIMATED_EXTENSIONS,
+    PREVIEW_STATIC_EXTENSIONS,
+    SidecarGrouper,
+    resolve_sidecars,
+)
+from .safetensors_header import (
+    SafetensorsHeaderError,
+    TagFrequencySummary,
+    read_safetensors_metadata,
+    reduce_embedded_metadata,
+)
+from .sidecar_json import extract_fields
+
+
+MANIFEST_NAME = ".randomlora_manifest.json"
+MANIFEST_VERSION = 1
+
+# マニフェストの有無・更新を確認し直す間隔（秒、確認のたびに stat しないため）
+MANIFEST_RECHECK_SECONDS = 30.0
+
+_manifest_cache = None
+_manifest_cache_lock = threading.Lock()
+
+
+def is_manifest_enabled():
+    """マニフェストを使うか"""
+    value = os.environ.get("RANDOM_LORA_MANIFEST", "1").strip().lower()
+    return value not in ("0", "off", "false", "no")
+
+
+def _get_manifest_cache():
+    global _manifest_cache
+    with _manifest_cache_lock:
+        if _manifest_cache is None:
+            _manifest_cache = BoundedCache(get_cache_budget("manifests"), name="Manifest cache")
+        return _manifest_cache
+
+
+class _CachedManifest:
+    """
+    キャッシュしたマニフェスト
+
+    再確認で変わっていなければ checked_at だけを書き換える
+    （エントリの辞書をキャッシュに入れ直してサイズを数え直さない）
+    """
+
+    __slots__ = ("checked_at", "stat_key", "entries")
+
+    def __init__(self, checked_at, stat_key, entries):
+        self.checked_at = checked_at
+        self.stat_key = stat_key
+        self.entries = entries
+
+
+def _read_manifest_file(manifest_path):
+    """マニフェストを読み込み、エントリの辞書を返す（形式が違う場合はValueError）"""
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"unsupported manifest version: {data.get('version') if isinstance(data, dict) else data!r}")
+    entries = data.get("entries")
+    if not isinstance(entries, dict):
+        raise ValueError("manifest has no entries")
+    return entries
+
+
+def load_manifest(dir_path):
+    """
+    フォルダのマニフェストを取得（MANIFEST_RECHECK_SECONDS ごとに更新を確認）
+
+    Returns:
+        dict: {LoRAファイル名: エントリ}（マニフェストがない・読めない場合はNone）
+    """
+    cache = _get_manifest_cache()
+    now = time.monotonic()
+    cached = cache.get(dir_path)
+    if cached is not None and now - cached.checked_at < MANIFEST_RECHECK_SECONDS:
+        return cached.entries
+
+    manifest_path = os.path.join(dir_path, MANIFEST_NAME)
+    try:
+        st = os.stat(manifest_path)
+    except OSError:
+        cache[dir_path] = _CachedManifest(now, None, None)
+        return None
+
+    stat_key = (st.st_size, st.st_mtime_ns)
+    if cached is not None and cached.stat_key == stat_key:
+        cached.checked_at = now
+        return cached.entries
+
+    entries = None
+    if st.st_size > cache.max_bytes:
+        # 読み込んだ辞書はファイルより大きいため、読まずに使わない
+        print(f"[RandomLoRALoader] Warning: Ignoring manifest {manifest_path}: "
+              f"{st.st_size / 1048576:.1f} MB exceeds the manifest cache "
+              f"({cache.max_bytes / 1048576:.1f} MB, see RANDOM_LORA_CACHE_MB)")
+    else:
+        try:
+            entries = _read_manifest_file(manifest_path)
+        except (OSError, ValueError) as e:
+            print(f"[RandomLoRALoader] Warning: Ignoring manifest {manifest_path}: {e}")
+        else:
+            entries = _fit_cache(cache, manifest_path, entries)
+
+    # 使わない場合も記録し、マニフェストが変わるまで読み直さない（警告も1回だけ）
+    cache[dir_path] = _CachedManifest(now, stat_key, entries)
+    return entries
+
+
+def _fit_cache(cache, manifest_path, entries):
+    """キャッシュの上限を超えるマニフェストは使わない（保持できず、LoRAごとに読み直すため）"""
+    size = estimate_size(entries)
+    if size <= cache.max_bytes:
+        return entries
+    print(f"[RandomLoRALoader] Warning: Ignoring manifest {manifest_path}: "
+          f"{size / 1048576:.1f} MB in memory exceeds the manifest cache "
+          f"({cache.max_bytes / 1048576:.1f} MB, see RANDOM_LORA_CACHE_MB)")
+    return None
+
+
+def get_manifest_entry(lora_path, st=None):
+    """
+    LoRAのマニフェストのエントリを取得（LoRA本体のサイズ・mtimeが一致する場合のみ）
+
+    Args:
+        lora_path: LoRAファイルパス
+        st: lora_path の os.stat 結果（省略時は取得する）
+
+    Returns:
+        dict: エントリ（ない・古い場合はNone）
+    """
+    if not is_manifest_enabled():
+        return None
+    entries = load_manifest(os.path.dirname(lora_path))
+    if not entries:
+        return None
+    entry = entries.get(os.path.basename(lora_path))
+    if not isinstance(entry, dict):
+        return None
+    if st is None:
+        try:
+            st = os.stat(lora_path)
+        except OSError:
+            return None
+    if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+        return None
+    return entry
+
+
+def get_manifest_metadata(lora_path, signature=None):
+    """
+    マニフェストのサイドカーのメタデータを取得（サイドカーも含めて最新の場合のみ）
+
+    Returns:
+        tuple: (見つかったか, メタデータ)
+               メタデータがNoneならサイドカーがない・読めない（埋め込みメタデータを使う）
+    """
+    entry = get_manifest_entry(lora_path)
+    if entry is None or "metadata" not in entry:
+        return False, None
+    if signature is None:
+        signature = get_library_index().get_file_signature(lora_path)
+    if entry.get("signature") != signature:
+        return False, None
+    return True, entry["metadata"]
+
+
+def get_manifest_embedded(lora_path, st=None):
+    """
+    マニフェストの埋め込みメタデータを取得（read_embedded_metadata と同じ形）
+
+    ノードは先にこれを確認し、見つからない場合だけ read_embedded_metadata でLoRA本体を読む
+
+    Returns:
+        tuple: (見つかったか, 埋め込みメタデータ（ない場合はNone）)
+    """
+    entry = get_manifest_entry(lora_path, st)
+    if entry is None or "embedded" not in entry:
+        return False, None
+    embedded = entry["embedded"]
+    if embedded is None:
+        return True, None
+    embedded = dict(embedded)
+    if "ss_tag_frequency" in embedded:
+        embedded["ss_tag_frequency"] = TagFrequencySummary.from_tags(**embedded["ss_tag_frequency"])
+    return True, embedded
+
+
+def get_preview_candidates(lora_path):
+    """
+    プレビュー候補を優先順位順に取得
+
+    マニフェストに読み込めることを確認済みのプレビューがあれば先頭にする
+    （読み込めない候補を順に試さない）
+    """
+    previews = get_library_index().get_sidecars(lora_path).get("previews", [])
+    entry = get_manifest_entry(lora_path)
+    if entry is not None and entry.get("preview"):
+        preview_path = os.path.join(os.path.dirname(lora_path), entry["preview"])
+        if preview_path in previews:
+            return [preview_path] + [p for p in previews if p != preview_path]
+    return previews
+
+
+# ----------------------------------------------------------------------
+# 作成（ツール）
+# ----------------------------------------------------------------------
+
+def _embedded_to_json(embedded):
+    """埋め込みメタデータを保存できる形に変換（タグの解析エラーがある場合はNone）"""
+    result = dict(embedded)
+    if "ss_tag_frequency" in result:
+        tags = result["ss_tag_frequency"].to_dict()
+        if tags is None:
+            return None
+        result["ss_tag_frequency"] = tags
+    return result
+
+
+def _is_loadable_preview(preview_path):
+    """プレビューが読み込めるか（Pillowがない場合・動画は確認しない）"""
+    if not preview_path.lower().endswith(PREVIEW_STATIC_EXTENSIONS + PREVIEW_ANIMATED_EXTENSIONS):
+        return True
+    try:
+        from PIL import Image
+    except ImportError:
+        return True
+    try:
+        with Image.open(preview_path) as img:
+            img.verify()
+        return True
+    except Exception:
+        return False
+
+
+def build_entry(dir_path, lora_name, sidecar_names, st, verify_previews=True):
+    """
+    LoRA 1つ分のエントリを作成
+
+    メタデータの優先順位はノードの _load_json_metadata と同じ
+    （.metadata.json → .info、読めないものは次へ）
+    """
+    lora_path = os.path.join(dir_path, lora_name)
+    sidecars = resolve_sidecars(dir_path, sidecar_names)
+    entry = {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "signature": file_signature(lora_path, sidecars),
+    }
+
+    metadata = None
+    for key in ("metadata_json", "info"):
+        sidecar_path = sidecars.get(key)
+        if not sidecar_path:
+            continue
+        try:
+            with open(sidecar_path, 'r', encoding='utf-8') as f:
+                metadata = extract_fields(f.read())
+            break
+        except (OSError, ValueError) as e:
+            print(f"  Warning: Failed to load {sidecar_path}: {e}")
+    entry["metadata"] = metadata
+
+    if lora_name.lower().endswith(".safetensors"):
+        try:
+            embedded = reduce_embedded_metadata(read_safetensors_metadata(lora_path))
+        except (OSError, SafetensorsHeaderError) as e:
+            # 記録しない（ノードが読み込んで通常どおりエラーを扱う）
+            print(f"  Warning: Failed to read header of {lora_path}: {e}")
+        else:
+            if embedded is None:
+                entry["embedded"] = None
+            else:
+                converted = _embedded_to_json(embedded)
+                if converted is not None:
+                    entry["embedded"] = converted
+
+    entry["preview"] = None
+    for preview_name in sidecar_names.get("previews", []):
+        if not verify_previews or _is_loadable_preview(os.path.join(dir_path, preview_name)):
+            entry["preview"] = preview_name
+            break
+
+    return entry
+
+
+def _list_folder(dir_path):
+    """フォルダのLoRAとサイドカーを列挙 {LoRAファイル名: (stat, サイドカー名)}"""
+    with os.scandir(dir_path) as it:
+        files = {entry.name: entry for entry in it if entry.is_file()}
+    grouper = SidecarGrouper(list(files))
+    return {
+        name: (entry.stat(), grouper.group(name))
+        for name, entry in sorted(files.items())
+        if name.lower().endswith(LORA_EXTENSIONS)
+    }
+
+
+def _is_fresh(entry, dir_path, lora_name, sidecar_names, st):
+    """既存のエントリがそのまま使えるか"""
+    if not isinstance(entry, dict):
+        return False
+    if entry.get("size") != st.st_size or entry.get("mtime_ns") != st.st_mtime_ns:
+        return False
+    sidecars = resolve_sidecars(dir_path, sidecar_names)
+    if entry.get("signature") != file_signature(os.path.join(dir_path, lora_name), sidecars):
+        return False
+    preview = entry.get("preview")
+    return preview is None or preview in sidecar_names.get("previews", [])
+
+
+def build_manifest(dir_path, force=False, verify_previews=True):
+    """
+    フォルダのマニフェストを作成・更新（最新のエントリは再利用）
+
+    Returns:
+        tuple: (LoRA数, 作り直したエントリ数, 書き込んだか)
+    """
+    manifest_path = os.path.join(dir_path, MANIFEST_NAME)
+    try:
+        old_entries = {} if force else _read_manifest_file(manifest_path)
+    except (OSError, ValueError):
+        old_entries = {}
+
+    entries = {}
+    rebuilt = 0
+    for lora_name, (st, sidecar_names) in _list_folder(dir_path).items():
+        old = old_entries.get(lora_name)
+        if _is_fresh(old, dir_path, lora_name, sidecar_names, st):
+            entries[lora_name] = old
+            continue
+        entries[lora_name] = build_entry(dir_path, lora_name, sidecar_names, st, verify_previews)
+        rebuilt += 1
+
+    if not entries and not old_entries:
+        return 0, 0, False
+    if not force and entries == old_entries:
+        return len(entries), 0, False
+
+    data = {"version": MANIFEST_VERSION, "generated_at": time.time(), "entries": entries}
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, manifest_path)
+
+    # 同じプロセスのノードが再確認の間隔を待たずに新しいマニフェストを使えるようにする
+    st = os.stat(manifest_path)
+    cache = _get_manifest_cache()
+    cache[dir_path] = _CachedManifest(
+        time.monotonic(), (st.st_size, st.st_mtime_ns), _fit_cache(cache, manifest_path, entries)
+    )
+    return len(entries), rebuilt, True
+
+
+def check_manifest(dir_path):
+    """
+    マニフェストの古いエントリを数える
+
+    Returns:
+        tuple: (LoRA数, 古い・ないエントリ数, 削除されたLoRAのエントリ数)
+    """
+    try:
+        entries = _read_manifest_file(os.path.join(dir_path, MANIFEST_NAME))
+    except (OSError, ValueError):
+        entries = {}
+    listing = _list_folder(dir_path)
+    stale = sum(
+        1 for lora_name, (st, sidecar_names) in listing.items()
+        if not _is_fresh(entries.get(lora_name), dir_path, lora_name, sidecar_names, st)
+    )
+    removed = sum(1 for lora_name in entries if lora_name not in listing)
+    return len(listing), stale, removed
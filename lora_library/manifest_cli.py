@@ -0,0 +1,60 @@
+"""
+マニフェストの作成・確認ツール（manifest モジュール参照）
+
+  python -m lora_library.manifest_cli build <フォルダ> [--recursive] [--force] [--no-verify-previews]
+  python -m lora_library.manifest_cli check <フォルダ> [--recursive]
+
+check は古い・削除されたエントリがあるフォルダがあれば終了コード1を返す。
+"""
+
+import argparse
+import os
+import sys
+
+from .manifest import MANIFEST_NAME, build_manifest, check_manifest
+
+
+def _iter_folders(root, recursive):
+    if not recursive:
+        yield root
+        return
+    for dir_path, dir_names, _ in os.walk(root):
+        dir_names.sort()
+        yield dir_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m lora_library.manifest_cli",
+        description="Build or check per-folder LoRA manifests (" + MANIFEST_NAME + ")",
+    )
+    parser.add_argument("command", choices=["build", "check"])
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--recursive", "-r", action="store_true", help="include subfolders")
+    parser.add_argument("--force", action="store_true", help="build: rebuild every entry")
+    parser.add_argument("--no-verify-previews", action="store_true",
+                        help="build: do not open preview images to check they load")
+    args = parser.parse_args(argv)
+
+    stale_folders = 0
+    for root in args.folders:
+        for dir_path in _iter_folders(os.path.abspath(root), args.recursive):
+            if args.command == "build":
+                total, rebuilt, written = build_manifest(
+                    dir_path, force=args.force, verify_previews=not args.no_verify_previews
+                )
+                if total:
+                    status = "written" if written else "up to date"
+                    print(f"{dir_path}: {total} LoRAs, {rebuilt} rebuilt ({status})")
+            else:
+                total, stale, removed = check_manifest(dir_path)
+                if total or removed:
+                    print(f"{dir_path}: {total} LoRAs, {stale} stale, {removed} removed")
+                    if stale or removed:
+                        stale_folders += 1
+
+    return 1 if stale_folders else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
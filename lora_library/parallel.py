@@ -0,0 +1,104 @@
+"""
+ファイルごとの処理の並列実行
+
+メタデータ読み込みのような I/O・JSON 解析中心の処理をスレッドプールで
+並列に実行し、結果は入力順に返す（逐次処理と同じ順序・同じ結果）。
+
+ネットワークマウントでは1ファイルの読み込みが止まることがあるため、
+1件ごとに処理時間の上限を設け、超えたものは結果を待たずに TIMED_OUT とする
+（スレッド自体は止められないため、処理はバックグラウンドで続く）。
+
+設定（環境変数）:
+  RANDOM_LORA_METADATA_TIMEOUT  1ファイルのメタデータ読み込みの上限（秒、0以下は無制限、デフォルト: 30）
+  スレッド数は走査と同じ RANDOM_LORA_SCAN_WORKERS を使う
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from .scanner import get_scan_workers
+
+
+DEFAULT_METADATA_TIMEOUT = 30.0
+
+# 結果を待つ間隔（秒、処理開始時刻を確認するため）
+POLL_INTERVAL = 0.05
+
+
+class _TimedOut:
+    """時間切れで結果を待たなかったことを表す値"""
+
+    def __repr__(self):
+        return "TIMED_OUT"
+
+
+TIMED_OUT = _TimedOut()
+
+
+def get_metadata_timeout():
+    """1ファイルのメタデータ読み込みの上限（秒、0以下は無制限）"""
+    try:
+        return float(os.environ.get("RANDOM_LORA_METADATA_TIMEOUT", DEFAULT_METADATA_TIMEOUT))
+    except ValueError:
+        return DEFAULT_METADATA_TIMEOUT
+
+
+def map_ordered(func, items, max_workers=None, timeout=None, thread_name_prefix="RandomLoRAWorker"):
+    """
+    func を並列に適用し、結果を入力順に返すジェネレータ
+
+    func の例外はその要素の順番で送出する（逐次処理と同じ）。
+
+    Args:
+        func: 1要素を処理する関数（スレッドセーフであること）
+        items: 処理対象のリスト
+        max_workers: スレッド数（Noneなら get_scan_workers()、1なら逐次で時間制限なし）
+        timeout: 1要素の処理時間の上限（秒、None・0以下は無制限）
+                 処理開始から数える。開始できないまま（前の要素の処理が
+                 止まってスレッドが空かない）待った時間も同じ上限で打ち切る
+        thread_name_prefix: スレッド名
+
+    Yields:
+        各要素の結果（時間切れの場合は TIMED_OUT）
+    """
+    items = list(items)
+    workers = min(max_workers or get_scan_workers(), len(items))
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    started = {}
+
+    def run(i, item):
+        started[i] = time.monotonic()
+        return func(item)
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+    try:
+        futures = [pool.submit(run, i, item) for i, item in enumerate(items)]
+        for i, future in enumerate(futures):
+            if not timeout or timeout <= 0:
+                yield future.result()
+                continue
+
+            waiting_since = time.monotonic()
+            while True:
+                deadline = started.get(i, waiting_since) + timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 and not future.done():
+                    future.cancel()
+                    yield TIMED_OUT
+                    break
+                try:
+                    # 未開始の間は開始時刻を確認するため短い間隔で待つ
+                    wait_for = max(0, remaining) if i in started else min(max(0, remaining), POLL_INTERVAL)
+                    result = future.result(timeout=wait_for)
+                except FutureTimeoutError:
+                    continue
+                yield result
+                break
+    finally:
+        # 時間切れのスレッドは待たない（未開始のものは取り消す）
+        pool.shutdown(wait=False, cancel_futures=True)
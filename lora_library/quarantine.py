@@ -0,0 +1,151 @@
+"""
+読み込みに失敗したファイルの記録（隔離）
+
+壊れた .metadata.json / .info や、ヘッダーが読めない safetensors を
+実行のたびに読み直して同じ警告を出さないよう、失敗したファイルを
+サイズ・mtimeとともにライブラリインデックスに記録する。
+
+  - 記録済みで、サイズ・mtimeが変わっていないファイルは読まずに
+    QuarantinedFileError を送出する（警告は最初の1回だけ）
+  - ファイルが更新されると記録を消して読み直す
+  - 記録は再起動後も残る。一覧は report() / format_report() で確認できる
+
+サイドカーの有無はスキャン時にインデックスへ記録済み、埋め込みメタデータが
+ないファイルは safetensors_header のキャッシュに None として残るため、
+ここで扱うのは「あるのに読めない」ファイルのみ。
+"""
+
+import os
+import threading
+
+from .index import get_library_index
+from .sidecar_json import load_metadata_json
+
+
+# format_report で表示する最大件数
+REPORT_LIMIT = 20
+
+
+class QuarantinedFileError(Exception):
+    """以前読み込みに失敗し、その後変更されていないファイル"""
+
+    def __init__(self, path, kind, error):
+        super().__init__(f"{path}: {error} (quarantined {kind})")
+        self.path = path
+        self.kind = kind
+        self.error = error
+
+
+class Quarantine:
+    """
+    読み込みに失敗したファイルの一覧（スレッドセーフ）
+
+    件数は少ない前提で、初回参照時にインデックスから全件読み込んで
+    メモリ上に持つ。書き込みは変化があったときのみ。
+    """
+
+    def __init__(self, index=None):
+        self._index = index
+        self._entries = None  # {パス: (種類, size, mtime_ns, エラー)}
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            if self._index is None:
+                self._index = get_library_index()
+            self._entries = self._index.load_quarantine()
+        return self._entries
+
+    def check(self, path, kind, st):
+        """
+        記録済みならQuarantinedFileErrorを送出（ファイルが変わっていれば記録を消す）
+
+        Args:
+            path: ファイルパス
+            kind: 種類（"metadata_json" / "info" / "safetensors"）
+            st: path の os.stat 結果
+        """
+        with self._lock:
+            entry = self._load().get(path)
+            if entry is None:
+                return
+            if entry[0] == kind and entry[1:3] == (st.st_size, st.st_mtime_ns):
+                raise QuarantinedFileError(path, kind, entry[3])
+            del self._entries[path]
+            self._index.delete_quarantine(path)
+
+    def add(self, path, kind, st, error):
+        """読み込みに失敗したファイルを記録"""
+        message = f"{type(error).__name__}: {error}"
+        with self._lock:
+            self._load()[path] = (kind, st.st_size, st.st_mtime_ns, message)
+            self._index.store_quarantine(path, kind, st.st_size, st.st_mtime_ns, message)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load())
+
+    def report(self):
+        """
+        記録済みのファイル一覧
+
+        Returns:
+            list: [(パス, 種類, エラー)]（パス順）
+        """
+        with self._lock:
+            entries = self._load()
+            return [(path, entries[path][0], entries[path][3]) for path in sorted(entries)]
+
+    def format_report(self, limit=REPORT_LIMIT):
+        """ログ用の表示（記録がなければ空文字）"""
+        entries = self.report()
+        if not entries:
+            return ""
+        lines = [f"Quarantined files (unreadable, skipped until modified): {len(entries)}"]
+        for path, kind, error in entries[:limit]:
+            lines.append(f"  [{kind}] {path}: {error}")
+        if len(entries) > limit:
+            lines.append(f"  ... and {len(entries) - limit} more")
+        return "\n".join(lines)
+
+
+_quarantine = None
+_quarantine_lock = threading.Lock()
+
+
+def get_quarantine():
+    """全ノード共通の隔離一覧を取得（初回のみ作成）"""
+    global _quarantine
+    with _quarantine_lock:
+        if _quarantine is None:
+            _quarantine = Quarantine()
+        return _quarantine
+
+
+def load_json_sidecar(path, kind):
+    """
+    サイドカーのJSONを読み込む（失敗したファイルは変更されるまで読まない）
+
+    大きいファイルはノードが使うキーだけを取り出す（sidecar_json 参照）
+
+    Args:
+        path: .metadata.json / .info のパス
+        kind: 種類（"metadata_json" / "info"）
+
+    Returns:
+        JSONの内容（大きいファイルは必要なキーのみ）
+
+    Raises:
+        QuarantinedFileError: 以前失敗し、変更されていない
+        ValueError: 解析に失敗（このとき記録される）
+        OSError: 読み込みに失敗（一時的なエラーの場合があるため記録しない）
+    """
+    st = os.stat(path)
+    quarantine = get_quarantine()
+    quarantine.check(path, kind, st)
+    try:
+        return load_metadata_json(path, st.st_size)
+    except ValueError as e:
+        # JSONDecodeError / UnicodeDecodeError
+        quarantine.add(path, kind, st, e)
+        raise
@@ -0,0 +1,407 @@
+"""
+keyword_filter のクエリ言語
+
+従来の keyword_filter はキーワードを filter_mode（AND / OR）で並べることしか
+できなかった。NOT・括弧・フィールド指定を含む入力はクエリとして解析し、
+評価手順（逆ポーランド記法の命令列）にコンパイルしてキャッシュする。
+
+  構文:
+    anime style                 並べたキーワードは filter_mode で結合（従来と同じ）
+    "anime style"               フレーズ（従来と同じ）
+    a AND b / a OR b            明示的な結合（AND は OR より優先）
+    NOT a                       否定
+    ( ... )                     グループ化（演算子・フィールド指定と組み合わせる）
+    name:x                      ファイル名（メタデータ検索時はモデル名も）
+    tag:x                       タグ（civitai.model.tags / tags）
+    trigger:x                   トリガーワード
+    folder:x                    lora_folder_path からの相対フォルダ
+    tag:"anime style"           フィールド指定のフレーズ
+
+  - 演算子は大文字の AND / OR / NOT のみ（小文字はキーワード）
+  - 演算子・フィールド指定を含まない入力は従来どおり _parse_keywords で処理する
+    （括弧だけではクエリにしない。演算子なしの並びは括弧があっても同じ結合になるため、
+    anime_(v2) や (v2) は従来どおり括弧を含むキーワードとして部分一致する）
+  - クエリの中でも括弧をグループ化に使うのは語の境界にあるものだけ
+    （"(" は語の先頭、")" は語の末尾で語の中の "(" と対にならないもの）。
+    anime_(v2) の括弧はキーワードの一部になる
+  - 一致は従来と同じ部分一致。フィールド指定なしのキーワードは
+    ファイル名（search_in_metadata が有効ならメタデータのキーワードも）を検索する
+  - tag: / trigger: を使うクエリは search_in_metadata に関わらずメタデータを読む
+
+各キーワードは KeywordIndex でLoRAごとの一致マスク（1 / 0 の bytes）にし、
+整数のビット演算（バイト単位の AND / OR / XOR）でまとめて評価する。
+"""
+
+import os
+import re
+import threading
+from collections import OrderedDict
+from itertools import compress
+
+from .keyword_index import FILENAME_NAMESPACE, filename_search_text, get_keyword_index
+
+
+# フィールド指定なしのキーワード
+ANY_FIELD = ""
+
+FIELDS = ("name", "tag", "trigger", "folder")
+
+# メタデータのレコードが必要なフィールド
+METADATA_FIELDS = ("tag", "trigger")
+
+OPERATORS = ("AND", "OR", "NOT")
+
+# コンパイル済みクエリを覚えておく数
+QUERY_CACHE_SIZE = 256
+
+# フィールドの値の区切り（キーワードに含まれない文字、値をまたいで一致しない）
+VALUE_SEPARATOR = "\n"
+
+# 語の末尾の ")" は、後ろが空白・末尾・")" の場合だけグループの終わりになる
+_TOKEN_PATTERN = re.compile(
+    r'\s*(?:(?P<paren>\(|\)(?=[\s)]|$))'
+    r'|(?:(?P<field>' + "|".join(FIELDS) + r'):)?(?:"(?P<phrase>[^"]*)"|(?P<word>[^\s"]+)))'
+)
+
+# クエリとして扱う入力（演算子・フィールド指定を含む）
+_QUERY_SYNTAX = re.compile(
+    r'(?:^|\s)(?:AND|OR|NOT)(?=\s|$)|(?:^|[\s(])(?:' + "|".join(FIELDS) + r'):'
+)
+
+
+class QuerySyntaxError(ValueError):
+    """クエリの構文エラー"""
+
+
+def is_query(keyword_filter):
+    """従来のキーワード入力ではなくクエリとして解析するか"""
+    return bool(_QUERY_SYNTAX.search(keyword_filter))
+
+
+def _word_length(word):
+    """
+    語の長さ（末尾の ")" のうち、語の中の "(" と対にならないものは含めない）
+
+    例:
+        "anime_(v2)"  → 10（括弧は語の一部）
+        "anime_(v2))" → 10（最後の ")" はグループの終わり）
+        "v2)"         → 2
+    """
+    depth = 0
+    for i, char in enumerate(word):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            if depth:
+                depth -= 1
+            elif not word[i:].strip(")"):
+                return i
+    return len(word)
+
+
+def _tokenize(text):
+    """(種類, 値) のリスト（種類: "(" / ")" / 演算子 / "term"）"""
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if match is None or match.end() == pos:
+            raise QuerySyntaxError(f"unexpected character at {pos}: {text[pos:pos + 10]!r}")
+        pos = match.end()
+        if match.group("paren"):
+            tokens.append((match.group("paren"), None))
+            continue
+        field = match.group("field") or ANY_FIELD
+        phrase = match.group("phrase")
+        if phrase is not None:
+            if not phrase.strip():
+                raise QuerySyntaxError("empty phrase")
+            tokens.append(("term", (field, phrase.lower())))
+            continue
+        word = match.group("word")
+        length = _word_length(word)
+        if length < len(word):
+            pos = match.end() - (len(word) - length)
+            word = word[:length]
+            if not word:
+                raise QuerySyntaxError(f"empty field value at {pos}")
+        if field == ANY_FIELD and word in OPERATORS:
+            tokens.append((word, None))
+        else:
+            tokens.append(("term", (field, word.lower())))
+    return tokens
+
+
+class _Parser:
+    """
+    再帰下降パーサー
+
+      or_expr  := and_expr (("OR" | 並び※) and_expr)*
+      and_expr := unary (("AND" | 並び※) unary)*
+      unary    := "NOT" unary | "(" or_expr ")" | term
+      ※ 演算子なしの並びは filter_mode の結合
+    """
+
+    def __init__(self, tokens, filter_mode):
+        self.tokens = tokens
+        self.pos = 0
+        self.implicit = "AND" if filter_mode == "AND" else "OR"
+
+    def peek(self):
+        return self.tokens[self.pos][0] if self.pos < len(self.tokens) else None
+
+    def take(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def starts_operand(self):
+        return self.peek() in ("term", "(", "NOT")
+
+    def parse(self):
+        if not self.tokens:
+            raise QuerySyntaxError("empty query")
+        node = self.or_expr()
+        if self.pos != len(self.tokens):
+            raise QuerySyntaxError(f"unexpected {self.peek()!r}")
+        return node
+
+    def or_expr(self):
+        children = [self.and_expr()]
+        while True:
+            if self.peek() == "OR":
+                self.take()
+            elif not (self.implicit == "OR" and self.starts_operand()):
+                break
+            children.append(self.and_expr())
+        return children[0] if len(children) == 1 else ("OR", children)
+
+    def and_expr(self):
+        children = [self.unary()]
+        while True:
+            if self.peek() == "AND":
+                self.take()
+            elif not (self.implicit == "AND" and self.starts_operand()):
+                break
+            children.append(self.unary())
+        return children[0] if len(children) == 1 else ("AND", children)
+
+    def unary(self):
+        kind = self.peek()
+        if kind == "NOT":
+            self.take()
+            return ("NOT", self.unary())
+        if kind == "(":
+            self.take()
+            node = self.or_expr()
+            if self.peek() != ")":
+                raise QuerySyntaxError("missing ')'")
+            self.take()
+            return node
+        if kind == "term":
+            return ("term", self.take()[1])
+        raise QuerySyntaxError(f"expected a keyword, got {kind or 'end of query'!r}")
+
+
+class CompiledQuery:
+    """
+    コンパイル済みのクエリ
+
+    Attributes:
+        text: 元のクエリ文字列
+        terms: {フィールド: [キーワード, ...]}（重複なし、マスクを作る単位）
+        positive_terms: NOT の下にない (フィールド, キーワード) のリスト（重複なし、
+                        RELEVANCE モードのスコアに使う）
+        program: 評価手順（("term", 番号) / ("and", 個数) / ("or", 個数) / ("not", 1)）
+    """
+
+    def __init__(self, text, root):
+        self.text = text
+        self.terms = {}
+        self._term_slots = {}
+        self.positive_terms = []
+        self.program = []
+        self._compile(root)
+
+    @property
+    def fields(self):
+        return set(self.terms)
+
+    @property
+    def uses_metadata_fields(self):
+        return any(field in self.terms for field in METADATA_FIELDS)
+
+    def _compile(self, node, negated=False):
+        kind = node[0]
+        if kind == "term":
+            slot = self._term_slots.get(node[1])
+            if slot is None:
+                slot = self._term_slots[node[1]] = len(self._term_slots)
+                field, keyword = node[1]
+                self.terms.setdefault(field, []).append(keyword)
+            if not negated and node[1] not in self.positive_terms:
+                self.positive_terms.append(node[1])
+            self.program.append(("term", slot))
+        elif kind == "NOT":
+            # NOT NOT a の a は肯定
+            self._compile(node[1], not negated)
+            self.program.append(("not", 1))
+        else:
+            for child in node[1]:
+                self._compile(child, negated)
+            self.program.append((kind.lower(), len(node[1])))
+
+    def evaluate(self, lora_paths, sources):
+        """
+        クエリに一致するLoRAを絞り込む
+
+        Args:
+            lora_paths: LoRAファイルパスのリスト
+            sources: {フィールド: (KeywordIndex の名前空間, 検索対象)}（field_sources 参照）
+
+        Returns:
+            list: 一致したパス（lora_paths の順序）
+        """
+        count = len(lora_paths)
+        if not count:
+            return []
+
+        # キーワードごとの一致マスク（1バイト = 1ファイル）を整数にする
+        masks = [0] * len(self._term_slots)
+        for field, keywords in self.terms.items():
+            namespace, texts = sources[field]
+            field_masks = get_keyword_index(namespace).match(lora_paths, texts, keywords)
+            for keyword, mask in zip(keywords, field_masks):
+                masks[self._term_slots[(field, keyword)]] = int.from_bytes(mask, "big")
+
+        ones = int.from_bytes(b"\x01" * count, "big")
+        stack = []
+        for op, arg in self.program:
+            if op == "term":
+                stack.append(masks[arg])
+            elif op == "not":
+                stack.append(stack.pop() ^ ones)
+            else:
+                operands = stack[-arg:]
+                del stack[-arg:]
+                value = operands[0]
+                for operand in operands[1:]:
+                    value = value & operand if op == "and" else value | operand
+                stack.append(value)
+
+        return list(compress(lora_paths, stack.pop().to_bytes(count, "big")))
+
+    def __repr__(self):
+        return f"CompiledQuery({self.text!r}, program={self.program!r})"
+
+
+_query_cache = OrderedDict()
+_query_cache_lock = threading.Lock()
+
+
+def compile_query(keyword_filter, filter_mode="AND"):
+    """
+    keyword_filter をクエリとしてコンパイル（クエリ文字列ごとにキャッシュ）
+
+    Returns:
+        CompiledQuery（演算子・フィールド指定を含まない入力はNone）
+
+    Raises:
+        QuerySyntaxError: 構文エラー
+    """
+    if not is_query(keyword_filter):
+        return None
+
+    key = (keyword_filter, filter_mode)
+    with _query_cache_lock:
+        query = _query_cache.get(key)
+        if query is not None:
+            _query_cache.move_to_end(key)
+            return query
+
+    query = CompiledQuery(keyword_filter, _Parser(_tokenize(keyword_filter), filter_mode).parse())
+
+    with _query_cache_lock:
+        _query_cache[key] = query
+        while len(_query_cache) > QUERY_CACHE_SIZE:
+            _query_cache.popitem(last=False)
+    return query
+
+
+def query_uses_metadata(keyword_filter, filter_mode="AND"):
+    """tag: / trigger: などメタデータのレコードを読むクエリか（構文エラーは False）"""
+    try:
+        query = compile_query(keyword_filter, filter_mode)
+    except QuerySyntaxError:
+        return False
+    return query is not None and query.uses_metadata_fields
+
+
+def _join_values(values):
+    return VALUE_SEPARATOR.join(values).lower()
+
+
+def _folder_search_texts(lora_paths, root):
+    """
+    folder: の検索対象（root からの相対フォルダ、区切りは /、小文字）のリスト
+
+    基準フォルダが違えば同じLoRAでも文字列が変わるため、ノードごとのインデックスは
+    作らず、1つのインデックスでパスごとに内容が変わった文書だけを索引し直す
+    """
+    prefix = os.path.join(root, "") if root else ""
+    texts = []
+    for lora_path in lora_paths:
+        dir_path = os.path.dirname(lora_path)
+        if prefix and dir_path.startswith(prefix):
+            rel_dir = dir_path[len(prefix):]
+        elif root:
+            rel_dir = os.path.relpath(dir_path, root)
+        else:
+            rel_dir = dir_path
+        texts.append("" if rel_dir == os.curdir else rel_dir.replace(os.sep, "/").lower())
+    return texts
+
+
+def field_sources(fields, lora_paths, folder_path=None, search_source=None, records=None,
+                  namespace="query"):
+    """
+    フィールドごとの検索対象を作成
+
+    Args:
+        fields: クエリのフィールド（CompiledQuery.fields）
+        lora_paths: LoRAファイルパスのリスト
+        folder_path: folder: の基準フォルダ（省略時はフルパス）
+        search_source: フィールド指定なしの検索対象（名前空間, ファイル名 + メタデータの
+                       キーワードのリスト）。メタデータ検索が無効ならNone（ファイル名のみ）
+        records: lora_paths と同じ順序の MetadataRecord（ない・読めない場合はNone）のリスト
+                 （省略時は name: はファイル名のみ、tag: / trigger: は一致なし）
+        namespace: KeywordIndex の名前空間の接頭辞
+
+    Returns:
+        dict: {フィールド: (KeywordIndex の名前空間, 検索対象の文字列のリストまたは関数)}
+    """
+    sources = {}
+    for field in fields:
+        if field == ANY_FIELD:
+            sources[field] = search_source or (FILENAME_NAMESPACE, filename_search_text)
+        elif field == "folder":
+            root = os.path.normpath(folder_path) if folder_path else ""
+            sources[field] = (f"{namespace}:folder", _folder_search_texts(lora_paths, root))
+        elif field == "name" and records is None:
+            sources[field] = (FILENAME_NAMESPACE, filename_search_text)
+        elif field == "name":
+            sources[field] = (f"{namespace}:name", [
+                _join_values((filename_search_text(path), *(record.names if record else ())))
+                for path, record in zip(lora_paths, records)
+            ])
+        elif field == "tag":
+            sources[field] = (f"{namespace}:tag", [
+                _join_values(record.tags) if record else "" for record in records or [None] * len(lora_paths)
+            ])
+        elif field == "trigger":
+            sources[field] = (f"{namespace}:trigger", [
+                _join_values(record.trained_word_list) if record else ""
+                for record in records or [None] * len(lora_paths)
+            ])
+    return sources
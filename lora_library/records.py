@@ -0,0 +1,175 @@
+"""
+LoRAごとのメタデータレコード（検索キーワード・トリガーワード・作例プロンプト）
+
+選択されたLoRA 1つにつき、キーワード検索・トリガーワード・作例プロンプトが
+それぞれ .metadata.json / .info を読み直していた。ここでは1回の読み込みから
+ノードが使う部分だけを取り出したレコードを作り、署名（LoRA本体とサイドカーの
+サイズ・mtime）が変わるまでキャッシュする。
+
+Civitai の .info にある大きな images 配列は、作例プロンプト
+（prompt, negativePrompt）の組だけを残す。
+"""
+
+import sys
+import threading
+
+from .cache import BoundedCache, get_cache_budget
+from .compact import decode_text, encode_text, get_token_table, intern_strings
+from .index import get_library_index
+
+
+class MetadataRecord:
+    """
+    1つのLoRAのメタデータから必要な部分だけを残したもの
+
+    キーワード・単語リストはトークンID列、パターンと作例プロンプトは intern した
+    文字列で持つ（compact モジュール参照）。作例プロンプトは語彙が広く共通のトークン表を
+    大きくし続けるため、ID列にせず文字列のまま持つ（レコードのサイズに文字列も数える）
+
+    Attributes:
+        keywords: 検索用キーワード（小文字、スペース区切り）
+        trained_word_list: civitai.trainedWords をカンマで分割・重複除去した単語
+        trained_words: civitai.trainedWords のパターン（元の文字列のまま）
+        sample_prompts: images[].meta の (prompt, negativePrompt) の組
+                        （meta がない画像は含まない、LoRA構文は削除しない）
+        has_images: civitai.images が空でないか（meta の有無に関係なく、ログの区別用）
+        names: model_name, civitai.name, civitai.model.name（空と重複は除く）
+        tags: civitai.model.tags とトップレベルの tags（重複除去）
+    """
+
+    __slots__ = ("_keyword_ids", "_word_ids", "trained_words", "sample_prompts", "names", "tags", "has_images")
+
+    def __init__(self, keywords, trained_word_list, trained_words, sample_prompts, names=(), tags=(),
+                 has_images=None):
+        self._keyword_ids = encode_text(keywords)
+        self._word_ids = get_token_table().encode(trained_word_list)
+        self.trained_words = intern_strings(trained_words)
+        self.names = intern_strings(names)
+        self.tags = intern_strings(tags)
+        # ネガティブはLoRA間で同じものが多いので intern（参照がなくなれば解放される）
+        self.sample_prompts = tuple(
+            (sys.intern(positive), sys.intern(negative)) for positive, negative in sample_prompts
+        )
+        self.has_images = bool(self.sample_prompts) if has_images is None else has_images
+
+    @property
+    def keywords(self):
+        return decode_text(self._keyword_ids)
+
+    @property
+    def trained_word_list(self):
+        return tuple(get_token_table().decode(self._word_ids))
+
+    def __repr__(self):
+        return (f"MetadataRecord(keywords={self.keywords!r}, "
+                f"trained_words={len(self.trained_words)}, sample_prompts={len(self.sample_prompts)})")
+
+
+def build_metadata_record(metadata, keep_empty_meta=False):
+    """
+    メタデータ（Civitai形式の辞書）からレコードを作成
+
+    検索対象:
+      1. model_name（トップレベル）
+      2. civitai.name
+      3. civitai.trainedWords（全パターンを結合、重複除去）
+      4. civitai.model.name
+      5. civitai.model.tags
+      6. tags（トップレベル）
+
+    Args:
+        metadata: メタデータ辞書
+        keep_empty_meta: meta が空の辞書の画像も作例に含める（Random LoRA Loader の従来の動作）
+
+    Returns:
+        MetadataRecord（metadata がない場合はNone）
+    """
+    if not metadata:
+        return None
+
+    civitai = metadata.get("civitai", {})
+    model_info = civitai.get("model", {})
+    trained_words = tuple(civitai.get("trainedWords", []) or ())
+
+    # trainedWords をカンマ区切りで分割、重複除去（順序維持）
+    all_words = []
+    for pattern in trained_words:
+        all_words.extend(w.strip() for w in pattern.split(','))
+    trained_word_list = tuple(dict.fromkeys(all_words))
+
+    keywords_parts = []
+    for value in (metadata.get("model_name", ""), civitai.get("name", "")):
+        if value:
+            keywords_parts.append(value)
+    keywords_parts.extend(trained_word_list)
+    model_info_name = model_info.get("name", "")
+    if model_info_name:
+        keywords_parts.append(model_info_name)
+    model_tags = model_info.get("tags", []) or []
+    keywords_parts.extend(model_tags)
+    # トップレベルのtags（通常は civitai.model.tags と同じ内容だが念のため）
+    top_tags = metadata.get("tags", []) or []
+    keywords_parts.extend(top_tags)
+
+    # 重複除去（順序維持）して小文字化
+    keywords = " ".join(dict.fromkeys(keywords_parts)).lower()
+
+    # 作例プロンプト（meta を持つ画像のみ、他の項目は捨てる）
+    images = civitai.get("images", []) or []
+    sample_prompts = tuple(
+        (image["meta"].get("prompt", "") or "", image["meta"].get("negativePrompt", "") or "")
+        for image in images
+        if isinstance(image, dict) and isinstance(image.get("meta"), dict) and (keep_empty_meta or image["meta"])
+    )
+
+    # クエリのフィールド指定（name: / tag:）用
+    names = tuple(dict.fromkeys(
+        value for value in (metadata.get("model_name", ""), civitai.get("name", ""), model_info_name)
+        if value and isinstance(value, str)
+    ))
+    tags = tuple(dict.fromkeys(tag for tag in (*model_tags, *top_tags) if isinstance(tag, str)))
+
+    return MetadataRecord(
+        keywords, trained_word_list, trained_words, sample_prompts, names, tags, has_images=bool(images)
+    )
+
+
+_record_cache = None
+_record_cache_lock = threading.Lock()
+
+
+def get_record_cache():
+    """メタデータレコードのキャッシュ（全ノード共通）"""
+    global _record_cache
+    with _record_cache_lock:
+        if _record_cache is None:
+            _record_cache = BoundedCache(get_cache_budget("records"), name="Metadata record cache")
+        return _record_cache
+
+
+def get_metadata_record(lora_path, load_metadata, namespace, signature=None, keep_empty_meta=False):
+    """
+    LoRAのメタデータレコードを取得（署名が同じ間はキャッシュ）
+
+    Args:
+        lora_path: LoRAファイルパス
+        load_metadata: LoRAパスを受け取りメタデータ辞書（またはNone）を返す関数
+        namespace: キャッシュの種類（埋め込みメタデータの変換方法が違うノードを分ける）
+        signature: 取得済みのファイル署名（省略時はインデックスから取得）
+        keep_empty_meta: build_metadata_record を参照（namespace ごとに同じ値を渡す）
+
+    Returns:
+        MetadataRecord（メタデータがない場合はNone）
+    """
+    if signature is None:
+        signature = get_library_index().get_file_signature(lora_path)
+
+    cache = get_record_cache()
+    key = (namespace, lora_path)
+    cached = cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    record = build_metadata_record(load_metadata(lora_path), keep_empty_meta)
+    cache[key] = (signature, record)
+    return record
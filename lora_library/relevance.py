@@ -0,0 +1,309 @@
+"""
+キーワードの関連度によるランキング（BM25）
+
+filter_mode の AND / OR は一致する・しないの2値なので、たくさんのLoRAに一致する
+クエリでは一致の度合いに関係なく均等に選ばれる。RELEVANCE モードでは検索対象
+（ファイル名、search_in_metadata が有効ならメタデータのキーワード = モデル名・
+トリガーワード・タグ）を語に分け、BM25 でLoRAごとのスコアを付けて上位から選ぶ。
+
+  - 語は英数字の連続（_ や記号で区切る、小文字、NFC）。日本語などのCJKの連続は
+    2文字組にする（区切りのない「キャラクター」にも「キャラ」が一致する）
+  - 一致は語単位（AND / OR の部分一致とは違い "ani" は anime に一致しない）
+  - クエリ（NOT・フィールド指定を含む入力）はノード側で AND / OR と同じく先に絞り込み、
+    スコアには NOT の下にないキーワードの語だけを使う（folder: は検索対象にないので使わない）
+  - idf・平均文書長は索引済みの全LoRAで計算する
+
+文書はLoRAのパスごとに1つ（内容が変わった場合だけ索引し直し、削除されたファイルの
+文書は文書数が増えたときに取り除く。KeywordIndex と同じ）。
+文書が変わったら「語 × 文書」の重み（BM25 の1項）を列圧縮の疎行列
+（indptr / 文書ID / 重み の NumPy 配列）として作り直し、クエリのスコアは
+クエリの語の列を集めて np.bincount で文書ごとに足し合わせる（疎行列とベクトルの積）。
+
+NumPy はオプション（ない場合は is_relevance_available() が False、ノードは OR で絞り込む）。
+"""
+
+import os
+import re
+import threading
+from array import array
+from collections import Counter
+
+from .keyword_index import normalize_search_text
+from .query import QuerySyntaxError, compile_query
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+RELEVANCE_MODE = "RELEVANCE"
+
+# BM25 のパラメータ（語の出現回数の飽和・文書長の正規化の強さ）
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 無効な文書がこの数と有効な文書数を超えたら文書IDを振り直す
+COMPACT_MIN_DEAD = 1024
+
+# 登録済みの文書数がこの数と前回の確認時の2倍を超えたら、削除されたファイルの文書を探す
+PRUNE_MIN_DOCS = 4096
+
+_WORD_PATTERN = re.compile(r"[^\W_]+")
+
+# ひらがな・カタカナ・CJK統合漢字・ハングル
+_CJK_PATTERN = re.compile("[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uac00-\ud7af]+")
+
+# スコアに使わないフィールド（検索対象の文字列に含まれない）
+UNSCORED_FIELDS = ("folder",)
+
+
+def is_relevance_available():
+    """RELEVANCE モードを使えるか（NumPy があるか）"""
+    return np is not None
+
+
+def tokenize(text):
+    """
+    ランキング用の語に分割
+
+    例:
+        "Anime_Style_v2" → ["anime", "style", "v2"]
+        "キャラ_red" → ["キャ", "ャラ", "red"]
+    """
+    tokens = []
+    for word in _WORD_PATTERN.findall(normalize_search_text(text).lower()):
+        if _CJK_PATTERN.search(word) is None:
+            tokens.append(word)
+            continue
+        pos = 0
+        for match in _CJK_PATTERN.finditer(word):
+            if match.start() > pos:
+                tokens.append(word[pos:match.start()])
+            run = match.group()
+            if len(run) == 1:
+                tokens.append(run)
+            else:
+                tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+            pos = match.end()
+        if pos < len(word):
+            tokens.append(word[pos:])
+    return tokens
+
+
+def query_terms(keyword_filter):
+    """
+    クエリの語と出現回数
+
+    クエリは NOT の下にないキーワードの語だけを数える（除外する語でスコアが
+    上がらないように）。クエリでない入力・構文エラーの入力は全体を語に分ける
+    （ノードが従来のキーワードとして扱うのと同じ）
+    """
+    try:
+        query = compile_query(keyword_filter)
+    except QuerySyntaxError:
+        query = None
+    if query is None:
+        return Counter(tokenize(keyword_filter))
+    return Counter(
+        token for field, keyword in query.positive_terms if field not in UNSCORED_FIELDS
+        for token in tokenize(keyword)
+    )
+
+
+class RelevanceIndex:
+    """検索対象の文字列からLoRAをBM25で順位付けする索引（スレッドセーフ、NumPy が必要）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # パス → 文書ID
+        self._ids = {}
+        # 文書ID → 語IDの配列（出現順、重複あり。無効な文書はNone）
+        self._docs = []
+        # 文書ID → 内容のハッシュ（変更の判定用）
+        self._hashes = []
+        self._dead = 0
+        self._prune_at = PRUNE_MIN_DOCS
+        # 語 → 語ID
+        self._terms = {}
+        # 列圧縮の疎行列（文書が変わったら None にして次の検索で作り直す）
+        self._matrix = None
+
+    def __len__(self):
+        return len(self._ids)
+
+    def rank(self, lora_paths, texts, keyword_filter, top_k=None):
+        """
+        クエリとの関連度が高い順にLoRAを並べる
+
+        Args:
+            lora_paths: LoRAファイルパスのリスト
+            texts: パスごとの検索対象文字列のリスト、または
+                   パスから検索対象文字列を作る関数（登録済みのパスは呼ばない）
+            keyword_filter: クエリ文字列
+            top_k: 返す件数の上限（Noneは全件）
+
+        Returns:
+            list: (パス, スコア) のリスト（スコアの高い順、同点は lora_paths の順序。
+                  スコアが0のLoRAは含まない）
+        """
+        terms = query_terms(keyword_filter)
+        with self._lock:
+            doc_ids = self._sync_documents(lora_paths, texts)
+            self._prune_missing(lora_paths)
+            self._maybe_compact(doc_ids)
+            scores = self._score(terms)
+        if scores is None or not lora_paths:
+            return []
+
+        # 今回のLoRAのスコア（lora_paths の順序）
+        path_scores = scores[np.array(doc_ids, dtype=np.intp)]
+        positions = np.flatnonzero(path_scores > 0)
+        if top_k is not None and len(positions) > top_k:
+            if top_k <= 0:
+                return []
+            # k番目のスコア以上だけを並べる（同点はすべて残して順序で決める）
+            threshold = np.partition(path_scores[positions], len(positions) - top_k)[len(positions) - top_k]
+            positions = positions[path_scores[positions] >= threshold]
+        order = positions[np.lexsort((positions, -path_scores[positions]))]
+        if top_k is not None:
+            order = order[:top_k]
+        return list(zip(map(lora_paths.__getitem__, order.tolist()), path_scores[order].tolist()))
+
+    # ------------------------------------------------------------------
+    # 文書の登録
+    # ------------------------------------------------------------------
+
+    def _sync_documents(self, paths, texts):
+        """内容が変わった文書だけ索引し直し、文書IDのリストを返す"""
+        doc_ids = list(map(self._ids.get, paths))
+        if callable(texts):
+            if None in doc_ids:
+                for i, (path, doc_id) in enumerate(zip(paths, doc_ids)):
+                    if doc_id is None:
+                        doc_ids[i] = self._add_document(path, texts(path))
+            return doc_ids
+
+        text_hashes = list(map(hash, texts))
+        # 登録済みで内容が同じ（2回目以降のほとんど）なら1件ずつの処理をしない
+        if None not in doc_ids and list(map(self._hashes.__getitem__, doc_ids)) == text_hashes:
+            return doc_ids
+
+        for i, (path, doc_id, text, text_hash) in enumerate(zip(paths, doc_ids, texts, text_hashes)):
+            if doc_id is not None:
+                if self._hashes[doc_id] == text_hash:
+                    continue
+                self._docs[doc_id] = None
+                self._dead += 1
+            doc_ids[i] = self._add_document(path, text, text_hash)
+        return doc_ids
+
+    def _add_document(self, path, text, text_hash=None):
+        doc_id = len(self._docs)
+        terms = self._terms
+        term_ids = array("I")
+        for token in tokenize(text):
+            term_id = terms.get(token)
+            if term_id is None:
+                term_id = terms[token] = len(terms)
+            term_ids.append(term_id)
+        self._docs.append(term_ids)
+        self._hashes.append(hash(text) if text_hash is None else text_hash)
+        self._ids[path] = doc_id
+        self._matrix = None
+        return doc_id
+
+    def _prune_missing(self, lora_paths):
+        """文書が増えたら、今回の対象以外で存在しなくなったパスの文書を無効にする（KeywordIndex と同じ）"""
+        if len(self._ids) < self._prune_at:
+            return
+        current = set(lora_paths)
+        for path in [path for path in self._ids if path not in current and not os.path.exists(path)]:
+            self._docs[self._ids.pop(path)] = None
+            self._dead += 1
+            self._matrix = None
+        self._prune_at = max(PRUNE_MIN_DOCS, len(self._ids) * 2)
+
+    def _maybe_compact(self, doc_ids):
+        """無効な文書が多くなったら文書IDを振り直す（doc_ids も振り直す）"""
+        if self._dead < COMPACT_MIN_DEAD or self._dead <= len(self._ids):
+            return
+        live = [doc_id for doc_id, doc in enumerate(self._docs) if doc is not None]
+        new_ids = {old: new for new, old in enumerate(live)}
+        self._docs = [self._docs[doc_id] for doc_id in live]
+        self._hashes = [self._hashes[doc_id] for doc_id in live]
+        self._ids = {path: new_ids[doc_id] for path, doc_id in self._ids.items()}
+        doc_ids[:] = map(new_ids.__getitem__, doc_ids)
+        self._dead = 0
+        self._matrix = None
+
+    # ------------------------------------------------------------------
+    # スコア
+    # ------------------------------------------------------------------
+
+    def _build_matrix(self):
+        """
+        語 × 文書の BM25 の重みを列圧縮の疎行列にする
+
+        Returns:
+            tuple: (indptr, 文書ID, 重み)。語IDの列は indptr[語ID]:indptr[語ID + 1]
+        """
+        docs = self._docs
+        num_docs = len(docs)
+        num_terms = len(self._terms)
+        lengths = np.fromiter((len(doc) if doc is not None else 0 for doc in docs),
+                              dtype=np.int64, count=num_docs)
+        term_ids = np.frombuffer(
+            b"".join(doc.tobytes() for doc in docs if doc is not None), dtype=np.uint32
+        ).astype(np.int64)
+
+        # (語, 文書) ごとの出現回数（語ID順・文書ID順に並ぶ）
+        entries, tf = np.unique(
+            term_ids * num_docs + np.repeat(np.arange(num_docs, dtype=np.int64), lengths),
+            return_counts=True,
+        )
+        entry_terms = entries // num_docs
+        entry_docs = (entries % num_docs).astype(np.int32)
+
+        df = np.bincount(entry_terms, minlength=num_terms)
+        indptr = np.zeros(num_terms + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        live = len(self._ids)
+        idf = np.log1p((live - df + 0.5) / (df + 0.5))
+        avg_length = max(lengths.sum() / max(live, 1), 1.0)
+        norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lengths / avg_length)
+        weights = idf[entry_terms] * (tf * (BM25_K1 + 1.0)) / (tf + norm[entry_docs])
+        return indptr, entry_docs, weights.astype(np.float32)
+
+    def _score(self, terms):
+        """文書IDごとのスコア（クエリの語がどれも索引にない場合はNone）"""
+        term_ids = [(self._terms[term], count) for term, count in terms.items() if term in self._terms]
+        if not term_ids:
+            return None
+        if self._matrix is None:
+            self._matrix = self._build_matrix()
+        indptr, entry_docs, weights = self._matrix
+
+        columns = [(indptr[term_id], indptr[term_id + 1], count) for term_id, count in term_ids]
+        docs = np.concatenate([entry_docs[start:end] for start, end, _ in columns])
+        values = np.concatenate([weights[start:end] * count for start, end, count in columns])
+        return np.bincount(docs, weights=values, minlength=len(self._docs))
+
+
+_relevance_indexes = {}
+_relevance_indexes_lock = threading.Lock()
+
+
+def get_relevance_index(namespace):
+    """
+    関連度の索引を取得（全ノード共通）
+
+    Args:
+        namespace: 検索対象の種類（ファイル名のみ / ファイル名 + メタデータ）
+    """
+    with _relevance_indexes_lock:
+        index = _relevance_indexes.get(namespace)
+        if index is None:
+            index = _relevance_indexes[namespace] = RelevanceIndex()
+        return index
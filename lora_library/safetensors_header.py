@@ -0,0 +1,279 @@
+"""
+safetensors のヘッダーだけを読むメタデータリーダー（torch 不要）
+
+safetensors.torch.safe_open はファイル全体を mmap し torch を必要とするが、
+メタデータ（__metadata__）は先頭の「8バイトのヘッダー長 + JSONヘッダー」に
+しかない。ここではその部分だけを通常の read で読む。
+
+ヘッダーの検証は safetensors と同じ条件で行う（safe_open が失敗するファイルは
+ここでも SafetensorsHeaderError になる）。
+
+ノードが使うのは一部のキーだけなので、キャッシュにはそれだけを残し、
+ss_tag_frequency は解析済みの上位タグ（TagFrequencySummary）として保持する。
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+from itertools import islice
+
+from .cache import BoundedCache, get_cache_budget
+from .fingerprint import MAX_HEADER_SIZE
+from .quarantine import get_quarantine
+
+
+# dtype ごとの要素サイズ（ビット、4 / 6 ビットの浮動小数点を含む）
+# ここにない dtype（新しい safetensors で追加されたもの）はサイズを検証せず、
+# オフセットの連続性と範囲だけを確認する
+DTYPE_BITS = {
+    "BOOL": 8, "F4": 4, "F6_E2M3": 6, "F6_E3M2": 6,
+    "U8": 8, "I8": 8, "F8_E5M2": 8, "F8_E4M3": 8, "F8_E8M0": 8,
+    "I16": 16, "U16": 16, "F16": 16, "BF16": 16,
+    "I32": 32, "U32": 32, "F32": 32,
+    "F64": 64, "I64": 64, "U64": 64, "C64": 64,
+}
+
+# ノードが参照する埋め込みメタデータのキー
+EMBEDDED_METADATA_KEYS = ("ss_tag_frequency", "modelspec.trigger_word", "ss_output_name")
+
+# ss_tag_frequency から保持するデータセットごとのタグ数
+TAG_SUMMARY_LIMIT = 20
+
+
+class SafetensorsHeaderError(ValueError):
+    """safetensors のヘッダーが不正"""
+
+
+def read_safetensors_header(path):
+    """
+    safetensors のJSONヘッダーを読み込んで検証
+
+    Returns:
+        dict: ヘッダー（テンソル情報と __metadata__）
+
+    Raises:
+        OSError: ファイルが読めない
+        SafetensorsHeaderError: safetensors として不正
+    """
+    with open(path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        prefix = f.read(8)
+        if len(prefix) < 8:
+            raise SafetensorsHeaderError("file too small")
+
+        header_size = struct.unpack("<Q", prefix)[0]
+        if header_size > MAX_HEADER_SIZE:
+            raise SafetensorsHeaderError("header too large")
+        if 8 + header_size > file_size:
+            raise SafetensorsHeaderError("invalid header length")
+
+        raw = f.read(header_size)
+
+    try:
+        text = raw.decode("utf-8")
+    except UnicodeDecodeError as e:
+        raise SafetensorsHeaderError(f"invalid header encoding: {e}")
+    try:
+        header = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise SafetensorsHeaderError(f"invalid header: {e}")
+    if not isinstance(header, dict):
+        raise SafetensorsHeaderError("invalid header")
+
+    _validate_header(header, file_size - 8 - header_size)
+    return header
+
+
+def _validate_header(header, buffer_size):
+    """テンソル情報の検証（safetensors の validate と同じ条件）"""
+    metadata = header.get("__metadata__")
+    if metadata is not None:
+        if not isinstance(metadata, dict) or \
+                not all(isinstance(value, str) for value in metadata.values()):
+            raise SafetensorsHeaderError("invalid __metadata__")
+
+    tensors = []
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        try:
+            dtype = info["dtype"]
+            shape = [int(dim) for dim in info["shape"]]
+            start, end = (int(offset) for offset in info["data_offsets"])
+        except (KeyError, TypeError, ValueError):
+            raise SafetensorsHeaderError(f"invalid tensor info: {name}")
+        if not isinstance(dtype, str) or min(shape, default=0) < 0 or start < 0:
+            raise SafetensorsHeaderError(f"invalid tensor info: {name}")
+        tensors.append((start, end, name, shape, DTYPE_BITS.get(dtype)))
+
+    # テンソルは隙間なく並び、最後がデータ部分の末尾に一致する
+    position = 0
+    for start, end, name, shape, dtype_bits in sorted(tensors, key=lambda tensor: tensor[:3]):
+        if start != position or end < start:
+            raise SafetensorsHeaderError(f"invalid offset: {name}")
+        if dtype_bits is not None:
+            elements = 1
+            for dim in shape:
+                elements *= dim
+            if elements * dtype_bits != (end - start) * 8:
+                raise SafetensorsHeaderError(f"invalid tensor size: {name}")
+        position = end
+    if position != buffer_size:
+        raise SafetensorsHeaderError("metadata incomplete buffer")
+
+
+def read_safetensors_metadata(path):
+    """
+    埋め込みメタデータを取得（safe_open(...).metadata() と同じ結果）
+
+    Returns:
+        dict: __metadata__（ない場合はNone）
+    """
+    return read_safetensors_header(path).get("__metadata__")
+
+
+class TagFrequencySummary:
+    """
+    ss_tag_frequency の解析結果（データセットごとの上位タグのみ保持）
+
+    元のJSONは数千タグになることがあるため、ノードが使う分だけを残す
+    （タグは多くのLoRAで共通なので intern して共有する）:
+      - first_tags: データセットごとの先頭 limit 個（記録順）
+      - top_tags:   データセットごとの頻度順上位 limit 個（同数は記録順）
+    解析時のエラーは保持しておき、参照したときに同じ例外を送出する
+    （ノード側の例外処理を json.loads を直接呼んでいたときと同じにするため）
+    """
+
+    __slots__ = ("truthy", "first_tags", "top_tags", "error", "top_error")
+
+    def __init__(self, tag_freq_str, limit=TAG_SUMMARY_LIMIT):
+        self.truthy = False
+        self.first_tags = []
+        self.top_tags = []
+        self.error = None
+        self.top_error = None
+
+        try:
+            tag_freq = json.loads(tag_freq_str)
+        except Exception as e:
+            self.error = e
+            return
+
+        self.truthy = bool(tag_freq)
+        if not self.truthy:
+            return
+
+        try:
+            datasets = list(tag_freq.values())
+            self.first_tags = [[sys.intern(tag) for tag in islice(tags.keys(), limit)] for tags in datasets]
+        except Exception as e:
+            self.error = e
+            return
+
+        try:
+            self.top_tags = [
+                [sys.intern(tag) for tag, freq in sorted(tags.items(), key=lambda x: x[1], reverse=True)[:limit]]
+                for tags in datasets
+            ]
+        except Exception as e:
+            self.top_error = e
+
+    @classmethod
+    def from_tags(cls, truthy, first_tags, top_tags):
+        """解析済みのタグから作成（マニフェストからの復元用）"""
+        summary = cls.__new__(cls)
+        summary.truthy = truthy
+        summary.first_tags = [[sys.intern(tag) for tag in tags] for tags in first_tags]
+        summary.top_tags = [[sys.intern(tag) for tag in tags] for tags in top_tags]
+        summary.error = None
+        summary.top_error = None
+        return summary
+
+    def to_dict(self):
+        """
+        JSONで保存できる形に変換（マニフェスト用）
+
+        Returns:
+            dict: {"truthy", "first_tags", "top_tags"}（解析エラーがある場合はNone）
+        """
+        if self.error is not None or self.top_error is not None:
+            return None
+        return {"truthy": self.truthy, "first_tags": self.first_tags, "top_tags": self.top_tags}
+
+    def dataset_first_tags(self):
+        """データセットごとの先頭タグ（解析エラー時は例外）"""
+        if self.error is not None:
+            raise self.error.with_traceback(None)
+        return self.first_tags
+
+    def dataset_top_tags(self):
+        """データセットごとの頻度順上位タグ（解析エラー時は例外）"""
+        if self.error is not None:
+            raise self.error.with_traceback(None)
+        if self.top_error is not None:
+            raise self.top_error.with_traceback(None)
+        return self.top_tags
+
+
+_header_cache = None
+_header_cache_lock = threading.Lock()
+
+
+def get_header_cache():
+    """埋め込みメタデータのキャッシュ（全ノード共通）"""
+    global _header_cache
+    with _header_cache_lock:
+        if _header_cache is None:
+            _header_cache = BoundedCache(get_cache_budget("headers"), name="Safetensors header cache")
+        return _header_cache
+
+
+def reduce_embedded_metadata(metadata):
+    """
+    __metadata__ からノードが使うキーだけを残す
+
+    Returns:
+        dict: EMBEDDED_METADATA_KEYS のうち存在するキーのみ
+              （ss_tag_frequency は TagFrequencySummary、metadata がない場合はNone）
+    """
+    if not metadata:
+        return None
+    embedded = {key: metadata[key] for key in EMBEDDED_METADATA_KEYS if key in metadata}
+    if "ss_tag_frequency" in embedded:
+        embedded["ss_tag_frequency"] = TagFrequencySummary(embedded["ss_tag_frequency"])
+    return embedded
+
+
+def read_embedded_metadata(path):
+    """
+    ノード用の埋め込みメタデータを取得（サイズ・mtimeが同じ間はキャッシュ）
+
+    Returns:
+        dict: EMBEDDED_METADATA_KEYS のうち存在するキーのみ
+              ss_tag_frequency は TagFrequencySummary
+              メタデータがない場合はNone
+
+    Raises:
+        OSError / SafetensorsHeaderError: safe_open が失敗する場合と同じ
+        QuarantinedFileError: 以前ヘッダーが不正で、その後変更されていない
+    """
+    st = os.stat(path)
+    cache = get_header_cache()
+    cached = cache.get(path)
+    if cached is not None and cached[0] == (st.st_size, st.st_mtime_ns):
+        return cached[1]
+
+    # ヘッダーが壊れているファイルは変更されるまで読まない
+    quarantine = get_quarantine()
+    quarantine.check(path, "safetensors", st)
+    try:
+        metadata = read_safetensors_metadata(path)
+    except SafetensorsHeaderError as e:
+        quarantine.add(path, "safetensors", st, e)
+        raise
+
+    embedded = reduce_embedded_metadata(metadata)
+    cache[path] = ((st.st_size, st.st_mtime_ns), embedded)
+    return embedded
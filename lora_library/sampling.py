@@ -0,0 +1,85 @@
+"""
+ランダム選択
+
+一覧を作らずにイテレータから k 個を選ぶリザーバサンプリング。
+大きなライブラリから数個だけ選ぶ場合に、メモリを O(k) に抑える。
+関連度の重み付きの選択（weighted_sample）もここに置く。
+"""
+
+import math
+import random
+
+
+def reservoir_sample(iterable, k, rng=random):
+    """
+    イテレータから k 個を一様ランダムに選択（重複なし）
+
+    Li の Algorithm L（スキップ数を幾何分布で求めるため、乱数の消費は
+    要素数ではなく O(k log(n/k))）。同じシード・同じ順序の入力なら
+    同じ結果になる。
+
+    Args:
+        iterable: 選択元（1回だけ走査する）
+        k: 選択する個数
+        rng: 乱数生成器（random モジュール互換）
+
+    Returns:
+        tuple: (選択された要素のリスト（ランダム順）, 走査した要素数)
+               要素数が k 未満の場合は全要素
+    """
+    if k <= 0:
+        return [], sum(1 for _ in iterable)
+
+    iterator = iter(iterable)
+    reservoir = []
+    for item in iterator:
+        reservoir.append(item)
+        if len(reservoir) == k:
+            break
+    count = len(reservoir)
+
+    if count == k:
+        w = math.exp(math.log(_open_random(rng)) / k)
+        next_index = count + math.floor(math.log(_open_random(rng)) / math.log(1.0 - w))
+        for item in iterator:
+            if count == next_index:
+                reservoir[rng.randrange(k)] = item
+                w *= math.exp(math.log(_open_random(rng)) / k)
+                next_index += 1 + math.floor(math.log(_open_random(rng)) / math.log(1.0 - w))
+            count += 1
+
+    # 先頭 k 個は入力順のまま残るため並びを混ぜる
+    rng.shuffle(reservoir)
+    return reservoir, count
+
+
+def _open_random(rng):
+    """(0, 1) の乱数（log(0) を避ける）"""
+    value = rng.random()
+    while value == 0.0:
+        value = rng.random()
+    return value
+
+
+def weighted_sample(items, weights, k, rng=random):
+    """
+    重みに比例した確率で k 個を選択（重複なし）
+
+    Efraimidis-Spirakis の方法（各要素に u^(1/w) のキーを付けて上位 k 個）。
+    重みが0以下の要素は選ばない。同じシード・同じ入力なら同じ結果になる。
+
+    Args:
+        items: 選択元のシーケンス
+        weights: items と同じ長さの重み
+        k: 選択する個数
+        rng: 乱数生成器（random モジュール互換）
+
+    Returns:
+        list: 選択された要素（キーの大きい順）。重みが正の要素が k 未満の場合はそのすべて
+    """
+    keyed = [
+        (math.log(_open_random(rng)) / weight, i)
+        for i, weight in enumerate(weights) if weight > 0
+    ]
+    keyed.sort(reverse=True)
+    return [items[i] for _, i in keyed[:max(0, k)]]
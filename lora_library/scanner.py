@@ -0,0 +1,564 @@
+"""
+LoRAフォルダのスキャン処理
+
+os.scandir で1ディレクトリずつ列挙し、LoRAファイルとサイドカー
+（.metadata.json / .info）をまとめて取得する。
+サブフォルダはスレッドプールで並列に列挙する（ネットワークマウントの
+レイテンシ対策）。結果は常にパス順でソートして返す。
+
+除外ルール（.loraignore / exclude_patterns）に一致するフォルダは
+列挙の時点で刈り込み、配下には降りない。
+
+シンボリックリンクのフォルダも辿る（glob の "**" と同じ）。リンク先が
+自分の祖先フォルダ（(st_dev, st_ino) で判定）の場合はループになるため降りない。
+"""
+
+import bisect
+import fnmatch
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from .fingerprint import file_identity
+
+
+# 対象とするLoRA拡張子（小文字）
+LORA_EXTENSIONS = ('.safetensors', '.pt', '.ckpt')
+
+# プレビューの拡張子（優先順位順）
+PREVIEW_STATIC_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+PREVIEW_ANIMATED_EXTENSIONS = ('.gif', '.webp')            # Pillowで対応可能
+PREVIEW_VIDEO_EXTENSIONS = ('.mp4', '.webm', '.avi', '.mov')  # opencv-python必要
+
+# 並列スキャンのスレッド数（環境変数 RANDOM_LORA_SCAN_WORKERS で変更可）
+DEFAULT_SCAN_WORKERS = 8
+
+# glob.glob と同じ拡張子の一致（Windows 以外は大文字小文字を区別）
+GLOB_MATCH_CASE = os.path.normcase("A") == "A"
+
+# フォルダごとの除外ルールファイル
+IGNORE_FILENAME = ".loraignore"
+
+# サイドカーの拡張子（優先順位順）
+SIDECAR_SUFFIXES = {
+    "metadata_json": ".metadata.json",  # ComfyUI Lora Manager
+    "info": ".info",                    # Civitai Helper
+}
+
+
+class DirectoryListing:
+    """1ディレクトリ分のスキャン結果"""
+
+    def __init__(self, path, mtime_ns, ancestors=frozenset()):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        # このフォルダと祖先フォルダの (st_dev, st_ino)（シンボリックリンクのループ検出用）
+        self.ancestors = ancestors
+        self.subdirs = []   # サブディレクトリの絶対パス
+        self.loras = []     # (name, size, mtime_ns, sidecars, identity) のリスト
+        # sidecars: {"metadata_json": ファイル名, "info": ファイル名, "previews": [ファイル名, ...]}
+        # identity: リンク先の実体の "dev:ino"（fingerprint.file_identity）
+        self.rules = IgnoreRules()     # 配下に適用する .loraignore ルール
+        self.ignore_mtime_ns = None    # このフォルダの .loraignore のmtime（なければNone）
+        self.pruned = 0                # .loraignore で除外したエントリ数
+        self.excluded_subdirs = []     # exclude_patterns で降りなかったサブディレクトリ
+
+    def __repr__(self):
+        return f"DirectoryListing({self.path!r}, subdirs={len(self.subdirs)}, loras={len(self.loras)})"
+
+
+class IgnoreRules:
+    """
+    除外ルール（.gitignore の簡易版）
+
+    書式（1行1パターン）:
+      - 空行・# で始まる行は無視
+      - "/" を含まないパターンは、どの階層でもファイル名・フォルダ名に一致
+          例: _archive, *.bak, training_output
+      - "/" を含むパターンは、基準フォルダからの相対パスに一致
+          例: /backup, old/*
+      - 末尾 "/" はフォルダのみに一致
+          例: tmp/
+      - ワイルドカードは fnmatch 形式（* ? [...]）、大文字小文字は無視
+      - 否定パターン（!）は未対応（無視）
+
+    .loraignore はそのファイルがあるフォルダが基準、
+    exclude_patterns は検索対象フォルダが基準。
+    """
+
+    def __init__(self, rules=()):
+        # (基準フォルダ, 正規表現, フォルダのみ, 相対パスで照合) のタプル
+        self.rules = tuple(rules)
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def __eq__(self, other):
+        return isinstance(other, IgnoreRules) and self.rules == other.rules
+
+    def __hash__(self):
+        return hash(self.rules)
+
+    def extend(self, base_dir, lines):
+        """base_dir を基準としたパターンを追加した新しいルールを返す"""
+        rules = list(self.rules)
+        for line in lines:
+            pattern = line.strip()
+            if not pattern or pattern.startswith(("#", "!")):
+                continue
+            dir_only = pattern.endswith("/")
+            pattern = pattern.strip("/") if dir_only else pattern
+            anchored = "/" in pattern
+            pattern = pattern.lstrip("/")
+            if not pattern:
+                continue
+            regex = re.compile(fnmatch.translate(pattern.lower()))
+            rules.append((base_dir, regex, dir_only, anchored))
+        return IgnoreRules(rules) if len(rules) != len(self.rules) else self
+
+    def match(self, path, is_dir):
+        """パスが除外対象か"""
+        name = None
+        for base_dir, regex, dir_only, anchored in self.rules:
+            if dir_only and not is_dir:
+                continue
+            if anchored:
+                prefix = base_dir.rstrip(os.sep) + os.sep
+                if not path.startswith(prefix):
+                    continue
+                target = path[len(prefix):].replace(os.sep, "/").lower()
+            else:
+                if name is None:
+                    name = os.path.basename(path).lower()
+                target = name
+            if regex.match(target):
+                return True
+        return False
+
+    def match_tree(self, path, root):
+        """path自身または root からの途中のフォルダが除外対象か"""
+        current = path
+        while is_within(current, root) and current != root:
+            if self.match(current, True):
+                return True
+            current = os.path.dirname(current)
+        return False
+
+
+def parse_exclude_patterns(root, exclude_patterns):
+    """
+    ノード入力の exclude_patterns をルールに変換
+
+    カンマまたは改行区切り（例: "_archive, training_output, backup/"）
+    """
+    if not exclude_patterns or not exclude_patterns.strip():
+        return IgnoreRules()
+    lines = re.split(r"[,\n]", exclude_patterns)
+    return IgnoreRules().extend(root, lines)
+
+
+def read_ignore_file(dir_path):
+    """
+    フォルダの .loraignore を読み込み
+
+    Returns:
+        tuple: (行のリスト, mtime_ns)（ファイルがなければ (None, None)）
+    """
+    ignore_path = os.path.join(dir_path, IGNORE_FILENAME)
+    try:
+        with open(ignore_path, "r", encoding="utf-8") as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            return f.read().splitlines(), mtime_ns
+    except FileNotFoundError:
+        return None, None
+    except (OSError, UnicodeDecodeError) as e:
+        print(f"[RandomLoRALoader] Warning: Failed to read {ignore_path}: {e}")
+        return None, None
+
+
+def load_inherited_rules(dir_path):
+    """
+    親フォルダの .loraignore から dir_path に適用されるルールを組み立て
+
+    （dir_path 自身の .loraignore は list_directory で読み込む）
+    """
+    ancestors = []
+    parent = os.path.dirname(dir_path)
+    while parent and parent != dir_path:
+        ancestors.append(parent)
+        dir_path, parent = parent, os.path.dirname(parent)
+
+    rules = IgnoreRules()
+    for ancestor in reversed(ancestors):
+        lines, _ = read_ignore_file(ancestor)
+        if lines:
+            rules = rules.extend(ancestor, lines)
+    return rules
+
+
+def load_ancestor_keys(dir_path):
+    """
+    dir_path の祖先フォルダの (st_dev, st_ino)（dir_path 自身は含まない）
+
+    （走査の途中からは DirectoryListing.ancestors を引き継ぐ）
+    """
+    keys = set()
+    parent = os.path.dirname(dir_path)
+    while parent and parent != dir_path:
+        try:
+            st = os.stat(parent)
+            keys.add((st.st_dev, st.st_ino))
+        except OSError:
+            pass
+        dir_path, parent = parent, os.path.dirname(parent)
+    return frozenset(keys)
+
+
+def normalize_folder_path(folder_path):
+    """フォルダパスを絶対パスに正規化（インデックスのキーとして使用）"""
+    return os.path.normpath(os.path.abspath(folder_path))
+
+
+def is_within(path, root):
+    """pathがroot自身またはその配下か"""
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def covers(scan, request):
+    """
+    走査 (root, include_subfolders) の結果から request の一覧を導出できるか
+
+    同じフォルダなら再帰走査は非再帰の要求も満たす。
+    配下のフォルダは再帰走査の場合のみ満たす。
+    """
+    scan_root, scan_recursive = scan
+    request_root, request_recursive = request
+    if scan_root == request_root:
+        return bool(scan_recursive) or not request_recursive
+    return bool(scan_recursive) and is_within(request_root, scan_root)
+
+
+def plan_scans(requests):
+    """
+    複数の走査要求から、実際に走査するフォルダを決める（同一・入れ子を統合）
+
+    例: [("loras", True), ("loras/style", True), ("loras", False)]
+        → [("loras", True)] のみ走査し、他はその結果から導出
+
+    Args:
+        requests: (正規化済みフォルダ, include_subfolders) のリスト
+
+    Returns:
+        list: 走査する (フォルダ, include_subfolders) のリスト
+    """
+    # 浅いフォルダ・再帰走査を先に採用する
+    candidates = sorted(
+        {(root, bool(recursive)) for root, recursive in requests},
+        key=lambda r: (r[0].count(os.sep), len(r[0]), not r[1], r[0])
+    )
+    scans = []
+    for request in candidates:
+        if not any(covers(scan, request) for scan in scans):
+            scans.append(request)
+    return scans
+
+
+def is_lora_filename(name, extensions=LORA_EXTENSIONS):
+    """LoRA拡張子かどうか（大文字小文字無視）"""
+    return name.lower().endswith(extensions)
+
+
+def get_preview_priority(filename):
+    """プレビュー候補の優先順位（小さいほど優先、対象外はNone）"""
+    lower = filename.lower()
+    if lower.endswith(PREVIEW_STATIC_EXTENSIONS):
+        return 0  # 最優先
+    if lower.endswith(PREVIEW_ANIMATED_EXTENSIONS):
+        return 1  # 次優先
+    if lower.endswith(PREVIEW_VIDEO_EXTENSIONS):
+        return 2  # 最後
+    return None
+
+
+class SidecarGrouper:
+    """
+    ディレクトリのエントリ一覧からLoRAごとのサイドカーを振り分ける
+
+    エントリを1回だけソートしておき、LoRAごとの前方一致は二分探索で引く
+    （LoRAごとに listdir + startswith を繰り返さない）
+    """
+
+    def __init__(self, file_names):
+        self.names = set(file_names)
+        self.lower_names = sorted((name.lower(), name) for name in file_names)
+        self._keys = [lower for lower, _ in self.lower_names]
+
+    def group(self, lora_name):
+        """
+        LoRAファイル名に対応するサイドカーを取得
+
+        Returns:
+            dict: {"metadata_json": 名前, "info": 名前, "previews": [名前, ...]}
+                  （見つかったものだけ）
+        """
+        base_name = os.path.splitext(lora_name)[0]
+        sidecars = {}
+
+        # メタデータ（完全一致）
+        for key, suffix in SIDECAR_SUFFIXES.items():
+            if base_name + suffix in self.names:
+                sidecars[key] = base_name + suffix
+
+        # プレビュー（ファイル名で始まるもの、大文字小文字無視）
+        prefix = base_name.lower()
+        start = bisect.bisect_left(self._keys, prefix)
+        candidates = []
+        for lower, name in self.lower_names[start:]:
+            if not lower.startswith(prefix):
+                break
+            priority = get_preview_priority(name)
+            if priority is not None:
+                candidates.append((priority, name))
+        if candidates:
+            candidates.sort()
+            sidecars["previews"] = [name for _, name in candidates]
+
+        return sidecars
+
+
+def list_directory(dir_path, extensions=LORA_EXTENSIONS, rules=None, exclude=None, ancestors=None):
+    """
+    1ディレクトリを列挙してLoRAファイル・サブディレクトリ・サイドカーを取得
+
+    Args:
+        dir_path: ディレクトリの絶対パス
+        extensions: 対象拡張子（小文字のタプル）
+        rules: 親フォルダから引き継いだ .loraignore ルール
+        exclude: exclude_patterns のルール（一致したフォルダは降りずに記録のみ、
+                 ファイルは呼び出し側で除外する）
+        ancestors: 祖先フォルダの (st_dev, st_ino)（Noneなら親フォルダを stat して作成）
+
+    Returns:
+        DirectoryListing: 列挙結果（読めない場合はNone）
+    """
+    try:
+        st = os.stat(dir_path)
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+    except OSError as e:
+        print(f"[RandomLoRALoader] Folder read error: {dir_path}: {e}")
+        return None
+
+    if ancestors is None:
+        ancestors = load_ancestor_keys(dir_path)
+    listing = DirectoryListing(dir_path, st.st_mtime_ns, ancestors | {(st.st_dev, st.st_ino)})
+    listing.rules = rules or IgnoreRules()
+    file_names = []
+    lora_entries = []
+
+    # このフォルダの .loraignore（配下にも適用）
+    if any(entry.name == IGNORE_FILENAME for entry in entries):
+        lines, listing.ignore_mtime_ns = read_ignore_file(dir_path)
+        if lines:
+            listing.rules = listing.rules.extend(dir_path, lines)
+
+    for entry in entries:
+        try:
+            # シンボリックリンクのディレクトリも辿る（glob の "**" と同じ）
+            is_dir = entry.is_dir()
+
+            if listing.rules and listing.rules.match(entry.path, is_dir):
+                listing.pruned += 1
+                continue
+            if is_dir:
+                if entry.is_symlink():
+                    target = entry.stat()
+                    if (target.st_dev, target.st_ino) in listing.ancestors:
+                        # 祖先フォルダへのリンク（降りるとループになる）
+                        print(f"[RandomLoRALoader] Skipping symlink loop: {entry.path}")
+                        continue
+                if exclude and exclude.match(entry.path, True):
+                    listing.excluded_subdirs.append(entry.path)
+                else:
+                    listing.subdirs.append(entry.path)
+                continue
+            file_names.append(entry.name)
+            if is_lora_filename(entry.name, extensions) and entry.is_file():
+                lora_entries.append(entry)
+        except OSError:
+            continue
+
+    # 同じフォルダ内のサイドカーをエントリ一覧から振り分け（追加のI/Oなし）
+    grouper = SidecarGrouper(file_names)
+
+    for entry in lora_entries:
+        try:
+            st = entry.stat()
+        except OSError:
+            continue
+        listing.loras.append((
+            entry.name, st.st_size, st.st_mtime_ns, grouper.group(entry.name), file_identity(st)
+        ))
+
+    listing.subdirs.sort()
+    listing.excluded_subdirs.sort()
+    listing.loras.sort()
+    return listing
+
+
+def find_sidecars(lora_path):
+    """
+    インデックスにないLoRAのサイドカーを直接探す（フォルダを1回列挙）
+
+    Returns:
+        dict: {"metadata_json": パス, "info": パス, "previews": [パス, ...]}
+    """
+    dir_path = os.path.dirname(lora_path)
+    try:
+        with os.scandir(dir_path) as it:
+            file_names = [entry.name for entry in it if not entry.is_dir()]
+    except OSError as e:
+        print(f"[RandomLoRALoader] Folder read error: {e}")
+        return {}
+    return resolve_sidecars(dir_path, SidecarGrouper(file_names).group(os.path.basename(lora_path)))
+
+
+def resolve_sidecars(dir_path, sidecars):
+    """サイドカーのファイル名をフルパスに変換"""
+    resolved = {}
+    for key, value in sidecars.items():
+        if key == "previews":
+            resolved[key] = [os.path.join(dir_path, name) for name in value]
+        else:
+            resolved[key] = os.path.join(dir_path, value)
+    return resolved
+
+
+def get_scan_budget():
+    """
+    走査の時間制限（秒、0以下は無制限）
+
+    RANDOM_LORA_SCAN_BUDGET で設定。超過した場合は前回の一覧
+    （初回は途中までの一覧）を使い、走査はバックグラウンドで続ける
+    """
+    try:
+        return float(os.environ.get("RANDOM_LORA_SCAN_BUDGET", 0))
+    except ValueError:
+        return 0.0
+
+
+class ScanProgress:
+    """走査の進捗（時間制限で打ち切ったときに途中までの結果を参照する）"""
+
+    def __init__(self):
+        self.listings = []
+        self.entries = 0
+        self._lock = threading.Lock()
+
+    def add(self, listing):
+        with self._lock:
+            self.listings.append(listing)
+            self.entries += 1 + len(listing.subdirs) + len(listing.loras)
+
+    def count(self, entries=1):
+        with self._lock:
+            self.entries += entries
+
+    def snapshot(self):
+        """(これまでの列挙結果のリスト, 確認したエントリ数)"""
+        with self._lock:
+            return list(self.listings), self.entries
+
+
+def get_scan_workers():
+    """並列スキャンのスレッド数を取得"""
+    try:
+        return max(1, int(os.environ.get("RANDOM_LORA_SCAN_WORKERS", DEFAULT_SCAN_WORKERS)))
+    except ValueError:
+        return DEFAULT_SCAN_WORKERS
+
+
+def scan_tree(root, include_subfolders, extensions=LORA_EXTENSIONS, max_workers=None,
+              rules=None, exclude=None, progress=None):
+    """
+    フォルダを走査してディレクトリごとの列挙結果を返す
+
+    サブフォルダは上限付きスレッドプールで並列に列挙する。
+    DirEntry の種別情報を使うため、isfile などの追加 stat は発生しない。
+    .loraignore / exclude_patterns に一致するフォルダには降りない。
+
+    Args:
+        root: 正規化済みのルートフォルダ
+        include_subfolders: サブフォルダを含めるか
+        extensions: 対象拡張子
+        max_workers: スレッド数（Noneなら get_scan_workers()、1なら逐次）
+        rules: 親フォルダの .loraignore ルール（Noneなら親フォルダから読み込み）
+        exclude: exclude_patterns のルール
+        progress: ScanProgress（列挙したディレクトリを逐次追加）
+
+    Returns:
+        list: DirectoryListing のリスト（パス順でソート済み）
+    """
+    if rules is None:
+        rules = load_inherited_rules(root)
+
+    if not include_subfolders:
+        listing = list_directory(root, extensions, rules, exclude)
+        if listing is None:
+            return []
+        if progress is not None:
+            progress.add(listing)
+        return [listing]
+
+    workers = max_workers or get_scan_workers()
+    listings = []
+
+    if workers <= 1:
+        stack = [(root, None)]
+        while stack:
+            dir_path, parent = stack.pop()
+            if parent is None:
+                listing = list_directory(dir_path, extensions, rules, exclude)
+            else:
+                listing = list_directory(dir_path, extensions, parent.rules, exclude, parent.ancestors)
+            if listing is not None:
+                listings.append(listing)
+                if progress is not None:
+                    progress.add(listing)
+                stack.extend((subdir, listing) for subdir in listing.subdirs)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="RandomLoRAScan") as pool:
+            pending = {pool.submit(list_directory, root, extensions, rules, exclude)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    listing = future.result()
+                    if listing is None:
+                        continue
+                    listings.append(listing)
+                    if progress is not None:
+                        progress.add(listing)
+                    for subdir in listing.subdirs:
+                        pending.add(pool.submit(
+                            list_directory, subdir, extensions, listing.rules, exclude, listing.ancestors
+                        ))
+
+    listings.sort(key=lambda listing: listing.path)
+    return listings
+
+
+def walk_lora_files(root, include_subfolders, extensions=LORA_EXTENSIONS, max_workers=None, exclude=None):
+    """
+    フォルダ内のLoRAファイルパスを取得（インデックスを使わない直接走査）
+
+    Returns:
+        list: LoRAファイルパスのリスト（パス順でソート済み）
+    """
+    paths = []
+    for listing in scan_tree(root, include_subfolders, extensions, max_workers, exclude=exclude):
+        paths.extend(os.path.join(listing.path, lora[0]) for lora in listing.loras)
+    if exclude:
+        paths = [p for p in paths if not exclude.match(p, False)]
+    paths.sort()
+    return paths
@@ -0,0 +1,268 @@
+"""
+サイドカーJSON（.metadata.json / .info）から必要なキーだけを取り出す
+
+Civitai の .info は images 配列（作例ごとの URL・生成パラメータ・リソース一覧など）
+のために数MBになることがある。ノードが使うのは一部のキーだけなので、
+大きなファイルは全体のオブジェクトを作らずに必要な値だけを解析する。
+
+  - 取り出すキーは METADATA_FIELDS（モデル名・trainedWords・タグ・
+    作例の prompt / negativePrompt）
+  - ファイルは RANDOM_LORA_JSON_STREAM_KB ずつ読み足し、解析済みの部分は捨てる
+    （ファイル全体の文字列を作らない）
+  - 必要なキーを含む辞書・配列（civitai, images）だけをたどり、
+    それ以外の値や作例1件分は1つずつ解析してすぐ捨てる。同時にメモリに
+    持つのは解析中の値1つ分・読み込み中のチャンクと取り出した値だけ
+  - 値の解析には標準の json（C実装）の raw_decode / scanstring を使う
+  - 小さいファイルは従来どおり json.loads で全体を解析する
+
+結果は元のJSONと同じ形の辞書で、必要なキーだけを含む。images[].meta は
+空かどうかの判定を変えないよう、不要なキーも値を None にして残す。
+
+設定（環境変数）:
+  RANDOM_LORA_JSON_STREAM_KB  部分解析に切り替えるファイルサイズ・読み込む単位（KB、デフォルト: 256、0以下は常に全体を解析）
+"""
+
+import json
+import os
+import re
+
+
+DEFAULT_STREAM_THRESHOLD_KB = 256
+
+# 値をそのまま解析するキー
+FULL = "full"
+
+# 作例の meta から残すキー
+META_KEYS = ("prompt", "negativePrompt")
+
+
+def _reduce_image(image):
+    """
+    作例1件から meta の prompt / negativePrompt だけを残す
+
+    meta の他のキーは値を None にして残す（meta が空かどうかの判定を変えないため）
+    """
+    if not isinstance(image, dict):
+        return image
+    if "meta" not in image:
+        return {}
+    meta = image["meta"]
+    if isinstance(meta, dict):
+        meta = {key: (value if key in META_KEYS else None) for key, value in meta.items()}
+    return {"meta": meta}
+
+
+# ノードが使うキー（辞書は中に降りる、リストは各要素に同じ指定を適用、
+# 関数は要素を1つずつ解析して必要な部分だけにする）
+METADATA_FIELDS = {
+    "model_name": FULL,
+    "tags": FULL,
+    "civitai": {
+        "name": FULL,
+        "trainedWords": FULL,
+        "model": {"name": FULL, "tags": FULL},
+        "images": [_reduce_image],
+    },
+}
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# 数値の続きになりうる文字（読み込んだ範囲がこれだけで終わる場合は読み足して解析し直す）
+_NUMBER_TAIL = re.compile(r"[0-9.eE+-]*")
+
+_decoder = json.JSONDecoder()
+
+
+def get_stream_threshold():
+    """部分解析に切り替えるファイルサイズ（バイト、0なら常に全体を解析）"""
+    try:
+        kilobytes = float(os.environ.get("RANDOM_LORA_JSON_STREAM_KB", DEFAULT_STREAM_THRESHOLD_KB))
+    except ValueError:
+        kilobytes = DEFAULT_STREAM_THRESHOLD_KB
+    return max(0, int(kilobytes * 1024))
+
+
+class _Stream:
+    """
+    JSONテキストを先頭から順に読む
+
+    ファイルは chunk_size 文字ずつ読み足し、解析済みの部分は読み足すときに捨てる
+    （持つのは解析中の値1つ分と次の1チャンクだけ）。値がチャンクに収まらない場合は
+    読む量を倍にして解析し直す（何度も読み直さないため）
+    """
+
+    __slots__ = ("text", "pos", "file", "chunk_size")
+
+    def __init__(self, text, file=None, chunk_size=0):
+        self.text = text
+        self.pos = 0
+        self.file = file
+        self.chunk_size = chunk_size
+
+    def _fill(self):
+        """読み足す（ファイルの終わりならFalse）"""
+        if self.file is None:
+            return False
+        if self.pos:
+            self.text = self.text[self.pos:]
+            self.pos = 0
+        chunk = self.file.read(max(self.chunk_size, len(self.text)))
+        if not chunk:
+            self.file = None
+            return False
+        self.text += chunk
+        return True
+
+    def peek(self):
+        """空白を飛ばし、次の1文字を返す（終わりなら空文字）"""
+        while True:
+            self.pos = _WHITESPACE.match(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self._fill():
+                return self.text[self.pos:self.pos + 1]
+
+    def _scan(self, scanner, start):
+        while True:
+            try:
+                value, end = scanner(self.text, self.pos + start)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # 数値は読み込んだ範囲の終わりで切れている可能性がある（"1.5" の後に "e3" が続くなど）
+            if self.file is not None and _NUMBER_TAIL.match(self.text, end).end() == len(self.text) \
+                    and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def decode(self):
+        """次の値を解析して返す"""
+        self.peek()
+        return self._scan(_decoder.raw_decode, 0)
+
+    def string(self):
+        """次の文字列（" の位置から）を解析して返す"""
+        return self._scan(json.decoder.scanstring, 1)
+
+    def advance(self):
+        self.pos += 1
+
+    def read_all(self):
+        """残りをすべて読む"""
+        rest = self.text[self.pos:]
+        if self.file is not None:
+            rest += self.file.read()
+            self.file = None
+        self.text, self.pos = rest, len(rest)
+        return rest
+
+    def error(self, message):
+        return json.JSONDecodeError(message, self.text, self.pos)
+
+
+def _parse_value(stream, fields):
+    """fields の指定に従って値を解析する"""
+    char = stream.peek()
+    if isinstance(fields, dict) and char == "{":
+        return _parse_object(stream, fields)
+    if isinstance(fields, list) and char == "[":
+        return _parse_array(stream, fields[0])
+    if callable(fields):
+        return fields(stream.decode())
+    # 想定と違う型（null など）や FULL はそのまま解析
+    return stream.decode()
+
+
+def _parse_object(stream, fields):
+    """オブジェクトから fields のキーだけを取り出す（stream は { の位置）"""
+    result = {}
+    stream.advance()
+    if stream.peek() == "}":
+        stream.advance()
+        return result
+
+    while True:
+        if stream.peek() != '"':
+            raise stream.error("Expecting property name enclosed in double quotes")
+        key = stream.string()
+        if stream.peek() != ":":
+            raise stream.error("Expecting ':' delimiter")
+        stream.advance()
+
+        if key in fields:
+            result[key] = _parse_value(stream, fields[key])
+        else:
+            # 解析してすぐ捨てる（同時に持つのはこの値1つ分だけ）
+            stream.decode()
+
+        char = stream.peek()
+        stream.advance()
+        if char == "}":
+            return result
+        if char != ",":
+            raise stream.error("Expecting ',' delimiter")
+
+
+def _parse_array(stream, fields):
+    """配列の各要素に fields を適用（stream は [ の位置）"""
+    result = []
+    stream.advance()
+    if stream.peek() == "]":
+        stream.advance()
+        return result
+
+    while True:
+        result.append(_parse_value(stream, fields))
+        char = stream.peek()
+        stream.advance()
+        if char == "]":
+            return result
+        if char != ",":
+            raise stream.error("Expecting ',' delimiter")
+
+
+def _extract(stream, fields):
+    if stream.peek() != "{":
+        return json.loads(stream.read_all())
+    result = _parse_object(stream, fields)
+    if stream.peek():
+        raise stream.error("Extra data")
+    return result
+
+
+def extract_fields(text, fields=METADATA_FIELDS):
+    """
+    JSON文字列から fields のキーだけを取り出す
+
+    トップレベルがオブジェクトでない場合は json.loads と同じ結果を返す。
+    読み飛ばす値も解析するため、json.loads でエラーになるファイルはここでもエラーになる。
+
+    Raises:
+        json.JSONDecodeError: 構造が不正
+    """
+    return _extract(_Stream(text), fields)
+
+
+def load_metadata_json(path, size=None):
+    """
+    サイドカーJSONを読み込む（大きいファイルはノードが使うキーだけ）
+
+    Args:
+        path: .metadata.json / .info のパス
+        size: ファイルサイズ（stat 済みの場合、省略時は取得する）
+
+    Returns:
+        JSONの内容（大きいファイルは METADATA_FIELDS のキーのみ）
+
+    Raises:
+        OSError: 読み込みに失敗
+        ValueError: UTF-8・JSONとして不正
+    """
+    if size is None:
+        size = os.path.getsize(path)
+    threshold = get_stream_threshold()
+    with open(path, 'r', encoding='utf-8') as f:
+        if not threshold or size < threshold:
+            return json.loads(f.read())
+        # 全体を読み込まず、しきい値と同じ大きさずつ読み足して解析する
+        return _extract(_Stream("", f, threshold), METADATA_FIELDS)
@@ -0,0 +1,181 @@
+"""
+起動時のバックグラウンド準備（任意機能）
+
+カスタムノードの読み込み時に低優先度のスレッドを起動し、LoRAフォルダの
+インデックスとメタデータのキーワードキャッシュを事前に作っておく。
+最初の search_in_metadata=True の実行で初回構築の待ち時間が発生しない。
+
+  - 起動を遅らせないよう、一定時間待ってから開始する
+  - スレッドの優先度を下げる（Linuxのみ、スレッド単位の nice）
+  - プロンプト実行中は待機し、キューが空になってから続ける
+
+設定（環境変数）:
+  RANDOM_LORA_WARMUP        0: 無効（デフォルト） / 1: 有効
+  RANDOM_LORA_WARMUP_ROOTS  対象フォルダ（os.pathsep 区切り、デフォルト: ComfyUIの loras フォルダ）
+  RANDOM_LORA_WARMUP_DELAY  開始までの秒数（デフォルト: 10）
+"""
+
+import os
+import threading
+import time
+
+from .index import get_library_index
+from .quarantine import get_quarantine
+
+
+DEFAULT_START_DELAY = 10.0
+
+# プロンプト実行中に再確認する間隔（秒）
+BUSY_POLL_INTERVAL = 1.0
+
+# ファイルごとに譲る時間（秒、GILを実行中の処理に渡すため）
+YIELD_INTERVAL = 0.001
+
+# スレッドの nice 値（Linuxのみ）
+WARMUP_NICENESS = 19
+
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+
+
+def is_warmup_enabled():
+    """起動時の準備が有効か"""
+    value = os.environ.get("RANDOM_LORA_WARMUP", "0").strip().lower()
+    return value not in ("", "0", "off", "false", "no")
+
+
+def get_warmup_delay():
+    """開始までの秒数"""
+    try:
+        return max(0.0, float(os.environ.get("RANDOM_LORA_WARMUP_DELAY", DEFAULT_START_DELAY)))
+    except ValueError:
+        return DEFAULT_START_DELAY
+
+
+def get_warmup_roots():
+    """
+    準備対象のフォルダ一覧
+
+    優先順位:
+      1. 環境変数 RANDOM_LORA_WARMUP_ROOTS
+      2. ComfyUIの loras フォルダ（extra_model_paths.yaml の設定を含む）
+    """
+    env_roots = os.environ.get("RANDOM_LORA_WARMUP_ROOTS", "").strip()
+    if env_roots:
+        roots = [r.strip() for r in env_roots.split(os.pathsep) if r.strip()]
+    else:
+        try:
+            import folder_paths
+            roots = list(folder_paths.get_folder_paths("loras"))
+        except Exception:
+            roots = []
+
+    # 重複を除いて存在するフォルダのみ（順序維持）
+    roots = [os.path.abspath(os.path.expanduser(r)) for r in roots]
+    return [r for r in dict.fromkeys(roots) if os.path.isdir(r)]
+
+
+def is_prompt_running():
+    """ComfyUIでプロンプトが実行中・待機中か（取得できない場合はFalse）"""
+    try:
+        import server
+        prompt_queue = server.PromptServer.instance.prompt_queue
+        return prompt_queue.get_tasks_remaining() > 0
+    except Exception:
+        return False
+
+
+def _lower_thread_priority():
+    """現在のスレッドの優先度を下げる（Linuxのみ、失敗しても続行）"""
+    if not hasattr(os, "setpriority") or not hasattr(threading, "get_native_id"):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), WARMUP_NICENESS)
+    except OSError:
+        pass
+
+
+def _wait_until_idle(stop):
+    """プロンプト実行中は待機（stop が設定されたらFalse）"""
+    while is_prompt_running():
+        if stop.wait(BUSY_POLL_INTERVAL):
+            return False
+    return not stop.is_set()
+
+
+def run_warmup(roots, keyword_func, stop=None):
+    """
+    フォルダのインデックスとキーワードキャッシュを作る
+
+    Args:
+        roots: 対象フォルダのリスト（サブフォルダを含めて走査）
+        keyword_func: LoRAパスを受け取りキーワードを返す関数（結果をキャッシュするもの）
+        stop: 中断用の threading.Event（省略可）
+
+    Returns:
+        int: キーワードを準備したファイル数
+    """
+    stop = stop or threading.Event()
+    index = get_library_index()
+    started = time.time()
+    warmed = 0
+
+    for root in roots:
+        if not _wait_until_idle(stop):
+            break
+        lora_files = index.list_lora_files(root, True)
+
+        for lora_path in lora_files:
+            if not _wait_until_idle(stop):
+                break
+            try:
+                keyword_func(lora_path)
+                warmed += 1
+            except Exception as e:
+                print(f"[RandomLoRALoader] Warm-up skipped {os.path.basename(lora_path)}: {e}")
+            time.sleep(YIELD_INTERVAL)
+
+    index.flush()
+    elapsed = time.time() - started
+    print(f"[RandomLoRALoader] Warm-up finished: {warmed} LoRAs in {len(roots)} folder(s) ({elapsed:.1f}s)")
+    quarantine_report = get_quarantine().format_report()
+    if quarantine_report:
+        print(f"[RandomLoRALoader] {quarantine_report}")
+    return warmed
+
+
+def start_warmup(keyword_func, roots=None, delay=None):
+    """
+    起動時の準備をバックグラウンドで開始（無効な場合・起動済みの場合は何もしない）
+
+    Args:
+        keyword_func: LoRAパスを受け取りキーワードを返す関数
+        roots: 対象フォルダ（Noneなら get_warmup_roots()、開始時に取得）
+        delay: 開始までの秒数（Noneなら get_warmup_delay()）
+
+    Returns:
+        threading.Thread or None: 起動したスレッド
+    """
+    global _warmup_thread
+
+    if not is_warmup_enabled():
+        return None
+
+    with _warmup_lock:
+        if _warmup_thread is not None:
+            return None
+
+        if delay is None:
+            delay = get_warmup_delay()
+
+        def run():
+            _lower_thread_priority()
+            time.sleep(delay)
+            try:
+                run_warmup(get_warmup_roots() if roots is None else roots, keyword_func)
+            except Exception as e:
+                print(f"[RandomLoRALoader] Warm-up error: {e}")
+
+        _warmup_thread = threading.Thread(target=run, name="RandomLoRAWarmup", daemon=True)
+        _warmup_thread.start()
+        return _warmup_thread
@@ -0,0 +1,285 @@
+"""
+LoRAフォルダの監視（任意機能）
+
+長時間稼働するComfyUIサーバー向け。フォルダを監視してインデックスの
+メモリ上の一覧を常に最新に保ち、_find_lora_files がI/Oなしで即座に
+返せるようにする。
+
+  - Linux では inotify（ctypes経由、追加依存なし）
+  - それ以外・ネットワークマウント（NFS/SMB等）・監視数上限時はポーリング
+  - 監視はノードが初めてフォルダを使ったときに作成
+  - 一定時間使われなかった監視は自動で解除
+
+設定（環境変数）:
+  RANDOM_LORA_WATCH       0: 無効（デフォルト） / 1: 有効 / poll: 常にポーリング
+  RANDOM_LORA_WATCH_IDLE  未使用の監視を解除するまでの秒数（デフォルト: 1800）
+  RANDOM_LORA_WATCH_POLL  ポーリング間隔の秒数（デフォルト: 10）
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from .scanner import covers
+
+
+DEFAULT_IDLE_TIMEOUT = 1800.0
+DEFAULT_POLL_INTERVAL = 10.0
+
+# イベント後、まとめて更新するまでの待ち時間（コピー中の連続イベント対策）
+DEBOUNCE_SECONDS = 0.5
+
+# inotify 定数（linux/inotify.h）
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# ディレクトリのエントリ変化のみ監視（インデックスのmtime判定と同じ粒度）
+WATCH_MASK = (IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")
+
+# inotify が他クライアントの変更を検知できないファイルシステム
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "fuse.sshfs", "afs", "ceph", "glusterfs",
+}
+
+
+def _env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+def get_watch_mode():
+    """監視モードを取得（"off" / "auto" / "poll"）"""
+    value = os.environ.get("RANDOM_LORA_WATCH", "0").strip().lower()
+    if value in ("", "0", "off", "false", "no"):
+        return "off"
+    if value == "poll":
+        return "poll"
+    return "auto"
+
+
+def _load_libc():
+    """inotify 用の libc を読み込み（Linux以外はNone）"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def get_filesystem_type(path):
+    """pathが属するファイルシステムの種類（/proc/mounts、取得できなければNone）"""
+    try:
+        with open("/proc/mounts", "r", encoding="utf-8") as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return None
+
+    real_path = os.path.realpath(path)
+    best_point, best_type = "", None
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        # /proc/mounts ではスペースが \040 にエスケープされる
+        mount_point = fields[1].replace("\\040", " ")
+        if (real_path == mount_point or real_path.startswith(mount_point.rstrip("/") + "/")) \
+                and len(mount_point) > len(best_point):
+            best_point, best_type = mount_point, fields[2]
+    return best_type
+
+
+class _FolderWatch:
+    """1フォルダ分の監視（専用スレッドで動作）"""
+
+    def __init__(self, manager, root, include_subfolders, use_inotify, exclude=None):
+        self.manager = manager
+        self.root = root
+        self.include_subfolders = include_subfolders
+        # 最後に使われた exclude_patterns（除外中のフォルダは更新しない）
+        self.exclude = exclude
+        self.last_used = time.time()
+        self.mode = "poll"
+
+        self._fd = None
+        self._wd_to_dir = {}
+        self._dir_to_wd = {}
+        self._stop = threading.Event()
+
+        if use_inotify and manager.libc is not None:
+            self._start_inotify()
+
+        self._thread = threading.Thread(
+            target=self._run, name=f"RandomLoRAWatch:{os.path.basename(root)}", daemon=True
+        )
+        self._thread.start()
+
+    def _start_inotify(self):
+        fd = self.manager.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            return
+        self._fd = fd
+        if self._sync_watches():
+            self.mode = "inotify"
+        else:
+            # 監視数の上限など（ポーリングで続行）
+            os.close(fd)
+            self._fd = None
+            self._wd_to_dir.clear()
+            self._dir_to_wd.clear()
+
+    def _sync_watches(self):
+        """インデックスのディレクトリ一覧に合わせて inotify の監視を追加・削除"""
+        dirs = set(self.manager.index.list_dirs(self.root, self.include_subfolders))
+
+        for dir_path in list(self._dir_to_wd):
+            if dir_path not in dirs:
+                wd = self._dir_to_wd.pop(dir_path)
+                self._wd_to_dir.pop(wd, None)
+                self.manager.libc.inotify_rm_watch(self._fd, wd)
+
+        for dir_path in dirs:
+            if dir_path in self._dir_to_wd:
+                continue
+            wd = self.manager.libc.inotify_add_watch(self._fd, os.fsencode(dir_path), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                print(f"[RandomLoRALoader] inotify watch failed ({os.strerror(errno)}), "
+                      f"falling back to polling: {self.root}")
+                return False
+            self._dir_to_wd[dir_path] = wd
+            self._wd_to_dir[wd] = dir_path
+
+        return True
+
+    def _read_events(self):
+        """イベントを読み捨てて変化があったかだけ返す"""
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return False
+        except OSError:
+            return False
+        offset = 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            _, _, _, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size + name_len
+        return bool(data)
+
+    def _refresh(self):
+        try:
+            self.manager.index.refresh(self.root, self.include_subfolders, self.exclude)
+            if self.mode == "inotify" and not self._sync_watches():
+                self._close_inotify()
+        except Exception as e:
+            print(f"[RandomLoRALoader] Watch refresh error ({self.root}): {e}")
+
+    def _close_inotify(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._wd_to_dir.clear()
+        self._dir_to_wd.clear()
+        self.mode = "poll"
+
+    def _run(self):
+        dirty_since = None
+        try:
+            while not self._stop.is_set():
+                if time.time() - self.last_used > self.manager.idle_timeout:
+                    print(f"[RandomLoRALoader] Watch idle, stopped: {self.root}")
+                    break
+
+                if self.mode == "inotify":
+                    timeout = DEBOUNCE_SECONDS if dirty_since else self.manager.poll_interval
+                    readable, _, _ = select.select([self._fd], [], [], timeout)
+                    if readable and self._read_events():
+                        dirty_since = time.time()
+                    if dirty_since and time.time() - dirty_since >= DEBOUNCE_SECONDS:
+                        dirty_since = None
+                        self._refresh()
+                else:
+                    if self._stop.wait(self.manager.poll_interval):
+                        break
+                    self._refresh()
+        finally:
+            self._close_inotify()
+            self.manager._forget(self)
+
+    def stop(self):
+        self._stop.set()
+
+
+class FolderWatcher:
+    """フォルダ監視の管理（インデックスごとに1つ）"""
+
+    def __init__(self, index, mode="auto", idle_timeout=None, poll_interval=None):
+        self.index = index
+        self.mode = mode
+        self.idle_timeout = idle_timeout or _env_float("RANDOM_LORA_WATCH_IDLE", DEFAULT_IDLE_TIMEOUT)
+        self.poll_interval = poll_interval or _env_float("RANDOM_LORA_WATCH_POLL", DEFAULT_POLL_INTERVAL)
+        self.libc = _load_libc() if mode == "auto" else None
+        self._watches = {}
+        self._lock = threading.Lock()
+
+    def is_watching(self, root, include_subfolders, exclude=None):
+        """
+        監視中かどうか（監視中なら使用時刻を更新）
+
+        監視中のフォルダはバックグラウンドで一覧が更新されるため、
+        呼び出し側は差分更新なしで一覧を返してよい。
+        除外ルールが異なる場合は除外中のフォルダが更新されないためFalse
+        """
+        request = (root, bool(include_subfolders))
+        with self._lock:
+            for key, watch in self._watches.items():
+                # 親フォルダの再帰監視も対象
+                if covers(key, request) and (watch.exclude or None) == (exclude or None):
+                    watch.last_used = time.time()
+                    return True
+            return False
+
+    def watch(self, root, include_subfolders, exclude=None):
+        """監視を開始（既に監視中なら除外ルールのみ更新）"""
+        key = (root, bool(include_subfolders))
+        with self._lock:
+            if key in self._watches:
+                self._watches[key].exclude = exclude
+                return
+            use_inotify = self.libc is not None and \
+                get_filesystem_type(root) not in NETWORK_FILESYSTEMS
+            watch = _FolderWatch(self, root, bool(include_subfolders), use_inotify, exclude)
+            self._watches[key] = watch
+        print(f"[RandomLoRALoader] Watching ({watch.mode}): {root}")
+
+    def _forget(self, watch):
+        with self._lock:
+            key = (watch.root, watch.include_subfolders)
+            if self._watches.get(key) is watch:
+                del self._watches[key]
+
+    def stop_all(self):
+        with self._lock:
+            watches = list(self._watches.values())
+        for watch in watches:
+            watch.stop()
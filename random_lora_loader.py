@@ -41,6 +41,8 @@ RandomLoRALoader - ComfyUI Custom Node V1
    - num_loras_3: 選択するLoRA個数
 19. trigger_word_source: json_combined/json_random/json_sample_prompt/metadata（共通）
 20. seed: ランダム選択のシード値（共通、ComfyUI標準のcontrol_before_generateで制御）
+21. exclude_patterns: 除外するフォルダ・ファイルのglob（カンマ区切り、任意、全グループ共通）
+22. dedupe_mode: unique_by_filename の判定方法 filename/inode/content（任意、全グループ共通）
 
 【その他仕様】
 - メタデータ読み取り優先順位:
@@ -54,25 +56,37 @@ RandomLoRALoader - ComfyUI Custom Node V1
 - LoRA適用はpositiveのみ
 - 空のフォルダ指定はスキップ（エラーなし）
 - 全グループ空でもエラーなし（空テキスト出力）
+- 各フォルダの .loraignore（1行1パターン）と exclude_patterns に一致するフォルダは走査しない
 """
 
 import os
 import json
 import random
-import glob
 import re
 from pathlib import Path
 import folder_paths
 import comfy.sd
 import comfy.utils
 
-# LoRA埋め込みメタデータ読み込み用
-try:
-    from safetensors.torch import safe_open
-    SAFETENSORS_AVAILABLE = True
-except ImportError:
-    SAFETENSORS_AVAILABLE = False
-    print("[RandomLoRALoader] safetensors not available, embedded metadata reading disabled")
+from .lora_library import (
+    get_library_index,
+    DEDUPE_MODES,
+    PREVIEW_STATIC_EXTENSIONS,
+    PREVIEW_ANIMATED_EXTENSIONS,
+    PREVIEW_VIDEO_EXTENSIONS,
+    read_embedded_metadata,
+    get_metadata_record,
+    load_json_sidecar,
+    QuarantinedFileError,
+    get_manifest_embedded,
+    get_manifest_metadata,
+    get_preview_candidates,
+)
+
+
+# メタデータレコードのキャッシュの種類（埋め込みメタデータの変換方法がフィルタノードと違うため分ける）
+METADATA_RECORD_NAMESPACE = "random_records"
+
 
 class RandomLoRALoader:
     """ランダムLoRA選択・適用ノード（3グループ対応）"""
@@ -212,6 +226,16 @@ class RandomLoRALoader:
                     "step": 1,
                     "display": "number"
                 }),
+            },
+            "optional": {
+                "exclude_patterns": ("STRING", {
+                    "default": "",
+                    "multiline": False,
+                    "placeholder": "Exclude folders/files (comma-separated globs, e.g., _archive, backup, *_old)"
+                }),
+                "dedupe_mode": (list(DEDUPE_MODES), {
+                    "default": "filename"
+                }),
             }
         }
     
@@ -220,13 +244,14 @@ class RandomLoRALoader:
     FUNCTION = "load_random_loras"
     CATEGORY = "loaders"
     
-    def _find_lora_files(self, folder_path, include_subfolders):
+    def _find_lora_files(self, folder_path, include_subfolders, exclude_patterns=""):
         """
         指定フォルダ内のLoRAファイル（.safetensors）を検索
         
         Args:
             folder_path: 検索対象フォルダの絶対パス
             include_subfolders: サブフォルダを含めるか
+            exclude_patterns: 除外パターン（カンマ区切りのglob）
         
         Returns:
             list: LoRAファイルパスのリスト
@@ -235,12 +260,57 @@ class RandomLoRALoader:
             print(f"[RandomLoRALoader] フォルダが存在しません: {folder_path}")
             return []
         
-        pattern = "**/*.safetensors" if include_subfolders else "*.safetensors"
-        lora_files = glob.glob(os.path.join(folder_path, pattern), recursive=include_subfolders)
+        # ライブラリインデックス（全ノード共通）から取得、変更時のみ再走査
+        # （従来の glob と同じく隠しファイルと大文字の拡張子は対象外）
+        lora_files = get_library_index().list_lora_files(
+            folder_path, include_subfolders, extensions=('.safetensors',),
+            exclude_patterns=exclude_patterns, glob_compatible=True
+        )
         
         print(f"[RandomLoRALoader] 検出されたLoRA数: {len(lora_files)}")
         return lora_files
     
+    def _find_lora_files_for_groups(self, groups, exclude_patterns=""):
+        """
+        全グループのLoRAファイルをまとめて検索（実行単位のスキャン計画）
+        
+        同じフォルダや入れ子のフォルダ（例: グループ1=loras/, グループ2=loras/style/）は
+        物理的に1回だけ走査し、各グループの一覧はその結果から導出する
+        
+        Args:
+            groups: (folder_path, include_subfolders, group_name) のリスト
+                    （スキップするグループは folder_path=None）
+            exclude_patterns: 除外パターン（全グループ共通、各グループのフォルダ基準）
+        
+        Returns:
+            list: グループごとのLoRAファイルパスのリスト（groups と同じ順序）
+        """
+        requests = []
+        for folder_path, include_subfolders, group_name in groups:
+            if folder_path is None:
+                continue
+            if not os.path.exists(folder_path):
+                print(f"[RandomLoRALoader] {group_name}: フォルダが存在しません: {folder_path}")
+                continue
+            requests.append((folder_path, include_subfolders))
+        
+        found = get_library_index().list_lora_files_for_groups(
+            requests, extensions=('.safetensors',), exclude_patterns=exclude_patterns,
+            glob_compatible=True
+        )
+        found_by_request = dict(zip(requests, found))
+        
+        results = []
+        for folder_path, include_subfolders, group_name in groups:
+            request = (folder_path, include_subfolders)
+            if request in found_by_request:
+                lora_files = found_by_request[request]
+                print(f"[RandomLoRALoader] {group_name}: 検出されたLoRA数: {len(lora_files)}")
+            else:
+                lora_files = []
+            results.append(lora_files)
+        return results
+    
     def _select_random_loras(self, lora_files, num_loras, seed):
         """
         LoRAファイルをランダムに選択（重複なし、不足時は再選択）
@@ -277,17 +347,34 @@ class RandomLoRALoader:
             random.shuffle(selected)
             return selected
     
-    def _unique_by_filename(self, lora_files, group_name=""):
+    def _unique_by_filename(self, lora_files, group_name="", dedupe_mode="filename"):
         """
         ファイル名でユニーク化（重複ファイル名を除外）
         
         Args:
             lora_files: LoRAファイルパスのリスト
             group_name: グループ名（ログ用）
+            dedupe_mode: 重複の判定方法
+                - filename: ファイル名
+                - inode: 同じ実体（シンボリックリンク・ハードリンク）
+                - content: 同じ実体または同じ内容（ヘッダー + 抜き出しデータの指紋）
         
         Returns:
             list: ファイル名がユニークなファイルパスのリスト
         """
+        if dedupe_mode in ("inode", "content"):
+            # テンソルを読み込む前にインデックスの情報で判定
+            duplicates = get_library_index().find_duplicates(lora_files, dedupe_mode)
+            unique_files = []
+            for file_path in lora_files:
+                if file_path in duplicates:
+                    print(f"[RandomLoRALoader] {group_name}: Duplicate file detected ({dedupe_mode}): {os.path.basename(file_path)}")
+                    print(f"  Keeping: {duplicates[file_path]}")
+                    print(f"  Skipping: {file_path}")
+                else:
+                    unique_files.append(file_path)
+            return unique_files
+        
         seen_names = {}
         unique_files = []
         
@@ -379,6 +466,24 @@ class RandomLoRALoader:
                 print(f"[RandomLoRALoader] 💡 使用例: '1.0' または '0.4-0.8'")
                 return 1.0
     
+    def _get_metadata_record(self, lora_path):
+        """
+        LoRAのメタデータレコードを取得（トリガーワード・作例プロンプト共通）
+        
+        JSONの読み込みは1回だけで、LoRA本体・サイドカーのサイズ・mtimeが
+        変わるまでキャッシュする
+        
+        Args:
+            lora_path: LoRAファイルパス
+        
+        Returns:
+            MetadataRecord: メタデータがない場合はNone
+        """
+        # 作例は meta が None でない画像から選ぶ（空の meta も含める）
+        return get_metadata_record(
+            lora_path, self._load_json_metadata, METADATA_RECORD_NAMESPACE, keep_empty_meta=True
+        )
+    
     def _load_json_metadata(self, lora_path):
         """
         外部JSONファイルまたはLoRA埋め込みメタデータを読み込む
@@ -397,21 +502,33 @@ class RandomLoRALoader:
         # .safetensorsを除いたファイル名を取得
         base_name = os.path.splitext(lora_path)[0]
         
+        # サイドカーの有無はスキャン時にインデックスへ記録済み（存在確認のI/Oなし）
+        sidecars = get_library_index().get_sidecars(lora_path)
+        
+        # フォルダのマニフェストに最新の記録があればサイドカーを開かない
+        found, manifest_metadata = get_manifest_metadata(lora_path)
+        if found:
+            if manifest_metadata is not None:
+                return manifest_metadata
+            sidecars = {}  # サイドカーなし・読み込み失敗（埋め込みメタデータへ）
+        
         # 優先順位1: .metadata.json (ComfyUI Lora Manager)
-        json_path_metadata = f"{base_name}.metadata.json"
-        if os.path.exists(json_path_metadata):
+        json_path_metadata = sidecars.get("metadata_json")
+        if json_path_metadata:
             try:
-                with open(json_path_metadata, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json_sidecar(json_path_metadata, "metadata_json")
+            except QuarantinedFileError:
+                pass  # 前回警告済み（変更されるまで読まない）
             except Exception as e:
                 print(f"[RandomLoRALoader] JSON読み込みエラー ({json_path_metadata}): {e}")
         
         # 優先順位2: .info (Civitai Helper)
-        json_path_info = f"{base_name}.info"
-        if os.path.exists(json_path_info):
+        json_path_info = sidecars.get("info")
+        if json_path_info:
             try:
-                with open(json_path_info, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                return load_json_sidecar(json_path_info, "info")
+            except QuarantinedFileError:
+                pass  # 前回警告済み（変更されるまで読まない）
             except Exception as e:
                 print(f"[RandomLoRALoader] JSON読み込みエラー ({json_path_info}): {e}")
         
@@ -434,65 +551,66 @@ class RandomLoRALoader:
         Returns:
             dict: メタデータ（読み込み失敗時はNone）
         """
-        if not SAFETENSORS_AVAILABLE:
-            return None
-        
         if not os.path.exists(lora_path):
             return None
         
         try:
-            with safe_open(lora_path, framework="pt", device="cpu") as f:
-                metadata = f.metadata()
-                
-                if not metadata:
-                    return None
-                
-                # ss_tag_frequency（kohya_ss形式）からトリガーワード抽出
-                if "ss_tag_frequency" in metadata:
-                    tag_freq_str = metadata.get("ss_tag_frequency", "{}")
-                    try:
-                        tag_freq = json.loads(tag_freq_str)
-                        # 最も頻度の高いタグセットを取得
-                        if tag_freq:
-                            # 各データセットのタグを結合
-                            all_tags = []
-                            for dataset_tags in tag_freq.values():
-                                all_tags.extend(dataset_tags.keys())
-                            
-                            # 重複除去
-                            unique_tags = list(dict.fromkeys(all_tags))
-                            
-                            # Civitai形式に変換
-                            trigger_words = ", ".join(unique_tags[:20])  # 上位20個
-                            
-                            return {
-                                "civitai": {
-                                    "trainedWords": [trigger_words]
-                                }
+            # フォルダのマニフェストに同じサイズ・mtimeの記録があればファイルを開かない
+            found, metadata = get_manifest_embedded(lora_path)
+            if not found:
+                # ヘッダーのみ読み込み（torch 不要、サイズ・mtimeが同じ間はキャッシュ）
+                metadata = read_embedded_metadata(lora_path)
+            
+            if not metadata:
+                return None
+            
+            # ss_tag_frequency（kohya_ss形式）からトリガーワード抽出
+            if "ss_tag_frequency" in metadata:
+                tag_summary = metadata["ss_tag_frequency"]
+                try:
+                    # 最も頻度の高いタグセットを取得
+                    if tag_summary.truthy:
+                        # 各データセットのタグを結合（各データセットの先頭20個で足りる）
+                        all_tags = []
+                        for dataset_tags in tag_summary.dataset_first_tags():
+                            all_tags.extend(dataset_tags)
+                        
+                        # 重複除去
+                        unique_tags = list(dict.fromkeys(all_tags))
+                        
+                        # Civitai形式に変換
+                        trigger_words = ", ".join(unique_tags[:20])  # 上位20個
+                        
+                        return {
+                            "civitai": {
+                                "trainedWords": [trigger_words]
                             }
-                    except json.JSONDecodeError:
-                        pass
-                
-                # その他のメタデータフィールドからトリガーワード抽出
-                if "modelspec.trigger_word" in metadata:
-                    trigger = metadata["modelspec.trigger_word"]
-                    return {
-                        "civitai": {
-                            "trainedWords": [trigger]
                         }
+                except json.JSONDecodeError:
+                    pass
+            
+            # その他のメタデータフィールドからトリガーワード抽出
+            if "modelspec.trigger_word" in metadata:
+                trigger = metadata["modelspec.trigger_word"]
+                return {
+                    "civitai": {
+                        "trainedWords": [trigger]
                     }
-                
-                # ss_output_name（モデル名）
-                if "ss_output_name" in metadata:
-                    output_name = metadata["ss_output_name"]
-                    return {
-                        "civitai": {
-                            "trainedWords": [output_name]
-                        }
+                }
+            
+            # ss_output_name（モデル名）
+            if "ss_output_name" in metadata:
+                output_name = metadata["ss_output_name"]
+                return {
+                    "civitai": {
+                        "trainedWords": [output_name]
                     }
-                
-                return None
-                
+                }
+            
+            return None
+            
+        except QuarantinedFileError:
+            return None  # 前回警告済み（変更されるまで読まない）
         except Exception as e:
             print(f"[RandomLoRALoader] 埋め込みメタデータ読み込みエラー ({lora_path}): {e}")
             return None
@@ -507,12 +625,12 @@ class RandomLoRALoader:
         Returns:
             str: 全トリガーワードを結合した文字列
         """
-        json_data = self._load_json_metadata(lora_path)
-        if not json_data:
+        record = self._get_metadata_record(lora_path)
+        if not record:
             return ""
         
         # civitai.trainedWordsを取得
-        trained_words = json_data.get("civitai", {}).get("trainedWords", [])
+        trained_words = record.trained_words
         if not trained_words:
             print(f"[RandomLoRALoader] trainedWordsが見つかりません: {lora_path}")
             return ""
@@ -543,12 +661,12 @@ class RandomLoRALoader:
         Returns:
             str: ランダムに選択されたトリガーワードパターン
         """
-        json_data = self._load_json_metadata(lora_path)
-        if not json_data:
+        record = self._get_metadata_record(lora_path)
+        if not record:
             return ""
         
         # civitai.trainedWordsを取得
-        trained_words = json_data.get("civitai", {}).get("trainedWords", [])
+        trained_words = record.trained_words
         if not trained_words:
             print(f"[RandomLoRALoader] trainedWordsが見つかりません: {lora_path}")
             return ""
@@ -578,28 +696,21 @@ class RandomLoRALoader:
         Returns:
             tuple: (positive_prompt, negative_prompt)
         """
-        json_data = self._load_json_metadata(lora_path)
-        if not json_data:
+        record = self._get_metadata_record(lora_path)
+        if not record:
             return "", ""
         
-        # civitai.imagesを取得
-        images = json_data.get("civitai", {}).get("images", [])
-        if not images:
+        if not record.has_images:
             print(f"[RandomLoRALoader] imagesが見つかりません: {lora_path}")
             return "", ""
         
-        # metaを持つ画像のみをフィルタ（metaがNoneでないことも確認）
-        valid_images = [img for img in images if "meta" in img and img["meta"] is not None]
-        if not valid_images:
+        # metaを持つ画像の (prompt, negativePrompt)（レコード作成時に抽出済み）
+        if not record.sample_prompts:
             print(f"[RandomLoRALoader] metaを持つ画像が見つかりません: {lora_path}")
             return "", ""
         
         # ランダムに1つ選択
-        selected_image = random.choice(valid_images)
-        meta = selected_image.get("meta", {})
-        
-        positive = meta.get("prompt", "")
-        negative = meta.get("negativePrompt", "")
+        positive, negative = random.choice(record.sample_prompts)
         
         # LoRA記述を削除（<lora:xxx:x.x>または<lora:xxx:x.x:x.x>形式）
         lora_pattern = r'<lora:[^>]+>'
@@ -777,67 +888,34 @@ class RandomLoRALoader:
         except ImportError:
             return None
         
-        # LoRAファイル名（拡張子なし）
-        base_name = os.path.splitext(os.path.basename(lora_path))[0]
-        folder = os.path.dirname(lora_path)
-        
-        # ファイル拡張子（優先順位順）
-        static_image_exts = ('.png', '.jpg', '.jpeg')
-        animated_image_exts = ('.gif', '.webp')  # Pillowで対応可能
-        video_exts = ('.mp4', '.webm', '.avi', '.mov')  # opencv-python必要
+        # プレビュー候補（スキャン時に優先順位順で振り分け済み、フォルダ列挙なし）
+        preview_paths = get_preview_candidates(lora_path)
         
         try:
-            # 同じフォルダ内のファイルを検索
-            files = os.listdir(folder)
-            
-            # 部分一致するファイルを収集
-            matched_files = []
-            for file in files:
-                if file.lower().startswith(base_name.lower()):
-                    matched_files.append(file)
-            
-            if not matched_files:
-                return None
-            
-            # 優先順位でソート
-            def get_priority(filename):
-                lower = filename.lower()
-                if any(lower.endswith(ext) for ext in static_image_exts):
-                    return 0  # 最優先
-                elif any(lower.endswith(ext) for ext in animated_image_exts):
-                    return 1  # 次優先
-                elif any(lower.endswith(ext) for ext in video_exts):
-                    return 2  # 最後
-                else:
-                    return 999  # その他
-            
-            matched_files.sort(key=get_priority)
-            
             # 各ファイルを試す
-            for file in matched_files:
-                preview_path = os.path.join(folder, file)
-                lower_file = file.lower()
+            for preview_path in preview_paths:
+                lower_file = preview_path.lower()
                 
                 # 静止画像
-                if any(lower_file.endswith(ext) for ext in static_image_exts):
+                if lower_file.endswith(PREVIEW_STATIC_EXTENSIONS):
                     img = self._load_static_image(preview_path)
                     if img is not None:
                         return img
                 
                 # アニメーション画像（GIF/WebP）
-                elif any(lower_file.endswith(ext) for ext in animated_image_exts):
+                elif lower_file.endswith(PREVIEW_ANIMATED_EXTENSIONS):
                     img = self._load_animated_image_first_frame(preview_path)
                     if img is not None:
                         return img
                 
                 # 動画ファイル（opencv-python必要）
-                elif any(lower_file.endswith(ext) for ext in video_exts):
+                elif lower_file.endswith(PREVIEW_VIDEO_EXTENSIONS):
                     img = self._load_video_first_frame(preview_path)
                     if img is not None:
                         return img
         
         except Exception as e:
-            print(f"[RandomLoRALoader] Folder read error: {e}")
+            print(f"[RandomLoRALoader] Preview load error: {e}")
         
         return None
     
@@ -1080,7 +1158,9 @@ class RandomLoRALoader:
         num_loras_3,
         # 共通
         trigger_word_source,
-        seed
+        seed,
+        exclude_patterns="",
+        dedupe_mode="filename"
     ):
         """
         メイン処理：ランダムLoRA選択・適用（3グループ対応）
@@ -1108,22 +1188,28 @@ class RandomLoRALoader:
             (lora_folder_path_3, include_subfolders_3, unique_by_filename_3, model_strength_3, clip_strength_3, num_loras_3, "Group 3"),
         ]
         
-        for folder_path, include_subs, unique_by_name, model_str, clip_str, num, group_name in groups:
+        # 全グループのLoRAファイルをまとめて検索（重複・入れ子のフォルダは1回だけ走査）
+        # フォルダパスが空、またはnum_lorasが0のグループは検索しない
+        scan_requests = [
+            (None if not folder_path.strip() or num == 0 else folder_path, include_subs, group_name)
+            for folder_path, include_subs, _, _, _, num, group_name in groups
+        ]
+        group_lora_files = self._find_lora_files_for_groups(scan_requests, exclude_patterns)
+        
+        for (folder_path, include_subs, unique_by_name, model_str, clip_str, num, group_name), lora_files \
+                in zip(groups, group_lora_files):
             # フォルダパスが空、またはnum_lorasが0の場合はスキップ
             if not folder_path.strip() or num == 0:
                 print(f"[RandomLoRALoader] {group_name}: スキップ（フォルダ未指定またはnum=0）")
                 continue
             
-            # LoRAファイルを検索
-            lora_files = self._find_lora_files(folder_path, include_subs)
-            
             if not lora_files:
                 print(f"[RandomLoRALoader] {group_name}: LoRAファイルが見つかりませんでした")
                 continue
             
             # ファイル名でユニーク化（重複ファイル名を除外）
             if unique_by_name:
-                lora_files = self._unique_by_filename(lora_files, group_name)
+                lora_files = self._unique_by_filename(lora_files, group_name, dedupe_mode)
                 if not lora_files:
                     print(f"[RandomLoRALoader] {group_name}: ユニーク化後にファイルがありません")
                     continue
@@ -0,0 +1,11 @@
+"""
+テスト共通の設定
+
+リポジトリ直下は ComfyUI のカスタムノード（__init__.py が ComfyUI のモジュールを
+読み込む）なので、lora_library だけを直接 import できるようにする。
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
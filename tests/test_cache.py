@@ -0,0 +1,96 @@
+"""メモリ上限付きキャッシュ（lora_library.cache）"""
+
+import pytest
+
+from lora_library.cache import CACHE_SHARES, BoundedCache, estimate_size, get_cache_budget
+
+
+class _Slotted:
+    __slots__ = ("text", "numbers")
+
+    def __init__(self, text, numbers):
+        self.text = text
+        self.numbers = numbers
+
+
+def _entry_size(key, value):
+    return estimate_size(key) + estimate_size(value)
+
+
+def test_estimate_size_counts_contents():
+    text = "x" * 1000
+    assert estimate_size((text,)) > estimate_size(text)
+    assert estimate_size({"key": [text, text]}) > 2 * estimate_size(text)
+    assert estimate_size(_Slotted(text, (1, 2, 3))) > estimate_size(text) + estimate_size((1, 2, 3))
+
+
+def test_least_recently_used_entry_is_evicted():
+    value = "v" * 100
+    cache = BoundedCache(_entry_size("a", value) * 2)
+    cache["a"] = value
+    cache["b"] = value
+    assert cache.get("a") == value  # a を最近使ったことにする
+    cache["c"] = value
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_oversized_value_is_not_kept_and_drops_the_old_value():
+    cache = BoundedCache(_entry_size("a", "small") + 10)
+    cache["a"] = "small"
+    cache["a"] = "x" * 10_000
+    assert "a" not in cache
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_a_value_updates_the_byte_count():
+    cache = BoundedCache(1 << 20)
+    cache["a"] = "x" * 1000
+    cache["a"] = "y"
+    assert cache.stats()["bytes"] == _entry_size("a", "y")
+
+
+def test_hits_and_misses():
+    cache = BoundedCache(1 << 20)
+    cache["a"] = 1
+    assert cache.get("a") == 1
+    assert cache.get("missing") is None
+    assert "a" in cache  # in は数えない
+    with pytest.raises(KeyError):
+        cache["missing"]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+
+def test_clear_resets_bytes():
+    cache = BoundedCache(1 << 20)
+    cache.update({"a": 1, "b": 2})
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.stats()["bytes"] == 0
+
+
+def test_cache_shares_add_up_to_the_total():
+    assert sum(CACHE_SHARES.values()) == pytest.approx(1.0)
+
+
+def test_budget_is_split_across_caches(monkeypatch):
+    monkeypatch.setenv("RANDOM_LORA_CACHE_MB", "100")
+    assert get_cache_budget() == 100 * 1048576
+    assert get_cache_budget("records") == int(100 * CACHE_SHARES["records"] * 1048576)
+    total = sum(get_cache_budget(name) for name in CACHE_SHARES)
+    assert get_cache_budget() - len(CACHE_SHARES) <= total <= get_cache_budget()
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("not a number", 64 * 1048576),
+    ("-5", 0),
+])
+def test_budget_falls_back_and_clamps(monkeypatch, value, expected):
+    monkeypatch.setenv("RANDOM_LORA_CACHE_MB", value)
+    assert get_cache_budget() == expected
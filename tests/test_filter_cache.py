@@ -0,0 +1,79 @@
+"""フィルタ結果のキャッシュ（lora_library.filter_cache）"""
+
+import os
+
+import pytest
+
+from lora_library.filter_cache import FilterResultCache
+from lora_library.index import LibraryIndex
+
+
+LISTING_KEY = ("/loras", True, "")
+FILTER_KEY = ("anime", "OR", False)
+FILES = ["/loras/anime_a.safetensors", "/loras/anime_b.safetensors", "/loras/chibi.safetensors"]
+
+
+@pytest.fixture
+def cache():
+    return FilterResultCache(1 << 20)
+
+
+def test_hit_with_same_generation(cache):
+    cache.put(LISTING_KEY, FILTER_KEY, 3, False, FILES, FILES[:2])
+    assert cache.get(LISTING_KEY, FILTER_KEY, 3) == (FILES, FILES[:2])
+
+
+def test_generation_change_invalidates(cache):
+    cache.put(LISTING_KEY, FILTER_KEY, 3, False, FILES, FILES[:2])
+    assert cache.get(LISTING_KEY, FILTER_KEY, 4) is None
+
+    # 新しい generation の一覧で保存し直すと、古い generation では使われない
+    files = FILES + ["/loras/anime_c.safetensors"]
+    cache.put(LISTING_KEY, FILTER_KEY, 4, False, files, [files[0], files[1], files[3]])
+    assert cache.get(LISTING_KEY, FILTER_KEY, 4) == (files, [files[0], files[1], files[3]])
+    assert cache.get(LISTING_KEY, FILTER_KEY, 3) is None
+
+
+def test_other_filters_on_an_old_listing_are_invalidated(cache):
+    other_key = ("chibi", "OR", False)
+    cache.put(LISTING_KEY, FILTER_KEY, 3, False, FILES, FILES[:2])
+    cache.put(LISTING_KEY, other_key, 3, False, FILES, FILES[2:])
+    cache.put(LISTING_KEY, FILTER_KEY, 4, False, FILES[:2], FILES[:2])
+    assert cache.get(LISTING_KEY, other_key, 3) is None
+    assert cache.get(LISTING_KEY, other_key, 4) is None
+
+
+def test_unknown_generation_is_not_cached(cache):
+    # フォルダがない・走査がバックグラウンドで続いている場合（generation が None）
+    cache.put(LISTING_KEY, FILTER_KEY, None, False, [], [])
+    assert cache.get(LISTING_KEY, FILTER_KEY, None) is None
+
+
+def test_metadata_results_expire(cache, monkeypatch):
+    monkeypatch.setenv("RANDOM_LORA_FILTER_RECHECK", "30")
+    cache.put(LISTING_KEY, FILTER_KEY, 3, True, FILES, FILES[:1])
+    assert cache.get(LISTING_KEY, FILTER_KEY, 3) == (FILES, FILES[:1])
+
+    monkeypatch.setenv("RANDOM_LORA_FILTER_RECHECK", "0")
+    assert cache.get(LISTING_KEY, FILTER_KEY, 3) is None
+
+
+def test_generation_follows_library_index_changes(tmp_path, monkeypatch):
+    monkeypatch.setenv("RANDOM_LORA_SCAN_BUDGET", "0")
+    root = tmp_path / "loras"
+    root.mkdir()
+    (root / "anime_a.safetensors").write_bytes(b"")
+    index = LibraryIndex(":memory:")
+    cache = FilterResultCache(1 << 20)
+    try:
+        generation = index.ensure_fresh(str(root), True)
+        files = index.list_lora_files(str(root), True, refresh=False)
+        cache.put(LISTING_KEY, FILTER_KEY, generation, False, files, files)
+        assert cache.get(LISTING_KEY, FILTER_KEY, index.ensure_fresh(str(root), True)) == (files, files)
+
+        (root / "anime_b.safetensors").write_bytes(b"")
+        st = root.stat()
+        os.utime(root, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+        assert cache.get(LISTING_KEY, FILTER_KEY, index.ensure_fresh(str(root), True)) is None
+    finally:
+        index.close()
@@ -0,0 +1,58 @@
+"""LoRAファイルの同一性判定（lora_library.fingerprint）"""
+
+import json
+import os
+import struct
+
+from lora_library.fingerprint import SAMPLE_COUNT, SAMPLE_SIZE, compute_fingerprint, file_identity
+
+
+def _write_lora(path, metadata, data):
+    header = json.dumps({"__metadata__": metadata}).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header)) + header + data)
+    return path
+
+
+def test_copies_share_a_fingerprint(tmp_path):
+    data = os.urandom(SAMPLE_SIZE * SAMPLE_COUNT * 2)
+    original = _write_lora(str(tmp_path / "a.safetensors"), {"name": "a"}, data)
+    copy = _write_lora(str(tmp_path / "copy.safetensors"), {"name": "a"}, data)
+    assert compute_fingerprint(original) == compute_fingerprint(copy)
+
+
+def test_header_and_sampled_data_changes_are_detected(tmp_path):
+    data = bytearray(os.urandom(SAMPLE_SIZE * SAMPLE_COUNT * 2))
+    original = compute_fingerprint(_write_lora(str(tmp_path / "a.safetensors"), {"name": "a"}, bytes(data)))
+
+    renamed = _write_lora(str(tmp_path / "b.safetensors"), {"name": "b"}, bytes(data))
+    assert compute_fingerprint(renamed) != original
+
+    # 末尾の箇所はファイル末尾に揃えて抜き出す
+    data[-1] ^= 0xFF
+    changed = _write_lora(str(tmp_path / "c.safetensors"), {"name": "a"}, bytes(data))
+    assert compute_fingerprint(changed) != original
+
+
+def test_small_and_non_safetensors_files(tmp_path):
+    path = tmp_path / "tiny.pt"
+    path.write_bytes(b"abc")
+    other = tmp_path / "other.pt"
+    other.write_bytes(b"abd")
+    assert compute_fingerprint(str(path)) != compute_fingerprint(str(other))
+
+
+def test_unreadable_file_has_no_fingerprint(tmp_path):
+    assert compute_fingerprint(str(tmp_path / "missing.safetensors")) is None
+
+
+def test_hard_links_share_an_identity(tmp_path):
+    path = tmp_path / "a.safetensors"
+    path.write_bytes(b"data")
+    link = tmp_path / "link.safetensors"
+    os.link(path, link)
+    other = tmp_path / "other.safetensors"
+    other.write_bytes(b"data")
+
+    assert file_identity(os.stat(path)) == file_identity(os.stat(link))
+    assert file_identity(os.stat(path)) != file_identity(os.stat(other))
@@ -0,0 +1,187 @@
+"""ライブラリインデックス（lora_library.index）の差分更新と直接走査の一致"""
+
+import os
+
+import pytest
+
+from lora_library.index import LibraryIndex
+from lora_library.scanner import parse_exclude_patterns, walk_lora_files
+
+
+EXCLUDE_PATTERNS = ["", "_archive", "old/*, *.ckpt"]
+
+
+@pytest.fixture
+def index(monkeypatch):
+    # 走査はすべて呼び出し中に終わらせる（バックグラウンドに回さない）
+    monkeypatch.setenv("RANDOM_LORA_SCAN_BUDGET", "0")
+    index = LibraryIndex(":memory:")
+    yield index
+    index.close()
+
+
+def _bump_mtime(path):
+    """mtime の粒度が粗いファイルシステムでも変更として検出されるよう mtime を進める"""
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def _write(path, text=""):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    existed = os.path.exists(path)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    # 上書きはファイルの mtime だけ、新規作成はフォルダの mtime が変わる
+    _bump_mtime(path if existed else os.path.dirname(path))
+
+
+def _remove(path):
+    os.remove(path)
+    _bump_mtime(os.path.dirname(path))
+
+
+def _rename(src, dst):
+    os.rename(src, dst)
+    _bump_mtime(os.path.dirname(src))
+    if os.path.dirname(dst) != os.path.dirname(src):
+        _bump_mtime(os.path.dirname(dst))
+
+
+def _assert_matches_walk(index, root):
+    for include_subfolders in (True, False):
+        for exclude_patterns in EXCLUDE_PATTERNS:
+            expected = walk_lora_files(
+                root, include_subfolders, max_workers=1,
+                exclude=parse_exclude_patterns(root, exclude_patterns),
+            )
+            actual = index.list_lora_files(root, include_subfolders, exclude_patterns=exclude_patterns)
+            assert actual == expected, (include_subfolders, exclude_patterns)
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = str(tmp_path / "loras")
+    for rel in (
+        "top.safetensors",
+        "model.ckpt",
+        "style/anime.safetensors",
+        "style/anime.metadata.json",
+        "style/old/legacy.safetensors",
+        "style/_archive/archived.pt",
+        "chara/deep/nested/chibi.safetensors",
+        "chara/readme.txt",
+    ):
+        _write(os.path.join(root, *rel.split("/")))
+    return root
+
+
+def test_initial_listing_matches_walk(index, library):
+    _assert_matches_walk(index, library)
+
+
+def test_add_and_remove_files(index, library):
+    _assert_matches_walk(index, library)
+    generation = index.generation
+
+    _write(os.path.join(library, "style", "new.safetensors"))
+    _write(os.path.join(library, "chara", "deep", "nested", "extra.pt"))
+    _assert_matches_walk(index, library)
+    assert index.generation > generation
+
+    generation = index.generation
+    _remove(os.path.join(library, "style", "anime.safetensors"))
+    _remove(os.path.join(library, "top.safetensors"))
+    _assert_matches_walk(index, library)
+    assert index.generation > generation
+
+
+def test_add_and_remove_folders(index, library):
+    _assert_matches_walk(index, library)
+
+    _write(os.path.join(library, "added", "sub", "fresh.safetensors"))
+    _assert_matches_walk(index, library)
+
+    _remove(os.path.join(library, "style", "old", "legacy.safetensors"))
+    os.rmdir(os.path.join(library, "style", "old"))
+    _bump_mtime(os.path.join(library, "style"))
+    _assert_matches_walk(index, library)
+
+
+def test_rename_files_and_folders(index, library):
+    _assert_matches_walk(index, library)
+
+    _rename(os.path.join(library, "style", "anime.safetensors"),
+            os.path.join(library, "style", "anime_v2.safetensors"))
+    _assert_matches_walk(index, library)
+
+    _rename(os.path.join(library, "style", "anime_v2.safetensors"),
+            os.path.join(library, "chara", "anime_v2.safetensors"))
+    _assert_matches_walk(index, library)
+
+    _rename(os.path.join(library, "chara", "deep"), os.path.join(library, "style", "moved"))
+    _assert_matches_walk(index, library)
+
+
+def test_unchanged_library_keeps_generation(index, library):
+    _assert_matches_walk(index, library)
+    generation = index.generation
+    _assert_matches_walk(index, library)
+    assert index.generation == generation
+
+
+def test_loraignore_changes(index, library):
+    _assert_matches_walk(index, library)
+    ignore_path = os.path.join(library, ".loraignore")
+
+    # 追加
+    _write(ignore_path, "deep\n")
+    _assert_matches_walk(index, library)
+    assert not any("chibi" in path for path in index.list_lora_files(library, True))
+
+    # 書き換え（フォルダの mtime は変わらない）
+    _write(ignore_path, "style/\n*.ckpt\n")
+    _assert_matches_walk(index, library)
+    listed = index.list_lora_files(library, True)
+    assert any("chibi" in path for path in listed)
+    assert not any(os.sep + "style" + os.sep in path for path in listed)
+
+    # サブフォルダの .loraignore
+    _write(os.path.join(library, "chara", ".loraignore"), "nested/\n")
+    _assert_matches_walk(index, library)
+
+    # 削除
+    _remove(ignore_path)
+    _remove(os.path.join(library, "chara", ".loraignore"))
+    _assert_matches_walk(index, library)
+    assert len(index.list_lora_files(library, True)) == len(walk_lora_files(library, True, max_workers=1))
+
+
+def test_subfolder_request_after_parent_scan(index, library):
+    _assert_matches_walk(index, library)
+    _write(os.path.join(library, "style", "later.safetensors"))
+    _assert_matches_walk(index, os.path.join(library, "style"))
+    _assert_matches_walk(index, library)
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="symlinks not supported")
+def test_symlinked_folders_and_loops(index, library, tmp_path):
+    outside = str(tmp_path / "shared")
+    _write(os.path.join(outside, "linked.safetensors"))
+    try:
+        os.symlink(outside, os.path.join(library, "shared"))
+        # 祖先へのリンク（ループ）は辿らない
+        os.symlink(library, os.path.join(library, "style", "loop"))
+    except OSError:
+        pytest.skip("symlinks not permitted")
+    _bump_mtime(library)
+    _bump_mtime(os.path.join(library, "style"))
+    _assert_matches_walk(index, library)
+
+    listed = index.list_lora_files(library, True)
+    assert os.path.join(library, "shared", "linked.safetensors") in listed
+    assert not any(os.sep + "loop" + os.sep in path for path in listed)
+
+    _write(os.path.join(outside, "added.safetensors"))
+    _bump_mtime(outside)
+    _assert_matches_walk(index, library)
+    assert os.path.join(library, "shared", "added.safetensors") in index.list_lora_files(library, True)
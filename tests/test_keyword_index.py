@@ -0,0 +1,78 @@
+"""キーワードの転置インデックス（lora_library.keyword_index）"""
+
+import os
+import unicodedata
+
+import pytest
+
+from lora_library import keyword_index
+from lora_library.keyword_index import KeywordIndex, filename_search_text
+
+
+def _names(paths):
+    return [os.path.splitext(os.path.basename(path))[0] for path in paths]
+
+
+@pytest.fixture
+def lora_paths(tmp_path):
+    names = ["anime_style", "anime_girl_v2", "realistic_photo", "chibi_anime", "キャラクター"]
+    return [os.path.join(str(tmp_path), name + ".safetensors") for name in names]
+
+
+def test_substring_match_with_and_or(lora_paths):
+    index = KeywordIndex()
+    assert _names(index.filter(lora_paths, filename_search_text, ["ani"], "OR")) == [
+        "anime_style", "anime_girl_v2", "chibi_anime",
+    ]
+    assert _names(index.filter(lora_paths, filename_search_text, ["anime", "v2"], "AND")) == ["anime_girl_v2"]
+    assert _names(index.filter(lora_paths, filename_search_text, ["photo", "chibi"], "OR")) == [
+        "realistic_photo", "chibi_anime",
+    ]
+    # 2文字以下の断片は語彙を走査する
+    assert _names(index.filter(lora_paths, filename_search_text, ["v2"], "OR")) == ["anime_girl_v2"]
+
+
+def test_cjk_and_unicode_normalization(lora_paths):
+    index = KeywordIndex()
+    assert _names(index.filter(lora_paths, filename_search_text, ["ラク"])) == ["キャラクター"]
+    # 濁点を分解した形（NFD）でも一致する
+    decomposed = unicodedata.normalize("NFD", "キャラクター")
+    texts = [filename_search_text(path) for path in lora_paths[:-1]] + [decomposed]
+    assert _names(index.filter(lora_paths, texts, ["キャラ"])) == ["キャラクター"]
+
+
+def test_phrases_match_in_order():
+    paths = ["/l/a.safetensors", "/l/b.safetensors"]
+    texts = ["anime style girl", "style anime"]
+    index = KeywordIndex()
+    assert index.filter(paths, texts, ["anime style"]) == ["/l/a.safetensors"]
+    assert index.filter(paths, texts, ["anime sty"]) == ["/l/a.safetensors"]
+
+
+def test_changed_texts_are_reindexed():
+    paths = ["/l/a.safetensors", "/l/b.safetensors"]
+    index = KeywordIndex()
+    assert index.filter(paths, ["anime", "photo"], ["anime"]) == ["/l/a.safetensors"]
+    assert index.filter(paths, ["photo", "anime"], ["anime"]) == ["/l/b.safetensors"]
+    assert len(index) == 2
+
+
+def test_match_returns_a_mask_per_keyword(lora_paths):
+    masks = KeywordIndex().match(lora_paths, filename_search_text, ["anime", "photo", "missing"])
+    assert masks == [bytes([1, 1, 0, 1, 0]), bytes([0, 0, 1, 0, 0]), bytes(5)]
+
+
+def test_deleted_files_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(keyword_index, "PRUNE_MIN_DOCS", 4)
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"lora{i}.safetensors"
+        path.write_bytes(b"")
+        paths.append(str(path))
+    index = KeywordIndex()
+    index.filter(paths[:3], filename_search_text, ["lora"])
+    for path in paths[:3]:
+        os.remove(path)
+    # 別のフォルダの呼び出しで文書が増えたときに、存在しないファイルの文書を消す
+    assert index.filter(paths[3:], filename_search_text, ["lora"]) == paths[3:]
+    assert len(index) == 3
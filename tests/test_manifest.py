@@ -0,0 +1,155 @@
+"""フォルダごとのマニフェスト（lora_library.manifest / manifest_cli）"""
+
+import json
+import os
+import struct
+
+import pytest
+
+from lora_library import manifest
+from lora_library.manifest import MANIFEST_NAME, build_manifest, check_manifest, get_manifest_embedded
+from lora_library.manifest_cli import main
+
+
+@pytest.fixture(autouse=True)
+def manifest_cache(monkeypatch):
+    # テストごとにマニフェストのキャッシュを作り直す
+    monkeypatch.setenv("RANDOM_LORA_MANIFEST", "1")
+    monkeypatch.setattr(manifest, "_manifest_cache", None)
+
+
+def _bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+
+def _write_lora(path, metadata=None):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    header = json.dumps({"__metadata__": metadata} if metadata else {}).encode("utf-8")
+    with open(path, "wb") as f:
+        f.write(struct.pack("<Q", len(header)) + header)
+    return path
+
+
+def _write_json(path, data):
+    existed = os.path.exists(path)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    if existed:
+        _bump_mtime(path)
+    return path
+
+
+@pytest.fixture
+def library(tmp_path):
+    root = str(tmp_path)
+    _write_lora(os.path.join(root, "anime.safetensors"), {"ss_output_name": "anime"})
+    _write_json(os.path.join(root, "anime.metadata.json"), {"model_name": "Anime", "description": "x" * 100})
+    _write_lora(os.path.join(root, "chibi.safetensors"))
+    _write_lora(os.path.join(root, "sub", "photo.safetensors"))
+    return root
+
+
+def _read_entries(dir_path):
+    with open(os.path.join(dir_path, MANIFEST_NAME), encoding="utf-8") as f:
+        return json.load(f)["entries"]
+
+
+def test_build_records_sidecar_and_embedded_metadata(library):
+    assert build_manifest(library) == (2, 2, True)
+
+    entries = _read_entries(library)
+    assert sorted(entries) == ["anime.safetensors", "chibi.safetensors"]
+    # サイドカーはノードが使うキーだけ
+    assert entries["anime.safetensors"]["metadata"] == {"model_name": "Anime"}
+    assert entries["anime.safetensors"]["embedded"] == {"ss_output_name": "anime"}
+    assert entries["chibi.safetensors"]["metadata"] is None
+    assert entries["chibi.safetensors"]["embedded"] is None
+
+
+def test_rebuild_reuses_fresh_entries(library):
+    build_manifest(library)
+    assert build_manifest(library) == (2, 0, False)
+    assert check_manifest(library) == (2, 0, 0)
+
+    _write_json(os.path.join(library, "anime.metadata.json"), {"model_name": "Anime v2"})
+    assert check_manifest(library) == (2, 1, 0)
+    assert build_manifest(library) == (2, 1, True)
+    assert _read_entries(library)["anime.safetensors"]["metadata"] == {"model_name": "Anime v2"}
+    assert check_manifest(library) == (2, 0, 0)
+
+
+def test_check_counts_removed_loras(library):
+    build_manifest(library)
+    os.remove(os.path.join(library, "chibi.safetensors"))
+    assert check_manifest(library) == (1, 0, 1)
+
+
+def test_empty_folder_writes_nothing(tmp_path):
+    assert build_manifest(str(tmp_path)) == (0, 0, False)
+    assert not os.path.exists(os.path.join(str(tmp_path), MANIFEST_NAME))
+
+
+def test_cli_build_and_check(library, capsys):
+    assert main(["build", library, "--recursive", "--no-verify-previews"]) == 0
+    output = capsys.readouterr().out
+    assert f"{library}: 2 LoRAs, 2 rebuilt (written)" in output
+    assert f"{os.path.join(library, 'sub')}: 1 LoRAs, 1 rebuilt (written)" in output
+
+    assert main(["check", library, "--recursive"]) == 0
+    capsys.readouterr()
+
+    _write_lora(os.path.join(library, "sub", "new.safetensors"))
+    assert main(["check", library, "--recursive"]) == 1
+    assert f"{os.path.join(library, 'sub')}: 2 LoRAs, 1 stale, 0 removed" in capsys.readouterr().out
+
+    # --recursive なしはそのフォルダだけ
+    assert main(["check", library]) == 0
+
+
+def test_embedded_metadata_is_served_while_the_lora_is_unchanged(library):
+    build_manifest(library)
+    lora_path = os.path.join(library, "anime.safetensors")
+    assert get_manifest_embedded(lora_path) == (True, {"ss_output_name": "anime"})
+    assert get_manifest_embedded(os.path.join(library, "chibi.safetensors")) == (True, None)
+
+    _bump_mtime(lora_path)
+    assert get_manifest_embedded(lora_path) == (False, None)
+
+
+def test_disabled_manifest_is_not_used(library, monkeypatch):
+    build_manifest(library)
+    monkeypatch.setenv("RANDOM_LORA_MANIFEST", "0")
+    assert get_manifest_embedded(os.path.join(library, "anime.safetensors")) == (False, None)
+
+
+def test_recheck_updates_the_cached_manifest_in_place(library, monkeypatch):
+    build_manifest(library)
+    entries = manifest.load_manifest(library)
+    cache = manifest._get_manifest_cache()
+    cached = cache.get(library)
+    used_bytes = cache.stats()["bytes"]
+
+    # 再確認の間隔を過ぎても、変わっていなければ同じ記録の時刻だけを更新する
+    monkeypatch.setattr(manifest, "MANIFEST_RECHECK_SECONDS", 0.0)
+    assert manifest.load_manifest(library) is entries
+    assert cache.get(library) is cached
+    assert cache.stats()["bytes"] == used_bytes
+
+
+@pytest.mark.parametrize("extra_bytes", [-1, 1000])
+def test_manifest_over_the_cache_budget_is_ignored_once(library, monkeypatch, capsys, extra_bytes):
+    for i in range(20):
+        _write_lora(os.path.join(library, f"extra_{i}.safetensors"))
+    build_manifest(library)
+    # -1: ファイルの時点で上限を超える / 1000: 読み込んだ辞書が上限を超える
+    size = os.path.getsize(os.path.join(library, MANIFEST_NAME))
+    monkeypatch.setattr(manifest, "_manifest_cache", manifest.BoundedCache(size + extra_bytes))
+    monkeypatch.setattr(manifest, "MANIFEST_RECHECK_SECONDS", 0.0)
+    capsys.readouterr()
+
+    assert manifest.load_manifest(library) is None
+    assert "exceeds the manifest cache" in capsys.readouterr().out
+    # マニフェストが変わるまで読み直さず、警告も繰り返さない
+    assert manifest.load_manifest(library) is None
+    assert capsys.readouterr().out == ""
@@ -0,0 +1,61 @@
+"""ファイルごとの処理の並列実行（lora_library.parallel）"""
+
+import threading
+import time
+
+import pytest
+
+from lora_library.parallel import TIMED_OUT, get_metadata_timeout, map_ordered
+
+
+def test_results_follow_input_order():
+    def slow_for_small(value):
+        # 先の要素ほど遅く終わるようにする
+        time.sleep(0.002 * (10 - value))
+        return value * 2
+
+    assert list(map_ordered(slow_for_small, range(10), max_workers=4)) == [i * 2 for i in range(10)]
+
+
+def test_single_worker_runs_on_the_calling_thread():
+    threads = list(map_ordered(lambda _: threading.current_thread(), range(3), max_workers=1))
+    assert threads == [threading.current_thread()] * 3
+
+
+def test_empty_input():
+    assert list(map_ordered(lambda value: value, [], max_workers=4)) == []
+
+
+def test_exceptions_are_raised_in_input_order():
+    def fail_on_three(value):
+        if value == 3:
+            raise ValueError("three")
+        return value
+
+    results = map_ordered(fail_on_three, range(6), max_workers=3)
+    assert [next(results) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(ValueError, match="three"):
+        next(results)
+
+
+def test_stalled_item_times_out_without_blocking_the_rest():
+    release = threading.Event()
+
+    def stall_on_one(value):
+        if value == 1:
+            release.wait(5)
+        return value
+
+    try:
+        started = time.monotonic()
+        results = list(map_ordered(stall_on_one, range(4), max_workers=2, timeout=0.2))
+        assert results == [0, TIMED_OUT, 2, 3]
+        assert time.monotonic() - started < 2
+    finally:
+        release.set()
+
+
+@pytest.mark.parametrize("value, expected", [("12.5", 12.5), ("0", 0.0), ("soon", 30.0)])
+def test_metadata_timeout_setting(monkeypatch, value, expected):
+    monkeypatch.setenv("RANDOM_LORA_METADATA_TIMEOUT", value)
+    assert get_metadata_timeout() == expected
@@ -0,0 +1,87 @@
+"""読み込みに失敗したファイルの記録（lora_library.quarantine）"""
+
+import os
+
+import pytest
+
+from lora_library import quarantine as quarantine_module
+from lora_library.index import LibraryIndex
+from lora_library.quarantine import Quarantine, QuarantinedFileError, load_json_sidecar
+
+
+@pytest.fixture
+def index():
+    index = LibraryIndex(":memory:")
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def quarantine(index, monkeypatch):
+    quarantine = Quarantine(index)
+    monkeypatch.setattr(quarantine_module, "_quarantine", quarantine)
+    return quarantine
+
+
+def _write(path, text):
+    existed = os.path.exists(path)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    if existed:
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+    return path
+
+
+def test_recorded_file_is_skipped_until_modified(tmp_path, quarantine):
+    path = _write(str(tmp_path / "broken.info"), "{")
+    quarantine.add(path, "info", os.stat(path), ValueError("bad json"))
+
+    with pytest.raises(QuarantinedFileError) as excinfo:
+        quarantine.check(path, "info", os.stat(path))
+    assert (excinfo.value.path, excinfo.value.kind) == (path, "info")
+    assert "ValueError: bad json" in excinfo.value.error
+
+    _write(path, "{}")
+    quarantine.check(path, "info", os.stat(path))
+    assert len(quarantine) == 0
+
+
+def test_records_survive_a_restart(tmp_path, index, quarantine):
+    path = _write(str(tmp_path / "broken.metadata.json"), "[")
+    quarantine.add(path, "metadata_json", os.stat(path), ValueError("bad json"))
+
+    restarted = Quarantine(index)
+    with pytest.raises(QuarantinedFileError):
+        restarted.check(path, "metadata_json", os.stat(path))
+    assert restarted.report() == [(path, "metadata_json", "ValueError: bad json")]
+
+
+def test_format_report_limits_the_listing(tmp_path, quarantine):
+    assert quarantine.format_report() == ""
+    for i in range(3):
+        path = _write(str(tmp_path / f"broken{i}.info"), "{")
+        quarantine.add(path, "info", os.stat(path), ValueError("bad"))
+    report = quarantine.format_report(limit=2).splitlines()
+    assert report[0] == "Quarantined files (unreadable, skipped until modified): 3"
+    assert len(report) == 4
+    assert report[-1] == "  ... and 1 more"
+
+
+def test_load_json_sidecar_quarantines_invalid_json(tmp_path, quarantine):
+    path = _write(str(tmp_path / "lora.info"), '{"model_name": ')
+    with pytest.raises(ValueError):
+        load_json_sidecar(path, "info")
+    # 2回目は読まずに隔離済みとして扱う
+    with pytest.raises(QuarantinedFileError):
+        load_json_sidecar(path, "info")
+
+    _write(path, '{"model_name": "fixed"}')
+    assert load_json_sidecar(path, "info") == {"model_name": "fixed"}
+    assert len(quarantine) == 0
+
+
+def test_missing_file_is_not_quarantined(tmp_path, quarantine):
+    with pytest.raises(OSError):
+        load_json_sidecar(str(tmp_path / "missing.info"), "info")
+    assert len(quarantine) == 0
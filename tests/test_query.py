@@ -0,0 +1,135 @@
+"""keyword_filter のクエリ言語（lora_library.query）"""
+
+import os
+
+import pytest
+
+from lora_library.keyword_index import KeywordIndex, filename_search_text
+from lora_library.query import QuerySyntaxError, compile_query, field_sources, is_query
+
+
+LORA_NAMES = [
+    "anime_(v2)",
+    "anime_style",
+    "anime_v2",
+    "realistic_(v2)",
+    "realistic_v3",
+    "chibi",
+]
+
+
+@pytest.fixture
+def lora_paths(tmp_path):
+    return [os.path.join(str(tmp_path), name + ".safetensors") for name in LORA_NAMES]
+
+
+def _names(paths):
+    return [os.path.splitext(os.path.basename(path))[0] for path in paths]
+
+
+def _evaluate(keyword_filter, lora_paths, filter_mode="OR"):
+    query = compile_query(keyword_filter, filter_mode)
+    return _names(query.evaluate(lora_paths, field_sources(query.fields, lora_paths)))
+
+
+@pytest.mark.parametrize("keyword_filter", [
+    "anime_(v2)",
+    "(v2)",
+    "anime (v2)",
+    "(anime style)",
+    '"anime_(v2)" chibi',
+    "and or not",
+])
+def test_plain_input_is_not_a_query(keyword_filter):
+    # 括弧だけ・小文字の演算子は従来どおり _parse_keywords で処理する
+    assert not is_query(keyword_filter)
+    assert compile_query(keyword_filter) is None
+
+
+@pytest.mark.parametrize("keyword_filter", [
+    "anime NOT chibi",
+    "a AND b",
+    "a OR b",
+    "tag:anime",
+    "(name:anime)",
+    "NOT (a OR b)",
+])
+def test_operators_and_fields_make_a_query(keyword_filter):
+    assert is_query(keyword_filter)
+
+
+def test_parentheses_inside_a_word_are_part_of_the_keyword(lora_paths):
+    assert _evaluate("anime_(v2) OR chibi", lora_paths) == ["anime_(v2)", "chibi"]
+    assert _evaluate("NOT realistic_(v2)", lora_paths) == [
+        "anime_(v2)", "anime_style", "anime_v2", "realistic_v3", "chibi",
+    ]
+
+
+def test_plain_parenthesised_keyword_matches_literally(lora_paths):
+    # クエリにならない入力はキーワードの括弧も含めて部分一致する
+    texts = [filename_search_text(path) for path in lora_paths]
+    assert _names(KeywordIndex().filter(lora_paths, texts, ["(v2)"])) == ["anime_(v2)", "realistic_(v2)"]
+
+
+def test_grouping_parentheses_at_word_boundaries(lora_paths):
+    assert _evaluate("(anime_(v2)) OR chibi", lora_paths) == ["anime_(v2)", "chibi"]
+    assert _evaluate("(v2) AND NOT realistic", lora_paths) == ["anime_(v2)", "anime_v2"]
+    assert _evaluate("anime AND NOT (style OR anime_(v2))", lora_paths) == ["anime_v2"]
+    assert _evaluate("NOT ( anime OR realistic )", lora_paths) == ["chibi"]
+
+
+def test_implicit_join_follows_filter_mode(lora_paths):
+    assert _evaluate("NOT chibi anime v2", lora_paths, "AND") == ["anime_(v2)", "anime_v2"]
+    assert _evaluate("chibi style NOT realistic", lora_paths, "OR") == [
+        "anime_(v2)", "anime_style", "anime_v2", "chibi",
+    ]
+
+
+@pytest.mark.parametrize("keyword_filter", [
+    "(anime OR chibi",
+    "anime OR chibi)",
+    "anime AND",
+    "NOT",
+    "tag:) OR anime",
+])
+def test_syntax_errors(keyword_filter):
+    with pytest.raises(QuerySyntaxError):
+        compile_query(keyword_filter, "OR")
+
+
+def test_folder_field_is_relative_to_the_folder_path(tmp_path):
+    root = str(tmp_path)
+    paths = [
+        os.path.join(root, "top.safetensors"),
+        os.path.join(root, "Style", "anime.safetensors"),
+        os.path.join(root, "style", "old", "photo.safetensors"),
+        os.path.join(root, "character", "chibi.safetensors"),
+    ]
+    query = compile_query("folder:style", "OR")
+    sources = field_sources(query.fields, paths, root)
+    assert _names(query.evaluate(paths, sources)) == ["anime", "photo"]
+
+    query = compile_query("folder:style/old", "OR")
+    assert _names(query.evaluate(paths, field_sources(query.fields, paths, root))) == ["photo"]
+
+    # 基準フォルダの名前そのものには一致しない
+    query = compile_query(f"folder:{os.path.basename(root)}", "OR")
+    assert query.evaluate(paths, field_sources(query.fields, paths, root)) == []
+
+
+def test_folder_field_shares_one_index_across_folder_paths(tmp_path):
+    root = str(tmp_path)
+    paths = [
+        os.path.join(root, "style", "anime.safetensors"),
+        os.path.join(root, "style", "old", "photo.safetensors"),
+    ]
+    query = compile_query("folder:old", "OR")
+    sources = field_sources(query.fields, paths, root)
+    assert _names(query.evaluate(paths, sources)) == ["photo"]
+
+    # 基準フォルダを変えても同じインデックスで、変わった文書だけを索引し直す
+    nested = field_sources(query.fields, paths, os.path.join(root, "style", "old"))
+    assert nested["folder"][0] == sources["folder"][0]
+    assert nested["folder"][1] == ["..", ""]
+    assert query.evaluate(paths, nested) == []
+    assert _names(query.evaluate(paths, field_sources(query.fields, paths, root))) == ["photo"]
@@ -0,0 +1,75 @@
+"""メタデータレコード（lora_library.records）"""
+
+import pytest
+
+from lora_library.records import build_metadata_record, get_metadata_record, get_record_cache
+
+
+METADATA = {
+    "model_name": "Anime Style",
+    "tags": ["Anime", "style"],
+    "civitai": {
+        "name": "v1.0",
+        "trainedWords": ["anime style, 1girl", "1girl, chibi"],
+        "model": {"name": "Anime Style", "tags": ["anime"]},
+        "images": [
+            {"meta": {"prompt": "1girl, anime style", "negativePrompt": "lowres"}},
+            {"meta": {"prompt": "chibi", "negativePrompt": None}},
+            {"meta": {}},
+            {"meta": None},
+            {"url": "https://example.com/no_meta.png"},
+        ],
+    },
+}
+
+
+def test_keywords_are_deduplicated_then_lowercased():
+    record = build_metadata_record(METADATA)
+    # 重複除去は元の文字列で行う（model.name は model_name と同じなので1回だけ）
+    assert record.keywords == "anime style v1.0 anime style 1girl chibi anime anime style"
+    assert record.trained_word_list == ("anime style", "1girl", "chibi")
+    assert record.trained_words == ("anime style, 1girl", "1girl, chibi")
+
+
+def test_names_and_tags_for_field_queries():
+    record = build_metadata_record(METADATA)
+    assert record.names == ("Anime Style", "v1.0")
+    assert record.tags == ("anime", "Anime", "style")
+
+
+def test_sample_prompts_keep_only_images_with_meta():
+    record = build_metadata_record(METADATA)
+    assert record.sample_prompts == (("1girl, anime style", "lowres"), ("chibi", ""))
+    assert record.has_images
+
+    # Random LoRA Loader は空の meta も作例に含める
+    assert len(build_metadata_record(METADATA, keep_empty_meta=True).sample_prompts) == 3
+
+
+def test_has_images_is_independent_of_meta():
+    record = build_metadata_record({"civitai": {"images": [{"url": "x"}]}})
+    assert record.sample_prompts == ()
+    assert record.has_images
+    assert not build_metadata_record({"model_name": "plain"}).has_images
+
+
+@pytest.mark.parametrize("metadata", [None, {}])
+def test_no_metadata_means_no_record(metadata):
+    assert build_metadata_record(metadata) is None
+
+
+def test_records_are_cached_until_the_signature_changes():
+    get_record_cache().clear()
+    loads = []
+
+    def load(path):
+        loads.append(path)
+        return METADATA
+
+    first = get_metadata_record("/loras/a.safetensors", load, "test", signature="s1")
+    assert get_metadata_record("/loras/a.safetensors", load, "test", signature="s1") is first
+    assert len(loads) == 1
+
+    get_metadata_record("/loras/a.safetensors", load, "test", signature="s2")
+    get_metadata_record("/loras/a.safetensors", load, "other", signature="s2")
+    assert len(loads) == 3
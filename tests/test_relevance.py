@@ -0,0 +1,128 @@
+"""キーワードの関連度によるランキング（lora_library.relevance）"""
+
+import os
+
+import pytest
+
+from lora_library import relevance
+from lora_library.query import compile_query, field_sources
+from lora_library.relevance import RelevanceIndex, query_terms, tokenize
+
+
+pytestmark = pytest.mark.skipif(not relevance.is_relevance_available(), reason="NumPy is not installed")
+
+
+def _paths(ranked):
+    return [path for path, _ in ranked]
+
+
+def test_tokenize_splits_words_and_cjk_bigrams():
+    assert tokenize("Anime_Style_v2") == ["anime", "style", "v2"]
+    assert tokenize("キャラ_red") == ["キャ", "ャラ", "red"]
+
+
+def test_query_terms_skip_negated_and_folder_terms():
+    assert query_terms("anime NOT realistic") == {"anime": 1}
+    assert query_terms("tag:anime NOT (realistic OR folder:old) folder:new") == {"anime": 1}
+    assert query_terms("NOT NOT chibi") == {"chibi": 1}
+    # クエリでない入力・構文エラーは全体を語に分ける
+    assert query_terms("anime_(v2) style") == {"anime": 1, "v2": 1, "style": 1}
+    assert query_terms("anime AND") == {"anime": 1, "and": 1}
+
+
+def test_rank_orders_by_score():
+    index = RelevanceIndex()
+    paths = ["a", "b", "c", "d"]
+    texts = ["anime", "anime anime style", "photo realistic", "anime style portrait background"]
+    ranked = index.rank(paths, texts, "anime style")
+    assert _paths(ranked) == ["b", "d", "a"]
+    scores = [score for _, score in ranked]
+    assert scores == sorted(scores, reverse=True)
+    assert all(score > 0 for score in scores)
+
+
+def test_rank_excludes_zero_scores_and_unknown_terms():
+    index = RelevanceIndex()
+    assert index.rank(["a", "b"], ["anime", "photo"], "unknownword") == []
+    assert _paths(index.rank(["a", "b"], ["anime", "photo"], "photo")) == ["b"]
+
+
+def test_top_k_keeps_ties_in_input_order():
+    index = RelevanceIndex()
+    paths = ["a", "b", "c", "d", "e"]
+    texts = ["anime", "other", "anime", "anime", "anime style"]
+    assert _paths(index.rank(paths, texts, "anime", top_k=2)) == ["a", "c"]
+    assert _paths(index.rank(list(reversed(paths)), list(reversed(texts)), "anime", top_k=2)) == ["d", "c"]
+    assert _paths(index.rank(paths, texts, "anime", top_k=10)) == ["a", "c", "d", "e"]
+    assert index.rank(paths, texts, "anime", top_k=0) == []
+
+
+def test_negated_terms_do_not_add_to_the_score():
+    index = RelevanceIndex()
+    paths, texts = ["a", "b", "c"], ["anime", "anime realistic", "photo realistic"]
+    ranked = _paths(index.rank(paths, texts, "anime NOT realistic"))
+    assert ranked == ["a", "b"]
+
+
+def test_query_filter_then_rank(tmp_path):
+    # ノードと同じ手順: クエリ（演算子なしの並びは AND）で絞り込み、残りだけを並べる
+    names = ["anime", "anime_realistic", "photo_realistic", "anime_style"]
+    paths = [os.path.join(str(tmp_path), name + ".safetensors") for name in names]
+    texts = [name.replace("_", " ") for name in names]
+    query = compile_query("anime NOT realistic", "AND")
+    survivors = query.evaluate(paths, field_sources(query.fields, paths))
+    survivor_texts = [texts[paths.index(path)] for path in survivors]
+    ranked = RelevanceIndex().rank(survivors, survivor_texts, "anime NOT realistic")
+    assert [os.path.basename(path) for path, _ in ranked] == ["anime.safetensors", "anime_style.safetensors"]
+
+
+def test_changed_documents_are_reindexed():
+    index = RelevanceIndex()
+    assert _paths(index.rank(["a", "b"], ["anime", "photo"], "anime")) == ["a"]
+    assert _paths(index.rank(["a", "b"], ["photo", "anime"], "anime")) == ["b"]
+    assert len(index) == 2
+
+
+def test_compaction_keeps_results(monkeypatch):
+    monkeypatch.setattr(relevance, "COMPACT_MIN_DEAD", 4)
+    index = RelevanceIndex()
+    paths = ["a", "b", "c"]
+    for i in range(10):
+        texts = [f"anime v{i}", f"style v{i}", "photo"]
+        assert _paths(index.rank(paths, texts, f"anime v{i}")) == ["a", "b"]
+    # 無効な文書は有効な文書数を超えない
+    assert index._dead <= len(index)
+    assert len(index._docs) <= 2 * len(index) + 2
+
+
+def test_callable_texts_are_only_called_for_new_paths():
+    calls = []
+
+    def text_for(path):
+        calls.append(path)
+        return path.replace("_", " ")
+
+    index = RelevanceIndex()
+    index.rank(["anime_a", "photo_b"], text_for, "anime")
+    index.rank(["anime_a", "photo_b", "anime_c"], text_for, "anime")
+    assert calls == ["anime_a", "photo_b", "anime_c"]
+
+
+def test_deleted_files_are_pruned(tmp_path, monkeypatch):
+    monkeypatch.setattr(relevance, "PRUNE_MIN_DOCS", 4)
+    paths = []
+    for i in range(12):
+        path = tmp_path / f"anime_{i}.safetensors"
+        path.write_bytes(b"")
+        paths.append(str(path))
+    texts = [os.path.basename(path) for path in paths]
+
+    index = RelevanceIndex()
+    assert len(index.rank(paths[:5], texts[:5], "anime")) == 5
+    for path in paths[:4]:
+        os.remove(path)
+    # 文書数が前回の確認時の2倍になったら、今回の対象以外で消えたパスを取り除く
+    # （paths[4] は今回の対象外だが存在するので残る）
+    index.rank(paths[5:], texts[5:], "anime")
+    assert len(index) == 8
+    assert _paths(index.rank(paths[4:], texts[4:], "anime 4"))[0] == paths[4]
@@ -0,0 +1,98 @@
+"""safetensors のヘッダーの読み込み（lora_library.safetensors_header）"""
+
+import json
+import struct
+
+import pytest
+
+from lora_library.safetensors_header import (
+    SafetensorsHeaderError,
+    TagFrequencySummary,
+    read_safetensors_header,
+    read_safetensors_metadata,
+    reduce_embedded_metadata,
+)
+
+
+def _write(tmp_path, header, data=b"", name="lora.safetensors", header_size=None):
+    raw = header if isinstance(header, bytes) else json.dumps(header).encode("utf-8")
+    path = tmp_path / name
+    path.write_bytes(struct.pack("<Q", len(raw) if header_size is None else header_size) + raw + data)
+    return str(path)
+
+
+def test_reads_metadata_and_tensor_info(tmp_path):
+    header = {
+        "__metadata__": {"ss_output_name": "anime"},
+        "a": {"dtype": "F16", "shape": [2, 2], "data_offsets": [0, 8]},
+        "b": {"dtype": "F32", "shape": [1], "data_offsets": [8, 12]},
+    }
+    path = _write(tmp_path, header, b"\0" * 12)
+    assert read_safetensors_header(path) == header
+    assert read_safetensors_metadata(path) == {"ss_output_name": "anime"}
+
+
+def test_missing_metadata_is_none(tmp_path):
+    assert read_safetensors_metadata(_write(tmp_path, {})) is None
+
+
+def test_unknown_dtype_only_checks_offsets(tmp_path):
+    header = {"a": {"dtype": "F128_NEW", "shape": [3], "data_offsets": [0, 5]}}
+    assert read_safetensors_header(_write(tmp_path, header, b"\0" * 5))["a"]["dtype"] == "F128_NEW"
+
+
+@pytest.mark.parametrize("header, data", [
+    ({"__metadata__": {"epochs": 10}}, b""),
+    ({"a": {"dtype": "F16", "shape": [2], "data_offsets": [0, 8]}}, b"\0" * 8),
+    ({"a": {"dtype": "F16", "shape": [2], "data_offsets": [4, 8]}}, b"\0" * 8),
+    ({"a": {"dtype": "F16", "shape": [2], "data_offsets": [0, 4]}}, b"\0" * 8),
+    ({"a": {"dtype": "F16", "shape": [-2], "data_offsets": [0, 4]}}, b"\0" * 4),
+    ({"a": {"shape": [2], "data_offsets": [0, 4]}}, b"\0" * 4),
+    (b"[1, 2]", b""),
+    (b"{not json", b""),
+    (b"\xff\xfe", b""),
+])
+def test_invalid_headers_are_rejected(tmp_path, header, data):
+    with pytest.raises(SafetensorsHeaderError):
+        read_safetensors_header(_write(tmp_path, header, data))
+
+
+def test_truncated_and_oversized_headers_are_rejected(tmp_path):
+    (tmp_path / "tiny.safetensors").write_bytes(b"\1\0")
+    with pytest.raises(SafetensorsHeaderError, match="too small"):
+        read_safetensors_header(str(tmp_path / "tiny.safetensors"))
+    with pytest.raises(SafetensorsHeaderError, match="invalid header length"):
+        read_safetensors_header(_write(tmp_path, {}, header_size=1000))
+    with pytest.raises(SafetensorsHeaderError, match="too large"):
+        read_safetensors_header(_write(tmp_path, {}, header_size=1 << 40))
+
+
+def test_reduce_keeps_node_keys_and_summarises_tags():
+    tag_frequency = {"set_a": {"1girl": 3, "anime": 9, "solo": 1}, "set_b": {"chibi": 2}}
+    embedded = reduce_embedded_metadata({
+        "ss_output_name": "anime",
+        "ss_tag_frequency": json.dumps(tag_frequency),
+        "ss_network_dim": "32",
+    })
+    assert set(embedded) == {"ss_output_name", "ss_tag_frequency"}
+    summary = embedded["ss_tag_frequency"]
+    assert summary.dataset_first_tags() == [["1girl", "anime", "solo"], ["chibi"]]
+    assert summary.dataset_top_tags() == [["anime", "1girl", "solo"], ["chibi"]]
+    assert reduce_embedded_metadata(None) is None
+
+
+def test_tag_summary_limit_and_round_trip():
+    summary = TagFrequencySummary(json.dumps({"set": {f"tag{i}": i for i in range(30)}}), limit=5)
+    assert summary.dataset_first_tags() == [[f"tag{i}" for i in range(5)]]
+    assert summary.dataset_top_tags() == [[f"tag{i}" for i in range(29, 24, -1)]]
+    restored = TagFrequencySummary.from_tags(**summary.to_dict())
+    assert restored.dataset_top_tags() == summary.dataset_top_tags()
+    assert restored.truthy
+
+
+def test_tag_summary_raises_the_parse_error_on_access():
+    summary = TagFrequencySummary("{broken")
+    assert not summary.truthy
+    assert summary.to_dict() is None
+    with pytest.raises(json.JSONDecodeError):
+        summary.dataset_top_tags()
@@ -0,0 +1,71 @@
+"""ランダム選択（lora_library.sampling）"""
+
+import random
+from collections import Counter
+
+import pytest
+
+from lora_library.sampling import reservoir_sample, weighted_sample
+
+
+def test_reservoir_sample_returns_everything_when_short():
+    selected, count = reservoir_sample(iter(range(3)), 5, random.Random(0))
+    assert sorted(selected) == [0, 1, 2]
+    assert count == 3
+
+
+@pytest.mark.parametrize("k", [0, -1])
+def test_reservoir_sample_non_positive_k_still_counts(k):
+    assert reservoir_sample(iter(range(7)), k, random.Random(0)) == ([], 7)
+
+
+def test_reservoir_sample_picks_k_distinct_items_once():
+    # ジェネレータは1回しか走査できない
+    selected, count = reservoir_sample((i for i in range(1000)), 10, random.Random(1))
+    assert count == 1000
+    assert len(selected) == 10
+    assert len(set(selected)) == 10
+    assert all(0 <= item < 1000 for item in selected)
+
+
+def test_reservoir_sample_is_reproducible_with_the_same_seed():
+    first = reservoir_sample(range(500), 8, random.Random(42))
+    second = reservoir_sample(range(500), 8, random.Random(42))
+    assert first == second
+
+
+def test_reservoir_sample_is_roughly_uniform():
+    rng = random.Random(3)
+    counts = Counter()
+    trials = 4000
+    for _ in range(trials):
+        selected, _ = reservoir_sample(range(20), 5, rng)
+        counts.update(selected)
+    # 各要素の期待値は trials * 5 / 20 = 1000
+    assert set(counts) == set(range(20))
+    assert all(800 < counts[item] < 1200 for item in range(20))
+
+
+def test_weighted_sample_skips_non_positive_weights():
+    items = ["a", "b", "c", "d"]
+    selected = weighted_sample(items, [1.0, 0.0, -2.0, 3.0], 4, random.Random(0))
+    assert sorted(selected) == ["a", "d"]
+
+
+def test_weighted_sample_non_positive_k():
+    assert weighted_sample(["a", "b"], [1.0, 1.0], 0, random.Random(0)) == []
+    assert weighted_sample(["a", "b"], [1.0, 1.0], -3, random.Random(0)) == []
+
+
+def test_weighted_sample_is_reproducible_with_the_same_seed():
+    items = list(range(50))
+    weights = [i % 7 + 0.5 for i in items]
+    assert (weighted_sample(items, weights, 5, random.Random(9))
+            == weighted_sample(items, weights, 5, random.Random(9)))
+
+
+def test_weighted_sample_follows_weights():
+    rng = random.Random(5)
+    counts = Counter(weighted_sample(["light", "heavy"], [1.0, 9.0], 1, rng)[0] for _ in range(4000))
+    # heavy の期待値は 90%
+    assert 0.86 < counts["heavy"] / 4000 < 0.94
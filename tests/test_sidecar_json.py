@@ -0,0 +1,109 @@
+"""サイドカーJSONの部分解析（lora_library.sidecar_json）"""
+
+import json
+
+import pytest
+
+from lora_library.sidecar_json import extract_fields, load_metadata_json
+
+
+METADATA = {
+    "model_name": "Anime Style",
+    "description": "<p>" + "long text " * 50 + "</p>",
+    "tags": ["anime", "style"],
+    "civitai": {
+        "id": 12345,
+        "name": "v1.0",
+        "trainedWords": ["anime style, 1girl", "chibi"],
+        "model": {"name": "Anime Style", "tags": ["anime"], "nsfw": False},
+        "files": [{"name": "anime_style.safetensors", "sizeKB": 1.5e5}],
+        "images": [
+            {"url": "https://example.com/1.png", "meta": {
+                "prompt": "1girl, anime style", "negativePrompt": "lowres", "seed": 1234567890, "cfgScale": 7.5,
+            }},
+            {"url": "https://example.com/2.png", "meta": None},
+            {"url": "https://example.com/3.png", "meta": {}},
+            {"url": "https://example.com/4.png"},
+        ],
+    },
+}
+
+EXPECTED = {
+    "model_name": "Anime Style",
+    "tags": ["anime", "style"],
+    "civitai": {
+        "name": "v1.0",
+        "trainedWords": ["anime style, 1girl", "chibi"],
+        "model": {"name": "Anime Style", "tags": ["anime"]},
+        "images": [
+            # meta の他のキーは空かどうかの判定を変えないよう None で残す
+            {"meta": {"prompt": "1girl, anime style", "negativePrompt": "lowres", "seed": None, "cfgScale": None}},
+            {"meta": None},
+            {"meta": {}},
+            {},
+        ],
+    },
+}
+
+
+def test_extract_fields_keeps_only_the_node_keys():
+    assert extract_fields(json.dumps(METADATA)) == EXPECTED
+    assert extract_fields(json.dumps(METADATA, indent=2, ensure_ascii=False)) == EXPECTED
+
+
+def test_extract_fields_handles_unexpected_types():
+    text = json.dumps({"civitai": None, "tags": {"a": 1}, "model_name": 3})
+    assert extract_fields(text) == {"civitai": None, "tags": {"a": 1}, "model_name": 3}
+    assert extract_fields('{"civitai": {"images": null}}') == {"civitai": {"images": None}}
+    assert extract_fields(" {} ") == {}
+
+
+@pytest.mark.parametrize("text", ["[1, 2]", "  42 ", '"text"', "null"])
+def test_extract_fields_non_object_matches_json_loads(text):
+    assert extract_fields(text) == json.loads(text)
+
+
+@pytest.mark.parametrize("text", [
+    '{"tags": ["a"], }',
+    '{"tags" ["a"]}',
+    '{"description": "unterminated}',
+    '{"skipped": [1, 2}',
+    '{"tags": []} extra',
+    '{tags: []}',
+])
+def test_extract_fields_rejects_invalid_json(text):
+    with pytest.raises(ValueError):
+        extract_fields(text)
+
+
+def _write(tmp_path, data, name="lora.info"):
+    path = tmp_path / name
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_small_files_are_parsed_fully(tmp_path, monkeypatch):
+    monkeypatch.setenv("RANDOM_LORA_JSON_STREAM_KB", "1024")
+    assert load_metadata_json(_write(tmp_path, METADATA)) == METADATA
+
+
+def test_zero_threshold_always_parses_fully(tmp_path, monkeypatch):
+    monkeypatch.setenv("RANDOM_LORA_JSON_STREAM_KB", "0")
+    assert load_metadata_json(_write(tmp_path, METADATA)) == METADATA
+
+
+@pytest.mark.parametrize("chunk_kb", ["0.001", "0.005", "0.1"])
+def test_large_files_are_read_in_chunks(tmp_path, monkeypatch, chunk_kb):
+    # 1〜100バイト単位で読み足しても、値（数値・複数バイト文字を含む）が途中で切れない
+    monkeypatch.setenv("RANDOM_LORA_JSON_STREAM_KB", chunk_kb)
+    data = dict(METADATA, model_name="アニメ調 1.5e-3")
+    expected = dict(EXPECTED, model_name="アニメ調 1.5e-3")
+    assert load_metadata_json(_write(tmp_path, data)) == expected
+
+
+def test_large_invalid_file_raises(tmp_path, monkeypatch):
+    monkeypatch.setenv("RANDOM_LORA_JSON_STREAM_KB", "0.01")
+    path = tmp_path / "broken.info"
+    path.write_text(json.dumps(METADATA)[:-5], encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_metadata_json(str(path))